@@ -0,0 +1,112 @@
+# Adaptive (sequential) evaluation: samples are drawn in rounds, stratified by task, and a model
+# stops being queried once its task-weighted accuracy interval is narrow enough or its rank is
+# settled (its interval no longer overlaps any other model's)
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from eval_stats import stratified_interval
+
+
+class StratifiedSampler:
+    """Per-task queues in a fixed pseudo-random order (by sample_id and seed, so reruns and resumed
+    runs draw the same samples), handed out in rounds proportional to each task's share"""
+
+    def __init__(self, samples: Iterable[Dict], seed: int = 0):
+        queues: Dict[str, List[Tuple[int, Dict]]] = {}
+        for sample in samples:
+            order = zlib.crc32(f"{seed}:{sample['sample_id']}".encode("utf-8"))
+            queues.setdefault(sample["task_id"], []).append((order, sample))
+        self.tasks = sorted(queues)
+        self.population = {task: len(queues[task]) for task in self.tasks}
+        self.queues = {task: [sample for _, sample in sorted(queues[task], key=lambda item: item[0])] for task in self.tasks}
+        self.drawn = dict.fromkeys(self.tasks, 0)
+
+    @property
+    def total(self) -> int:
+        return sum(self.population.values())
+
+    @property
+    def exhausted(self) -> bool:
+        return all(self.drawn[task] >= self.population[task] for task in self.tasks)
+
+    def weights(self) -> np.ndarray:
+        return np.array([self.population[task] for task in self.tasks], dtype=np.float64) / max(self.total, 1)
+
+    def _take(self, task: str, drawn: int, size: int, min_per_task: int) -> int:
+        share = max(1, round(size * self.population[task] / max(self.total, 1)))
+        return max(share, min_per_task - drawn)
+
+    def next_round(self, size: int, min_per_task: int = 0) -> List[Dict]:
+        """About size samples: first tops every task up to min_per_task, the rest in proportion to task shares"""
+        batch = []
+        for task in self.tasks:
+            start = self.drawn[task]
+            take = self._take(task, start, size, min_per_task)
+            batch.extend(self.queues[task][start:start + take])
+            self.drawn[task] = min(start + take, self.population[task])
+        return batch
+
+    def rounds_left(self, size: int, min_per_task: int = 0) -> int:
+        """How many more next_round() calls it takes to draw every sample"""
+        drawn = dict(self.drawn)
+        rounds = 0
+        while any(drawn[task] < self.population[task] for task in self.tasks):
+            rounds += 1
+            for task in self.tasks:
+                drawn[task] = min(drawn[task] + self._take(task, drawn[task], size, min_per_task), self.population[task])
+        return rounds
+
+
+class StoppingRule:
+    """Decides, after each round, which models have been evaluated enough
+
+    A model stops when every task has at least min_per_task results (or all of its samples) and
+    either its interval is at most ci_width wide or, with settle_ranking, the interval is disjoint
+    from every other model's (so more samples would not change its place in the ranking).
+
+    The intervals are checked after every round, so each one is widened for the repeated looks
+    (Bonferroni over the planned rounds, set with plan_looks()): every model's interval then holds at
+    the nominal confidence at all rounds at once, including the round where the model stops.
+    Coverage is per model; the ranking check compares intervals that each hold at that level.
+    """
+
+    def __init__(self, ci_width: float = 0.05, confidence: float = 0.95, min_per_task: int = 20, settle_ranking: bool = True):
+        self.ci_width = ci_width
+        self.confidence = confidence
+        self.min_per_task = min_per_task
+        self.settle_ranking = settle_ranking
+        self.looks = 1
+
+    def plan_looks(self, looks: int):
+        self.looks = max(1, looks)
+
+    @property
+    def look_confidence(self) -> float:
+        """Confidence of the interval checked at each look: the error rate is split over the looks"""
+        return 1 - (1 - self.confidence) / self.looks
+
+    def intervals(self, models: List[str], tasks: List[str], counts: Dict[Tuple[str, str], List[int]], weights: np.ndarray) -> Dict[str, Dict]:
+        """counts: (model, task) -> [correct, total]; returns model -> {accuracy, ci_low, ci_high, samples}"""
+        successes = np.array([[counts.get((m, t), [0, 0])[0] for t in tasks] for m in models], dtype=np.float64).reshape(len(models), len(tasks))
+        totals = np.array([[counts.get((m, t), [0, 0])[1] for t in tasks] for m in models], dtype=np.float64).reshape(len(models), len(tasks))
+        estimate, low, high = stratified_interval(successes, totals, weights, self.look_confidence)
+        return {
+            m: {"accuracy": float(estimate[i]), "ci_low": float(low[i]), "ci_high": float(high[i]),
+                "samples": int(totals[i].sum()), "per_task": dict(zip(tasks, totals[i].astype(int).tolist()))}
+            for i, m in enumerate(models)
+        }
+
+    def stop_reason(self, model: str, intervals: Dict[str, Dict], population: Dict[str, int]) -> Optional[str]:
+        state = intervals[model]
+        if any(state["per_task"][task] < min(self.min_per_task, population[task]) for task in population):
+            return None
+        if state["ci_high"] - state["ci_low"] <= self.ci_width:
+            return "ci_width"
+        if self.settle_ranking and len(intervals) > 1 and all(
+            state["ci_high"] < other["ci_low"] or state["ci_low"] > other["ci_high"]
+            for name, other in intervals.items() if name != model
+        ):
+            return "ranking_settled"
+        return None
@@ -0,0 +1,137 @@
+# Answer parsers for model outputs, versioned so that stored raw outputs can be re-scored with a
+# newer parser (see rescore.py). Rows record the parser_version that scored them.
+import json
+import re
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from json_parsing import JsonStreamScanner
+
+Answer = Union[int, bool, None]
+
+
+# Version 1: the original parser
+def parse_json_response_v1(response: str, task_id: str) -> Tuple[Answer, bool]:
+    """Parse JSON response and return (answer, success)"""
+    try:
+        # Try to extract JSON from response
+        json_match = re.search(r'\{[^}]*\}', response, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(0)
+            data = json.loads(json_str)
+        else:
+            # If no JSON found, treat the whole response as JSON
+            data = json.loads(response)
+        
+        if task_id == "T2":
+            answer = data.get("answer", "").lower()
+            if answer == "yes":
+                return True, True
+            elif answer == "no":
+                return False, True
+            else:
+                return None, False
+        else:
+            answer = data.get("answer")
+            if isinstance(answer, int) and 1 <= answer <= 10:  # Allow up to 10 options
+                return answer - 1, True  # Convert to 0-indexed
+            else:
+                return None, False
+                
+    except Exception as e:
+        # Fallback to text parsing if JSON parsing fails
+        try:
+            if task_id == "T2":
+                if "yes" in response.lower() and "no" not in response.lower():
+                    return True, True
+                elif "no" in response.lower() and "yes" not in response.lower():
+                    return False, True
+                else:
+                    return None, False
+            else:
+                match = re.search(r'\b(\d+)\b', response)
+                if match:
+                    num = int(match.group(1))
+                    if 1 <= num <= 10:
+                        return num - 1, True
+                    else:
+                        return None, False
+                else:
+                    return None, False
+        except Exception as fallback_e:
+            return None, False
+
+
+def _first_json_object(text: str) -> Optional[str]:
+    # Balanced braces (strings and escapes aware), so nested objects are kept whole
+    scanner = JsonStreamScanner()
+    scanner.feed(text)
+    return scanner.json_text()
+
+
+def _coerce_answer(value, task_id: str) -> Answer:
+    if task_id == "T2":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ("yes", "no"):
+            return value.strip().lower() == "yes"
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value.strip())
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 10:
+        return value - 1  # Convert to 0-indexed
+    return None
+
+
+# Version 2: nested JSON objects, numeric answers given as strings ("3"), JSON true/false for T2,
+# and T2 text answers: an explicit "answer: yes" or a leading yes/no; any other mention of yes/no
+# (e.g. "I cannot say yes or no") is not an answer
+def parse_json_response_v2(response: str, task_id: str) -> Tuple[Answer, bool]:
+    data = None
+    for text in (_first_json_object(response), response):
+        if text is None:
+            continue
+        try:
+            data = json.loads(text)
+            break
+        except (json.JSONDecodeError, TypeError):
+            continue
+    if isinstance(data, dict):
+        answer = _coerce_answer(data.get("answer"), task_id)
+        return answer, answer is not None
+
+    lowered = response.lower()
+    if task_id == "T2":
+        match = re.search(r"\banswer\b\W*(?:is\W+)?(yes|no)\b", lowered) or re.match(r"\W*(yes|no)\b", lowered)
+        word = match.group(1) if match else None
+        if word is None:
+            return None, False
+        return word == "yes", True
+    match = re.search(r"\b(\d+)\b", response)
+    if match and 1 <= int(match.group(1)) <= 10:
+        return int(match.group(1)) - 1, True
+    return None, False
+
+
+PARSERS: Dict[int, Callable[[str, str], Tuple[Answer, bool]]] = {
+    1: parse_json_response_v1,
+    2: parse_json_response_v2,
+}
+# Used for new evaluations
+PARSER_VERSION = 2
+
+
+def parse_json_response(response: str, task_id: str, version: int = PARSER_VERSION) -> Tuple[Answer, bool]:
+    """Parse JSON response and return (answer, success)"""
+    return PARSERS[version](response, task_id)
+
+
+def grade_answer(task_id: str, output: Optional[str], expected: str, version: int = PARSER_VERSION) -> Tuple[Answer, Optional[bool], bool]:
+    """(parsed answer, correct, parsed) of an output against the expected answer as stored (str(expected_answer))"""
+    if output is None:
+        return None, None, False
+    answer, parsed = parse_json_response(output, task_id, version)
+    if answer is None:
+        return None, None, False
+    return answer, str(answer) == expected, True
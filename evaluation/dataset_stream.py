@@ -0,0 +1,74 @@
+# Streaming JSONL dataset reader: .jsonl / .jsonl.gz / .jsonl.zst, filtered and sharded on the fly
+import gzip
+import io
+import json
+import zlib
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def parse_shard(spec: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'i/n' -> (i, n) with 0 <= i < n"""
+    if not spec:
+        return None
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like i/n, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard index must be in [0, {count}), got {spec!r}")
+    return index, count
+
+
+def in_shard(sample_id: str, shard: Optional[Tuple[int, int]]) -> bool:
+    # Stable across runs and machines (unlike hash()), and independent of file order
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(sample_id.encode("utf-8")) % count == index
+
+
+def _open_text(path: str) -> io.TextIOBase:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst datasets requires the zstandard package (pip install zstandard)")
+        raw = open(path, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_dataset(path: str, task_ids: Optional[Iterable[str]] = None, difficulties: Optional[Iterable[str]] = None, shard: Optional[Tuple[int, int]] = None) -> Iterator[Dict]:
+    """Yield samples one at a time, keeping only the given task ids / difficulty levels / shard"""
+    task_ids = set(task_ids) if task_ids else None
+    difficulties = set(difficulties) if difficulties else None
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            if task_ids is not None and sample.get("task_id") not in task_ids:
+                continue
+            if difficulties is not None and (sample.get("meta") or {}).get("difficulty_level") not in difficulties:
+                continue
+            if not in_shard(sample["sample_id"], shard):
+                continue
+            yield sample
+
+
+def iter_chunks(streams: Dict[str, Iterator[Dict]], chunk_size: Optional[int]) -> Iterator[Dict[str, List[Dict]]]:
+    """Read up to chunk_size samples from each stream at a time until all are exhausted (None = all at once)"""
+    streams = dict(streams)
+    while streams:
+        chunk = {}
+        for name, stream in list(streams.items()):
+            samples = list(islice(stream, chunk_size))
+            if samples:
+                chunk[name] = samples
+            if chunk_size is None or len(samples) < chunk_size:
+                del streams[name]
+        if chunk:
+            yield chunk
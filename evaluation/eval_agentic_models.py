@@ -3,52 +3,143 @@ import json
 import re
 import os
 import argparse
+import asyncio
 import yaml
 import csv
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice, zip_longest
 from openai import OpenAI
 from anthropic import Anthropic
-import google.generativeai as genai
-from typing import List, Dict, Optional, Tuple, Union
+from google import genai
+from google.genai import types as genai_types
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from groq import Groq
 
-openai_client = None
-anthropic_client = None
-gemini_client = None
-groq_client = None
+# generation/ 모듈 공유 (JSON 스트림 스캐너 등)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generation"))
+from json_parsing import read_until_json
+from deadlines import LLMTimeoutError, call_with_timeout, is_timeout_error
+from key_pool import KeyEntry, build_key_pool, print_key_usage
+from routing import FallbackRouter
+from eval_plan import EvalPlan, PlannedRequest, compile_plan
+from eval_batch import COLLECTED, DONE, FAILED, PENDING, AnthropicBatchBackend, BatchState, LocalBatchBackend, OpenAIBatchBackend
+from dataset_stream import in_shard, iter_chunks, iter_dataset, parse_shard
+from eval_packing import compare_arms, pack_plan, question_id, split_packed_output
+from eval_stats import STATS_COLUMNS, ResultArrays, print_stats_report
+from results_store import CSV_FIELDS, ParquetResultStore, load_results_store, results_store_path
+from answer_parsing import PARSER_VERSION, grade_answer, parse_json_response
+from adaptive import StoppingRule, StratifiedSampler
 
+# Key pools per provider (built in __main__ from the config)
+openai_pool = None
+anthropic_pool = None
+gemini_pool = None
+groq_pool = None
 
-# Load dataset
-def load_dataset(path: str) -> List[Dict]:
-    with open(path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+# True면 응답을 스트리밍으로 받고 첫 JSON 객체가 완성되는 즉시 종료
+stream_json = False
 
-# JSON format prompt templates
-def build_json_prompt(task_id: str, sample: Dict) -> str:
+# Per-request timeout in seconds (None = no limit); hung requests are abandoned and counted as timeouts
+request_timeout = None
+
+# Retries, circuit breakers and fallback chains (built in __main__ from the config)
+router = FallbackRouter()
+# model name -> [{"name": ..., "provider": ...}] tried in order once the model's retries are exhausted
+fallbacks = {}
+
+PROVIDERS = ("openai", "claude", "gemini", "groq")
+
+
+def _timeout_kwargs() -> Dict:
+    return {"timeout": request_timeout} if request_timeout else {}
+
+
+# evaluation_results_{final|raw}_json.csv, or the dataset's file name for other datasets;
+# each shard of a sharded run writes its own _shard{i}of{n} file
+def results_csv_path(dataset_path: str, shard: Optional[Tuple[int, int]] = None) -> str:
+    name = os.path.basename(dataset_path)
+    if "final" in name:
+        suffix = "final"
+    elif "raw" in name:
+        suffix = "raw"
+    else:
+        suffix = name.split(".")[0]
+    if shard:
+        suffix += f"_shard{shard[0]}of{shard[1]}"
+    return f"evaluation_results_{suffix}_json.csv"
+
+# JSON format prompt templates: per task, the instruction, the answer format and the closing line
+# (static blocks are built once and shared by unpacked and packed prompts)
+_PROMPT_PARTS = {
+    "T2": (
+        "You are evaluating whether a paragraph has logically coherent sentence order.",
+        '"yes" or "no"',
+        "Answer 'yes' if the sentences are in coherent order, 'no' if they are not.",
+    ),
+    "T3": (
+        "You need to identify which option is most anomalous or inconsistent for filling the blank.",
+        "<number between 1 and 5>",
+        "Choose the most anomalous option.",
+    ),
+    "T4": (
+        "You need to identify which connecting sentence is most anomalous or inconsistent.",
+        "<number between 1 and 5>",
+        "Choose the most anomalous connecting sentence.",
+    ),
+    # T1, T5, T6, T7
+    "context": (
+        "You need to identify which sentence is most anomalous or inconsistent with the others.",
+        "<number between 1 and N>",
+        "Choose the most anomalous sentence.",
+    ),
+}
+_JSON_TAILS = {
+    task: "".join((
+        "\n\n"
+        "Please provide your answer in the following JSON format:\n"
+        "{\n"
+        '  "answer": ', answer_format, "\n"
+        "}\n\n", closing,
+    ))
+    for task, (_, answer_format, closing) in _PROMPT_PARTS.items()
+}
+_PACKED_TAILS = {
+    task: "".join((
+        "\n\n"
+        "Please provide your answers in the following JSON format, one entry per question in order:\n"
+        "{\n"
+        '  "answers": [\n'
+        '    {"id": "Q1", "answer": ', answer_format, "},\n"
+        "    ...\n"
+        "  ]\n"
+        "}\n\n"
+        "Answer every question independently. ", closing,
+    ))
+    for task, (_, answer_format, closing) in _PROMPT_PARTS.items()
+}
+
+
+def _numbered(items: List[str]) -> str:
+    return "\n".join([f"{i+1}. {s}" for i, s in enumerate(items)])
+
+
+def _prompt_task(task_id: str) -> str:
+    return task_id if task_id in ("T2", "T3", "T4") else "context"
+
+
+# The question itself, without instructions
+def _question_text(task_id: str, sample: Dict) -> str:
     if task_id == "T2":
         context = sample.get("context")
-        prompt = (
-            "You are evaluating whether a paragraph has logically coherent sentence order.\n\n"
-            "Paragraph:\n" + " ".join(context) + "\n\n"
-            "Please provide your answer in the following JSON format:\n"
-            "{\n"
-            '  "answer": "yes" or "no"\n'
-            "}\n\n"
-            "Answer 'yes' if the sentences are in coherent order, 'no' if they are not."
-        )
+        return "".join(("Paragraph:\n", " ".join(context)))
     elif task_id == "T3":
         sentence = sample.get("sentence", "")
         choices = sample.get("choices", [])
-        numbered = "\n".join([f"{i+1}. {s}" for i, s in enumerate(choices)])
-        prompt = (
-            "You need to identify which option is most anomalous or inconsistent for filling the blank.\n\n"
-            f"Sentence: {sentence}\n\n"
-            "Options:\n" + numbered + "\n\n"
-            "Please provide your answer in the following JSON format:\n"
-            "{\n"
-            '  "answer": <number between 1 and 5>\n'
-            "}\n\n"
-            "Choose the most anomalous option."
-        )
+        return "".join(("Sentence: ", sentence, "\n\nOptions:\n", _numbered(choices)))
     elif task_id == "T4":
         paragraph_1 = sample.get("paragraph_1", [])
         paragraph_2 = sample.get("paragraph_2", [])
@@ -57,292 +148,689 @@ def build_json_prompt(task_id: str, sample: Dict) -> str:
         p1_text = " ".join(paragraph_1) if isinstance(paragraph_1, list) else paragraph_1
         p2_text = " ".join(paragraph_2) if isinstance(paragraph_2, list) else paragraph_2
         
-        numbered = "\n".join([f"{i+1}. {s}" for i, s in enumerate(bridges)])
-        prompt = (
-            "You need to identify which connecting sentence is most anomalous or inconsistent.\n\n"
-            f"Paragraph 1: {p1_text}\n\n"
-            f"Paragraph 2: {p2_text}\n\n"
-            "Connecting sentence options:\n" + numbered + "\n\n"
-            "Please provide your answer in the following JSON format:\n"
-            "{\n"
-            '  "answer": <number between 1 and 5>\n'
-            "}\n\n"
-            "Choose the most anomalous connecting sentence."
-        )
+        return "".join((
+            "Paragraph 1: ", p1_text,
+            "\n\nParagraph 2: ", p2_text,
+            "\n\nConnecting sentence options:\n", _numbered(bridges),
+        ))
     else:
         # T1, T5, T6, T7
         context = sample.get("context")
-        numbered = "\n".join([f"{i+1}. {s}" for i, s in enumerate(context)])
-        prompt = (
-            "You need to identify which sentence is most anomalous or inconsistent with the others.\n\n"
-            "Sentences:\n" + numbered + "\n\n"
-            "Please provide your answer in the following JSON format:\n"
-            "{\n"
-            '  "answer": <number between 1 and N>\n'
-            "}\n\n"
-            "Choose the most anomalous sentence."
-        )
-    
-    return prompt
+        return "".join(("Sentences:\n", _numbered(context)))
 
-# Parse JSON response
-def parse_json_response(response: str, task_id: str) -> Tuple[Union[int, bool, None], bool]:
-    """Parse JSON response and return (answer, success)"""
-    try:
-        # Try to extract JSON from response
-        json_match = re.search(r'\{[^}]*\}', response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            data = json.loads(json_str)
-        else:
-            # If no JSON found, treat the whole response as JSON
-            data = json.loads(response)
-        
-        if task_id == "T2":
-            answer = data.get("answer", "").lower()
-            if answer == "yes":
-                return True, True
-            elif answer == "no":
-                return False, True
-            else:
-                return None, False
-        else:
-            answer = data.get("answer")
-            if isinstance(answer, int) and 1 <= answer <= 10:  # Allow up to 10 options
-                return answer - 1, True  # Convert to 0-indexed
-            else:
-                return None, False
-                
-    except Exception as e:
-        # Fallback to text parsing if JSON parsing fails
-        try:
-            if task_id == "T2":
-                if "yes" in response.lower() and "no" not in response.lower():
-                    return True, True
-                elif "no" in response.lower() and "yes" not in response.lower():
-                    return False, True
-                else:
-                    return None, False
-            else:
-                match = re.search(r'\b(\d+)\b', response)
-                if match:
-                    num = int(match.group(1))
-                    if 1 <= num <= 10:
-                        return num - 1, True
-                    else:
-                        return None, False
-                else:
-                    return None, False
-        except Exception as fallback_e:
-            return None, False
 
-# OpenAI evaluation with JSON
-def evaluate_sample_openai(sample: Dict, model: str) -> Tuple[Optional[bool], bool]:
-    try:
-        prompt = build_json_prompt(sample["task_id"], sample)
-
-        if model.startswith("gpt-"):
-            res = openai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-                response_format={"type": "json_object"} if model.startswith("gpt-3.5-turbo") or model.startswith("gpt-4") else None
-            )
-        elif model.startswith("o"):
-            res = openai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            
-        output = res.choices[0].message.content.strip()
-        
-        answer, parsed = parse_json_response(output, sample["task_id"])
-        if answer is None:
-            return None, False
-            
-        if sample["task_id"] == "T2":
-            expected = sample.get("is_coherent", False)
-            return answer == expected, True
-        else:
-            return answer == sample["anomaly_index"], True
-            
-    except Exception as e:
-        print(f"❌ {sample['sample_id']} | {model} | Error: {e}")
-        return None, False
+def build_json_prompt(task_id: str, sample: Dict) -> str:
+    task = _prompt_task(task_id)
+    return "".join((_PROMPT_PARTS[task][0], "\n\n", _question_text(task_id, sample), _JSON_TAILS[task]))
 
-# Claude evaluation with JSON
-def evaluate_sample_claude(sample: Dict, model: str) -> Tuple[Optional[bool], bool]:
-    try:
-        prompt = build_json_prompt(sample["task_id"], sample)
-        res = anthropic_client.messages.create(
+
+# K questions of one task in one prompt, answered as {"answers": [{"id": "Q1", "answer": ...}, ...]}
+# (an object rather than a bare array, so it also works with JSON mode)
+def build_packed_prompt(task_id: str, samples: List[Dict]) -> str:
+    task = _prompt_task(task_id)
+    questions = "\n\n".join(f"Question {question_id(i)}:\n{_question_text(task_id, sample)}" for i, sample in enumerate(samples))
+    return "".join((
+        _PROMPT_PARTS[task][0], f" There are {len(samples)} questions below.\n\n",
+        questions, _PACKED_TAILS[task],
+    ))
+
+# Provider requests: each runs with one key from the provider's pool and returns (raw output text, usage)
+def _record_key_tokens(key: KeyEntry, res) -> Optional[Dict]:
+    """Count the response's tokens against the key and return them as {prompt, completion, total}_tokens"""
+    usage = getattr(res, "usage", None) or getattr(res, "usage_metadata", None)
+    if usage is None:
+        return None
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or getattr(usage, "prompt_token_count", None)
+    completion_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or getattr(usage, "candidates_token_count", None)
+    total = getattr(usage, "total_tokens", None) or getattr(usage, "total_token_count", None)
+    if total is None:
+        total = (prompt_tokens or 0) + (completion_tokens or 0)
+    key.record_tokens(total)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total}
+
+def _request_openai(key: KeyEntry, prompt: str, model: str, max_tokens: int = 100) -> Tuple[str, Optional[Dict]]:
+    if model.startswith("gpt-"):
+        res = key.client.chat.completions.create(
             model=model,
-            max_tokens=100,  # Increased for JSON response
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            response_format={"type": "json_object"} if model.startswith("gpt-3.5-turbo") or model.startswith("gpt-4") else None,
+            stream=stream_json,
+            **_timeout_kwargs()
         )
-        output = res.content[0].text.strip()
-        
-        answer, parsed = parse_json_response(output, sample["task_id"])
-        if answer is None:
-            return None, False
-            
-        if sample["task_id"] == "T2":
-            expected = sample.get("is_coherent", False)
-            return answer == expected, True
-        else:
-            return answer == sample["anomaly_index"], True
-            
-    except Exception as e:
-        print(f"❌ {sample['sample_id']} | {model} | Error: {e}")
-        return None, False
-
-# Gemini evaluation with JSON
-def evaluate_sample_gemini(sample: Dict, model: str) -> Tuple[Optional[bool], bool]:
-    try:
-        prompt = build_json_prompt(sample["task_id"], sample)
-        model_obj = genai.GenerativeModel(model)
-        res = model_obj.generate_content(
-            contents=prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0,
-                max_output_tokens=100,
-                response_mime_type="application/json"
-            )
+    elif model.startswith("o"):
+        res = key.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=stream_json,
+            **_timeout_kwargs()
         )
-        output = res.text.strip()
-        
-        answer, parsed = parse_json_response(output, sample["task_id"])
-        if answer is None:
-            return None, False
-            
-        if sample["task_id"] == "T2":
-            expected = sample.get("is_coherent", False)
-            return answer == expected, True
-        else:
-            return answer == sample["anomaly_index"], True
-            
-    except Exception as e:
-        print(f"❌ {sample['sample_id']} | {model} | Error: {e}")
-        return None, False
 
-# Groq evaluation with JSON
-def evaluate_sample_groq(sample: Dict, model: str) -> Tuple[Optional[bool], bool]:
-    try:
-        prompt = build_json_prompt(sample["task_id"], sample)
-        res = groq_client.chat.completions.create(
+    if stream_json:
+        return read_until_json((c.choices[0].delta.content for c in res if c.choices), close=res.close).strip(), None
+    usage = _record_key_tokens(key, res)
+    return res.choices[0].message.content.strip(), usage
+
+def _request_claude(key: KeyEntry, prompt: str, model: str, max_tokens: int = 100) -> Tuple[str, Optional[Dict]]:
+    if stream_json:
+        with key.client.messages.stream(
             model=model,
+            max_tokens=max_tokens,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        output = res.choices[0].message.content.strip()
-        
-        answer, parsed = parse_json_response(output, sample["task_id"])
-        if answer is None:
-            return None, False
-            
-        if sample["task_id"] == "T2":
-            expected = sample.get("is_coherent", False)
-            return answer == expected, True
-        else:
-            return answer == sample["anomaly_index"], True
-            
-    except Exception as e:
-        print(f"❌ {sample['sample_id']} | {model} | Error: {e}")
-        return None, False
+            **_timeout_kwargs()
+        ) as stream:
+            return read_until_json(stream.text_stream).strip(), None
+    res = key.client.messages.create(
+        model=model,
+        max_tokens=max_tokens,  # 100 for one JSON answer, more for packed prompts
+        messages=[{"role": "user", "content": prompt}],
+        **_timeout_kwargs()
+    )
+    usage = _record_key_tokens(key, res)
+    return res.content[0].text.strip(), usage
 
-        
-def evaluate_model_on_dataset(dataset: List[Dict], model: str, provider: str, results: List[Dict]):
-    correct = 0
-    parsed_successfully = 0
-    total = len(dataset)
-    print(f"\n🔍 Evaluating {model} ({provider}) on {total} samples...")
-    
-    for sample in dataset:
-        if provider == "openai":
-            result, parsed = evaluate_sample_openai(sample, model)
-        elif provider == "claude":
-            result, parsed = evaluate_sample_claude(sample, model)
-        elif provider == "gemini":
-            result, parsed = evaluate_sample_gemini(sample, model)
-        elif provider == "groq":
-            result, parsed = evaluate_sample_groq(sample, model)
+def _request_gemini(key: KeyEntry, prompt: str, model: str, max_tokens: int = 100) -> Tuple[str, Optional[Dict]]:
+    # Each key has its own client, so concurrent requests need no global genai state or lock
+    config = genai_types.GenerateContentConfig(
+        temperature=0,
+        max_output_tokens=max_tokens,
+        response_mime_type="application/json",
+        http_options=genai_types.HttpOptions(timeout=int(request_timeout * 1000)) if request_timeout else None  # milliseconds
+    )
+    if stream_json:
+        res = key.client.models.generate_content_stream(model=model, contents=prompt, config=config)
+        return read_until_json((chunk.text for chunk in res), close=getattr(res, "close", None)).strip(), None
+    res = key.client.models.generate_content(model=model, contents=prompt, config=config)
+    usage = _record_key_tokens(key, res)
+    return res.text.strip(), usage
+
+def _request_groq(key: KeyEntry, prompt: str, model: str, max_tokens: int = 100) -> Tuple[str, Optional[Dict]]:
+    res = key.client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        stream=stream_json,
+        **_timeout_kwargs()
+    )
+    if stream_json:
+        return read_until_json((c.choices[0].delta.content for c in res if c.choices), close=getattr(res, "close", None)).strip(), None
+    usage = _record_key_tokens(key, res)
+    return res.choices[0].message.content.strip(), usage
+
+def _provider_request(provider: str):
+    return {
+        "openai": (openai_pool, _request_openai),
+        "claude": (anthropic_pool, _request_claude),
+        "gemini": (gemini_pool, _request_gemini),
+        "groq": (groq_pool, _request_groq),
+    }[provider]
+
+# Request one output, routed through retries and the model's fallback chain
+def request_output(prompt: str, model: str, provider: str, max_tokens: int = 100) -> Tuple[str, str, Optional[Dict]]:
+    """Returns (output, model_used, usage); errors and timeouts are raised once retries and fallbacks are exhausted"""
+    providers = {model: provider}
+    chain = [model]
+    for fallback in fallbacks.get(model, []):
+        providers[fallback["name"]] = fallback["provider"]
+        chain.append(fallback["name"])
+
+    def attempt(target: str) -> Tuple[str, Optional[Dict]]:
+        pool, request = _provider_request(providers[target])
+        # Enforce the whole request (including streamed reads), not just the connection timeout
+        return call_with_timeout(pool.call, request_timeout, request, prompt, target, max_tokens)
+
+    (output, usage), model_used = router.run(chain, attempt)
+    return output, model_used, usage
+
+def expected_answer(sample: Dict) -> Union[int, bool]:
+    if sample["task_id"] == "T2":
+        return sample.get("is_coherent", False)
+    return sample["anomaly_index"]
+
+# Grade a raw output against the sample's label: (parsed answer, correct, parsed)
+def grade_output(sample: Dict, output: Optional[str]) -> Tuple[Union[int, bool, None], Optional[bool], bool]:
+    return grade_answer(sample["task_id"], output, str(expected_answer(sample)))
+
+def run_request(request: PlannedRequest) -> Dict:
+    """Send one planned request; errors and timeouts are recorded in the outcome, not raised"""
+    label = request.targets[0][1]["sample_id"]
+    outcome = {"output": None, "model_used": request.model, "timed_out": False, "usage": None, "latency": None}
+    if request.provider not in PROVIDERS:
+        return outcome
+    started = time.perf_counter()
+    try:
+        outcome["output"], outcome["model_used"], outcome["usage"] = request_output(request.prompt, request.model, request.provider, request.max_tokens)
+    except Exception as e:
+        if isinstance(e, LLMTimeoutError) or is_timeout_error(e):
+            print(f"⏱️ {label} | {request.model} | Timeout: {e}")
+            outcome["timed_out"] = True
         else:
-            result, parsed = None, False
-        
-        # Handle None result
-        if result is None:
-            result = False
-        
-        results.append({
-            "sample_id": sample["sample_id"],
-            "task_id": sample["task_id"],
-            "model": model,
-            "provider": provider,
-            "correct": result,
-            "parsed": parsed
-        })
-        
-        if result:
-            correct += 1
-        if parsed:
-            parsed_successfully += 1
+            print(f"❌ {label} | {request.model} | Error: {e}")
+    # Includes retries and fallbacks
+    outcome["latency"] = time.perf_counter() - started
+    return outcome
 
+def build_row(sample: Dict, model: str, provider: str, outcome: Dict) -> Dict:
+    answer, result, parsed = grade_output(sample, outcome["output"])
+
+    # Handle None result
+    if result is None:
+        result = False
+
+    usage = outcome.get("usage") or {}
+    return {
+        "sample_id": sample["sample_id"],
+        "task_id": sample["task_id"],
+        "model": model,
+        "model_used": outcome["model_used"],
+        "provider": provider,
+        "correct": result,
+        "parsed": parsed,
+        "timed_out": outcome["timed_out"],
+        # No output and no timeout: the request failed (a packed member without an answer only failed to parse)
+        "errored": outcome.get("raw_output", outcome["output"]) is None and not outcome["timed_out"],
+        # Only in the results store (the CSV keeps the columns above)
+        "parsed_answer": None if answer is None else str(answer),
+        "expected_answer": str(expected_answer(sample)),
+        "raw_output": outcome.get("raw_output", outcome["output"]),
+        "request_id": outcome.get("request_id"),
+        "pack_size": outcome.get("pack_size", 1),
+        "question_id": outcome.get("question_id"),
+        "parser_version": PARSER_VERSION,
+        "latency_s": outcome.get("latency"),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "total_tokens": usage.get("total_tokens"),
+    }
+
+def _run_and_fan_out(request: PlannedRequest, sink: "ResultSink") -> Dict:
+    outcome = run_request(request)
+    _fan_out(request, outcome, sink)
+    return outcome
+
+def _fan_out(request: PlannedRequest, outcome: Dict, sink: "ResultSink"):
+    outcome.setdefault("request_id", request.key)
+    if request.members is not None:
+        # Packed request: each question's answer is scored as if it had been asked alone
+        outputs = split_packed_output(outcome["output"], len(request.members))
+        for position, (member, output) in enumerate(zip(request.members, outputs)):
+            _fan_out(member, dict(outcome, output=output, raw_output=outcome["output"], pack_size=len(request.members), question_id=question_id(position)), sink)
+        return
+    # One request, one row per (dataset, sample) that shares its prompt
+    for dataset_name, sample in request.targets:
+        sink.add(dataset_name, build_row(sample, request.model, request.provider, outcome))
+    sink.remember(request.key, outcome)
+
+def reuse_outcomes(plan: EvalPlan, sink: "ResultSink") -> int:
+    """Fan out requests already answered in an earlier chunk and drop them from the plan"""
+    reused = [key for key in plan.requests if sink.outcome(key) is not None]
+    for key in reused:
+        request = plan.requests.pop(key)
+        _fan_out(request, sink.outcome(key), sink)
+    return len(reused)
+
+def print_model_summary(model: str, stats: "ResultStats"):
+    total = correct = parsed_successfully = timeouts = fallback_used = 0
+    for (row_model, model_used, _), counts in stats.counts.items():
+        if row_model != model:
+            continue
+        total += counts["total"]
+        correct += counts["correct"]
+        parsed_successfully += counts["parsed"]
+        timeouts += counts["timed_out"]
+        if model_used != model:
+            fallback_used += counts["total"]
+
+    if not total:
+        return
     acc = correct / total
     parse_rate = parsed_successfully / total
     print(f"✅ {model} Accuracy: {acc:.2%} ({correct}/{total})")
     print(f"📝 {model} Parse Rate: {parse_rate:.2%} ({parsed_successfully}/{total})")
+    if timeouts:
+        print(f"⏱️ {model} Timeouts: {timeouts}/{total}")
+    if fallback_used:
+        print(f"↪️ {model} Answered by a fallback model: {fallback_used}/{total} (reported under model_used)")
+
+def print_plan_summaries(sink: "ResultSink", models: List[Dict]):
+    for dataset_name, stats in sink.stats.items():
+        if len(sink.stats) > 1:
+            print(f"\n📂 {dataset_name}")
+        for model in dict.fromkeys(m["name"] for m in models):
+            print_model_summary(model, stats)
+
+# Sequential execution: one request at a time, model by model in config order
+def execute_plan(plan: EvalPlan, sink: "ResultSink"):
+    for m, requests in plan.by_model():
+        print(f"\n🔍 Evaluating {m['name']} ({m['provider']}): {len(requests)} requests...")
+        for request in requests:
+            _run_and_fan_out(request, sink)
 
-# Save to CSV with parsing info
-def save_results_to_csv(results: List[Dict], path: str):
+# Async execution: every model runs at once. Each provider gets its own thread pool (bulkhead),
+# so a slow provider only queues its own requests, and each model is capped by a semaphore.
+async def execute_plan_async(plan: EvalPlan, sink: "ResultSink", provider_limits: Dict[str, int], model_limit: int):
+    await execute_plans_async([plan], sink, provider_limits, model_limit)
+
+async def execute_plans_async(plans: Iterable[EvalPlan], sink: "ResultSink", provider_limits: Dict[str, int], model_limit: int, queue_size: int = 2000):
+    """Stream plans (e.g. one per dataset chunk) through one long-lived set of provider pools
+
+    Plans are read on a worker thread while earlier requests run, and there is no barrier between
+    plans: a fast provider moves on to the next chunk while a slow one is still busy. Each provider
+    holds at most queue_size requests queued or in flight; when one is full, reading waits for it
+    (bounded producer/consumer), so a fast provider can run ahead of a slow one by that many requests.
+    A request that is still in flight when a later plan repeats it is answered from that request.
+    """
+    loop = asyncio.get_running_loop()
+    executors: Dict[str, ThreadPoolExecutor] = {}
+    queue_slots: Dict[str, asyncio.Semaphore] = {}
+    model_slots: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+    inflight: Dict[str, asyncio.Task] = {}
+    tasks = set()
+
+    async def run(request: PlannedRequest) -> Dict:
+        try:
+            async with model_slots[(request.model, request.provider)]:
+                return await loop.run_in_executor(executors[request.provider], _run_and_fan_out, request, sink)
+        finally:
+            queue_slots[request.provider].release()
+
+    async def reuse(request: PlannedRequest, first: asyncio.Task):
+        try:
+            _fan_out(request, await asyncio.shield(first), sink)
+        finally:
+            queue_slots[request.provider].release()
+
+    def track(task: asyncio.Task, key: Optional[str] = None):
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        if key is not None:
+            inflight[key] = task
+            task.add_done_callback(lambda _, key=key: inflight.pop(key, None))
+
+    plans = iter(plans)
+    try:
+        while True:
+            plan = await loop.run_in_executor(None, next, plans, None)
+            if plan is None:
+                break
+            groups = plan.by_model()
+            new = {m["provider"] for m, _ in groups} - set(executors)
+            for provider in sorted(new):
+                limit = provider_limits.get(provider, model_limit)
+                executors[provider] = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"eval-{provider}")
+                queue_slots[provider] = asyncio.Semaphore(max(queue_size, limit))
+            if new:
+                print(f"\n🔍 Evaluating models concurrently (per provider: "
+                      f"{', '.join(f'{p}={provider_limits.get(p, model_limit)}' for p in sorted(executors))}; per model: {model_limit})...")
+            for m, _ in groups:
+                model_slots.setdefault((m["name"], m["provider"]), asyncio.Semaphore(model_limit))
+            # Interleave the models so a full provider queue does not hold back the other providers' requests
+            for batch in zip_longest(*(requests for _, requests in groups)):
+                for request in batch:
+                    if request is None:
+                        continue
+                    await queue_slots[request.provider].acquire()
+                    first = inflight.get(request.key)
+                    if first is not None:
+                        track(asyncio.ensure_future(reuse(request, first)))
+                    else:
+                        track(asyncio.ensure_future(run(request)), request.key)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for executor in executors.values():
+            # Abandoned (timed-out) requests must not block shutdown
+            executor.shutdown(wait=False)
+
+# Batch execution: each model's requests go out as provider batches (chunked to the provider limit)
+# and are polled until they end. Batches are recorded in the state file, so a restarted run
+# reattaches to pending ones. Providers without a batch backend, and the requests a batch failed,
+# expired or left out (partial results of failed batches are still used), run online.
+def execute_plan_batch(plan: EvalPlan, sink: "ResultSink", backends: Dict[str, object], state: BatchState, poll_seconds: float):
+    online = []
+    open_batches = []
+    for m, requests in plan.by_model():
+        backend = backends.get(m["provider"])
+        if backend is None:
+            online.extend(requests)
+            continue
+        pending = {request.key: request for request in requests}
+        reattached = state.open_batches(backend.name, m["name"], m["provider"])
+        for batch in reattached:
+            for key in batch["keys"]:
+                pending.pop(key, None)
+        if reattached:
+            print(f"🔗 {m['name']}: reattached to {len(reattached)} pending batches")
+        open_batches.extend(reattached)
+
+        items = list(pending.values())
+        for start in range(0, len(items), backend.max_requests):
+            chunk = items[start:start + backend.max_requests]
+            batch_id = backend.submit(m["name"], [(request.key, request.prompt, request.max_tokens) for request in chunk])
+            open_batches.append(state.add(backend.name, batch_id, m["name"], m["provider"], [request.key for request in chunk]))
+            print(f"📦 {m['name']}: submitted batch {batch_id} ({len(chunk)} requests)")
+
+    if online:
+        print(f"\n🔍 {len(online)} requests for providers without a batch backend are sent online...")
+        for request in online:
+            _run_and_fan_out(request, sink)
+
+    while open_batches:
+        for batch in list(open_batches):
+            backend = backends[batch["provider"]]
+            status = backend.poll(batch["id"])
+            if status == PENDING:
+                continue
+            open_batches.remove(batch)
+            outputs = backend.results(batch["id"])
+            resend = []
+            for key in batch["keys"]:
+                request = plan.requests.get(key)
+                if request is None:
+                    continue  # row already in the results CSV (resumed)
+                if outputs.get(key) is None:
+                    resend.append(request)  # errored, expired or missing from the results
+                    continue
+                _fan_out(request, {"output": outputs[key], "model_used": request.model, "timed_out": False}, sink)
+            if resend:
+                print(f"⚠️ Batch {batch['id']} ({batch['model']}) {'failed' if status == FAILED else 'ended'} without "
+                      f"{len(resend)} of its results, sending those requests online")
+                for request in resend:
+                    _run_and_fan_out(request, sink)
+            batch["status"] = COLLECTED if status == DONE else FAILED
+            state.save()
+            print(f"📥 Batch {batch['id']} ({batch['model']}) collected, {len(open_batches)} still pending")
+        if open_batches:
+            time.sleep(poll_seconds)
+
+def execute_plan_mode(plan: EvalPlan, sink: "ResultSink", mode: str, cfg: Dict):
+    """Run a plan with the configured executor (sequential, async or batch)"""
+    if mode == "async":
+        asyncio.run(execute_plan_async(
+            plan, sink,
+            provider_limits=cfg.get("provider_concurrency") or {},
+            model_limit=cfg.get("model_concurrency", 4)
+        ))
+    elif mode == "batch":
+        batch_cfg = cfg.get("batch") or {}
+        if batch_cfg.get("backend", "provider") == "local":
+            local_backend = LocalBatchBackend(batch_cfg.get("local_dir", "eval_batches"), complete_after_seconds=batch_cfg.get("local_complete_after_seconds", 0))
+            backends = {provider: local_backend for provider in PROVIDERS}
+        else:
+            # A batch can only be read back with the account that submitted it, so use each pool's first key
+            backends = {
+                "openai": OpenAIBatchBackend(openai_pool.entries[0].client),
+                "claude": AnthropicBatchBackend(anthropic_pool.entries[0].client),
+            }
+        execute_plan_batch(
+            plan, sink, backends,
+            state=BatchState(batch_cfg.get("state_file", "eval_batches.json")),
+            poll_seconds=batch_cfg.get("poll_seconds", 60)
+        )
+    else:
+        execute_plan(plan, sink)
+
+# Adaptive evaluation: rounds of stratified samples until every model has stopped (see adaptive.py)
+def _task_counts(stats: Optional["ResultStats"]) -> Dict[Tuple[str, str], List[int]]:
+    """(evaluated model, task) -> [correct, total], over all models that answered"""
+    counts = {}
+    for (model, _, task_id), c in (stats.counts.items() if stats else []):
+        entry = counts.setdefault((model, task_id), [0, 0])
+        entry[0] += c["correct"]
+        entry[1] += c["total"]
+    return counts
+
+def run_adaptive(path: str, samples: Iterable[Dict], models: List[Dict], sink: "ResultSink", done: Dict[str, set], pack_size: int, mode: str, cfg: Dict) -> List[Dict]:
+    adaptive_cfg = cfg.get("adaptive") or {}
+    sampler = StratifiedSampler(samples, adaptive_cfg.get("seed", 0))
+    rule = StoppingRule(
+        ci_width=adaptive_cfg.get("ci_width", 0.05),
+        confidence=adaptive_cfg.get("confidence", 0.95),
+        min_per_task=adaptive_cfg.get("min_per_task", 20),
+        settle_ranking=adaptive_cfg.get("settle_ranking", True)
+    )
+    round_size = adaptive_cfg.get("round_size", 100)
+    rule.plan_looks(sampler.rounds_left(round_size, rule.min_per_task))
+    names = list(dict.fromkeys(m["name"] for m in models))
+    active = list(names)
+    stopped = {}
+    rounds = 0
+    print(f"\n🎯 Adaptive evaluation of {path}: {sampler.total} samples in {len(sampler.tasks)} tasks, "
+          f"stop at CI width {rule.ci_width:.1%} ({rule.confidence:.0%}, checked at {rule.look_confidence:.2%} over up to {rule.looks} rounds)"
+          + (" or settled rank" if rule.settle_ranking else ""))
+    intervals = rule.intervals(names, sampler.tasks, _task_counts(sink.stats.get(path)), sampler.weights())
+    while active and not sampler.exhausted:
+        rounds += 1
+        batch = sampler.next_round(round_size, rule.min_per_task)
+        plan = compile_plan({path: batch}, [m for m in models if m["name"] in active], build_json_prompt, done=lambda p, sample, model: (sample["sample_id"], model) in done[p])
+        reuse_outcomes(plan, sink)
+        plan = pack_plan(plan, pack_size, build_packed_prompt)
+        if plan.requests:
+            execute_plan_mode(plan, sink, mode, cfg)
+
+        intervals = rule.intervals(names, sampler.tasks, _task_counts(sink.stats.get(path)), sampler.weights())
+        for model in list(active):
+            reason = rule.stop_reason(model, intervals, sampler.population)
+            if reason:
+                active.remove(model)
+                stopped[model] = (reason, rounds)
+        print(f"🎯 Round {rounds}: {sum(sampler.drawn.values())}/{sampler.total} samples drawn, {len(active)} models still active"
+              + "".join(f"\n   🛑 {model} stopped ({reason})" for model, (reason, r) in stopped.items() if r == rounds))
+    for model in active:
+        stopped[model] = ("exhausted", rounds)
+
+    return [
+        {"model": model, "samples": intervals[model]["samples"], "population": sampler.total,
+         "fraction": intervals[model]["samples"] / max(sampler.total, 1),
+         "accuracy": intervals[model]["accuracy"], "ci_low": intervals[model]["ci_low"], "ci_high": intervals[model]["ci_high"],
+         "ci_width": intervals[model]["ci_high"] - intervals[model]["ci_low"], "confidence": rule.confidence,
+         "look_confidence": rule.look_confidence, "planned_rounds": rule.looks,
+         "stop_reason": stopped[model][0], "rounds": stopped[model][1],
+         "per_task_samples": json.dumps(intervals[model]["per_task"])}
+        for model in names
+    ]
+
+def print_adaptive_summary(path: str, summary: List[Dict]):
+    print(f"\n🏁 Adaptive leaderboard for {path} (task-weighted accuracy):")
+    for rank, s in enumerate(sorted(summary, key=lambda s: -s["accuracy"]), 1):
+        print(f"  {rank}. {s['model']}: {s['accuracy']:.1%} [{s['confidence']:.0%} CI {s['ci_low']:.1%}-{s['ci_high']:.1%}], "
+              f"{s['samples']}/{s['population']} samples ({s['fraction']:.0%}), stopped: {s['stop_reason']}")
+
+# evaluation_results_raw_json.csv -> evaluation_results_raw_json_adaptive.csv
+def adaptive_summary_path(csv_path: str) -> str:
+    return f"{os.path.splitext(csv_path)[0]}_adaptive.csv"
+
+def save_adaptive_summary(summary: List[Dict], path: str):
+    if not summary:
+        return
     with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["sample_id", "task_id", "model", "provider", "correct", "parsed"])
+        writer = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
         writer.writeheader()
-        writer.writerows(results)
-    print(f"\n📄 Saved results to {path}")
+        writer.writerows(summary)
+    print(f"📄 Saved adaptive summary to {path}")
 
-# Calculate detailed statistics
-def calculate_detailed_stats(results: List[Dict]):
-    task_stats = {}
-    model_stats = {}
-    
-    for res in results:
-        task_id = res["task_id"]
-        model = res["model"]
-        
-        # Per-task stats
-        if task_id not in task_stats:
-            task_stats[task_id] = {"correct": 0, "total": 0, "parsed": 0}
-        task_stats[task_id]["total"] += 1
-        if res["correct"]:
-            task_stats[task_id]["correct"] += 1
-        if res["parsed"]:
-            task_stats[task_id]["parsed"] += 1
-        
-        # Per-model-per-task stats
-        key = (model, task_id)
-        if key not in model_stats:
-            model_stats[key] = {"correct": 0, "total": 0, "parsed": 0}
-        model_stats[key]["total"] += 1
-        if res["correct"]:
-            model_stats[key]["correct"] += 1
-        if res["parsed"]:
-            model_stats[key]["parsed"] += 1
-    
-    print("\n📊 Per-task Statistics:")
-    for task_id, stats in task_stats.items():
-        acc = stats["correct"] / stats["total"] * 100
-        parse_rate = stats["parsed"] / stats["total"] * 100
-        print(f"  {task_id}: {acc:.1f}% accuracy, {parse_rate:.1f}% parse rate ({stats['correct']}/{stats['total']})")
-    
-    print("\n📊 Per-model-per-task Statistics:")
-    for (model, task_id), stats in model_stats.items():
-        acc = stats["correct"] / stats["total"] * 100
-        parse_rate = stats["parsed"] / stats["total"] * 100
-        print(f"  {model} - {task_id}: {acc:.1f}% accuracy, {parse_rate:.1f}% parse rate ({stats['correct']}/{stats['total']})")
+# Control experiment for prompt packing: the same samples are evaluated unpacked and packed,
+# and accuracy is compared per (model, task) on the samples both arms answered
+def run_pack_control(streams: Dict[str, Iterable[Dict]], models: List[Dict], pack_size: int, mode: str, cfg: Dict):
+    limit = cfg.get("pack_control_samples", 200)
+    max_drop = cfg.get("pack_control_max_drop", 0.02)
+    samples = {path: list(islice(stream, limit)) for path, stream in streams.items()}
+    plan = compile_plan(samples, models, build_json_prompt)
+    arms = {}
+    for arm, arm_plan in (("unpacked", plan), (f"packed x{pack_size}", pack_plan(plan, pack_size, build_packed_prompt))):
+        prompt_chars = sum(len(request.prompt) for request in arm_plan.requests.values())
+        print(f"\n🧪 {arm}: {len(arm_plan.requests)} requests, {prompt_chars} prompt characters")
+        arm_sink = ResultSink(keep_rows=True)
+        execute_plan_mode(arm_plan, arm_sink, mode, cfg)
+        arms[arm] = [row for rows in arm_sink.rows.values() for row in rows]
+
+    comparison = compare_arms(*arms.values())
+    print(f"\n🧪 Packing control (x{pack_size}, {sum(len(s) for s in samples.values())} samples; safe = accuracy and parse rate drop at most {max_drop:.0%}):")
+    for stats in comparison:
+        n = stats["samples"]
+        parse_drop = (stats["unpacked_parsed"] - stats["packed_parsed"]) / n
+        safe = stats["accuracy_delta"] >= -max_drop and parse_drop <= max_drop
+        print(f"  {'✅' if safe else '⚠️'} {stats['model']} - {stats['task_id']}: "
+              f"unpacked {stats['unpacked_accuracy']:.1%}, packed {stats['packed_accuracy']:.1%} "
+              f"({stats['accuracy_delta']:+.1%}; only unpacked correct {stats['only_unpacked_correct']}, only packed correct {stats['only_packed_correct']}; "
+              f"parsed {stats['unpacked_parsed']}/{n} vs {stats['packed_parsed']}/{n})")
+        stats["safe"] = safe
+    if comparison:
+        path = f"pack_control_x{pack_size}.csv"
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(comparison[0].keys()))
+            writer.writeheader()
+            writer.writerows(comparison)
+        print(f"\n📄 Saved packing comparison to {path}")
+
+# Record each sample's position (in reading order) while passing the stream through
+def number_samples(samples: Iterable[Dict], positions: Dict[str, int]) -> Iterable[Dict]:
+    for sample in samples:
+        positions.setdefault(sample["sample_id"], len(positions))
+        yield sample
+
+# Load rows from an earlier (possibly interrupted) run of the same output CSV
+def load_results_csv(path: str) -> List[Dict]:
+    rows = []
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if not row.get("sample_id") or row.get("correct") is None or row.get("parsed") is None:
+                continue  # line cut off by a crash
+            rows.append({
+                "sample_id": row["sample_id"],
+                "task_id": row["task_id"],
+                "model": row["model"],
+                # CSVs written before model_used/timed_out/errored existed
+                "model_used": row.get("model_used") or row["model"],
+                "provider": row["provider"],
+                "correct": row["correct"] == "True",
+                "parsed": row["parsed"] == "True",
+                "timed_out": row.get("timed_out") == "True",
+                "errored": row.get("errored") == "True",
+            })
+    return rows
+
+class ResultWriter:
+    """Appends each result row to the CSV as soon as it completes, so a crash only loses in-flight samples
+
+    The file is first rewritten with the header and the kept (resumed) rows, which also drops a
+    partial last line and upgrades CSVs written with an older column set. Rows are appended in
+    completion order; sort() puts a finished file back into plan order.
+    """
+
+    def __init__(self, path: str, kept_rows: List[Dict]):
+        self.path = path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(kept_rows)
+        os.replace(tmp_path, path)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        self._lock = threading.Lock()
+
+    def write(self, row: Dict):
+        with self._lock:
+            self._writer.writerow(row)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def sort(self, key):
+        """Rewrite the closed file with its rows sorted by key (a function of the CSV row)"""
+        with open(self.path, "r", newline="", encoding="utf-8") as f:
+            rows = sorted(csv.DictReader(f), key=key)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, self.path)
+
+class ResultStats:
+    """Running counts per (model, model_used, task_id), so summaries never need the rows in memory"""
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+
+    def add(self, row: Dict):
+        key = (row["model"], row.get("model_used") or row["model"], row["task_id"])
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = {"correct": 0, "total": 0, "parsed": 0, "timed_out": 0}
+        counts["total"] += 1
+        counts["correct"] += bool(row["correct"])
+        counts["parsed"] += bool(row["parsed"])
+        counts["timed_out"] += bool(row["timed_out"])
+
+class ResultSink:
+    """Where finished rows go: streamed to each dataset's CSV writer (and results store, if any) and
+    folded into running stats
+
+    Rows are only kept in memory with keep_rows=True. Per-request outcomes (short outputs) are
+    remembered so a request met again in a later chunk (same prompt in another dataset) is not sent
+    twice; only the max_outcomes most recently used are kept (LRU), so memory stays bounded on long
+    streamed runs. A request whose outcome was evicted is simply sent again.
+    """
+
+    def __init__(self, writers: Optional[Dict[str, ResultWriter]] = None, keep_rows: bool = False, stores: Optional[Dict[str, ParquetResultStore]] = None, max_outcomes: int = 100000):
+        self.writers = writers or {}
+        self.stores = stores or {}
+        self.stats: Dict[str, ResultStats] = {}
+        self.rows: Optional[Dict[str, List[Dict]]] = {} if keep_rows else None
+        self.max_outcomes = max_outcomes
+        self._outcomes: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, dataset_name: str, row: Dict):
+        """Add a row to the stats only (rows resumed from an earlier run are already in the CSV)"""
+        with self._lock:
+            self.stats.setdefault(dataset_name, ResultStats()).add(row)
+
+    def add(self, dataset_name: str, row: Dict):
+        self.count(dataset_name, row)
+        if self.rows is not None:
+            with self._lock:
+                self.rows.setdefault(dataset_name, []).append(row)
+        writer = self.writers.get(dataset_name)
+        if writer:
+            writer.write(row)
+        store = self.stores.get(dataset_name)
+        if store:
+            store.write(row)
+
+    def remember(self, key: str, outcome: Dict):
+        if self.max_outcomes <= 0:
+            return
+        with self._lock:
+            self._outcomes[key] = outcome
+            self._outcomes.move_to_end(key)
+            while len(self._outcomes) > self.max_outcomes:
+                self._outcomes.popitem(last=False)
+
+    def outcome(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            outcome = self._outcomes.get(key)
+            if outcome is not None:
+                self._outcomes.move_to_end(key)
+            return outcome
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", type=str, required=True)
-    parser.add_argument("--dataset", type=str, required=True, help="Path to agentic_final.jsonl or agentic_raw.jsonl")
+    parser.add_argument("--dataset", type=str, nargs="+", required=True, help="Path(s) to agentic_final.jsonl / agentic_raw.jsonl; requests shared between datasets are sent once")
+    parser.add_argument("--mode", choices=["sequential", "async", "batch"], default=None, help="Overrides eval_mode in the config")
+    parser.add_argument("--resume", action="store_true", help="Keep rows already in the output CSV and skip their (sample_id, model) pairs (timed-out and errored rows are sent again)")
+    parser.add_argument("--task-ids", type=str, nargs="+", default=None, help="Only evaluate samples of these task ids")
+    parser.add_argument("--difficulty", type=str, nargs="+", default=None, help="Only evaluate samples with these meta.difficulty_level values")
+    parser.add_argument("--pack", type=int, default=None, help="Questions of one task per prompt (overrides pack_size in the config; 1 = no packing)")
+    parser.add_argument("--pack-control", action="store_true", help="Evaluate the first pack_control_samples samples both unpacked and packed and compare accuracy")
+    parser.add_argument("--adaptive", action="store_true", help="Sample stratified by task and stop querying a model once its CI is narrow enough or its rank is settled (see adaptive in the config)")
+    parser.add_argument("--shard", type=str, default=None, help="i/n: evaluate only shard i of n (deterministic by sample_id); each shard writes its own CSV")
     args = parser.parse_args()
 
     with open(args.config, "r") as f:
@@ -353,20 +841,160 @@ if __name__ == "__main__":
     gemini_api_key = cfg.get("gemini_api_key")
     groq_api_key = cfg.get("groq_api_key")
     models = cfg.get("models", [])
+    stream_json = cfg.get("stream_json", False)
+    request_timeout = cfg.get("request_timeout") or None
     
-    output_suffix = "final" if "final" in args.dataset else "raw"
-    csv_output = f"evaluation_results_{output_suffix}_json.csv"
+    try:
+        shard = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+    csv_outputs = {path: results_csv_path(path, shard) for path in args.dataset}
+    if len(set(csv_outputs.values())) < len(csv_outputs):
+        parser.error(f"datasets map to the same output CSV: {csv_outputs}")
 
-    openai_client = OpenAI(api_key=openai_api_key)
-    anthropic_client = Anthropic(api_key=claude_api_key)
-    genai.configure(api_key=gemini_api_key)
-    groq_client = Groq(api_key=groq_api_key)
+    # Each provider accepts a pool of keys under key_pools; the single *_api_key is the fallback
+    key_pools_cfg = cfg.get("key_pools") or {}
+    key_cooldown = cfg.get("key_cooldown_seconds", 30)
+    key_max_wait = cfg.get("key_max_wait_seconds", 120)
+    openai_pool = build_key_pool(
+        "openai", key_pools_cfg.get("openai") or [openai_api_key],
+        lambda key: OpenAI(api_key=key.api_key, organization=key.organization, base_url=key.base_url),
+        cooldown_seconds=key_cooldown, max_wait_seconds=key_max_wait
+    )
+    anthropic_pool = build_key_pool(
+        "claude", key_pools_cfg.get("claude") or [claude_api_key],
+        lambda key: Anthropic(api_key=key.api_key, **({"base_url": key.base_url} if key.base_url else {})),
+        cooldown_seconds=key_cooldown, max_wait_seconds=key_max_wait
+    )
+    gemini_pool = build_key_pool(
+        "gemini", key_pools_cfg.get("gemini") or [gemini_api_key],
+        lambda key: genai.Client(api_key=key.api_key, **({"http_options": genai_types.HttpOptions(base_url=key.base_url)} if key.base_url else {})),
+        cooldown_seconds=key_cooldown, max_wait_seconds=key_max_wait
+    )
+    groq_pool = build_key_pool(
+        "groq", key_pools_cfg.get("groq") or [groq_api_key],
+        lambda key: Groq(api_key=key.api_key, **({"base_url": key.base_url} if key.base_url else {})),
+        cooldown_seconds=key_cooldown, max_wait_seconds=key_max_wait
+    )
 
-    dataset = load_dataset(args.dataset)
-    all_results = []
-    
-    for m in models:
-        evaluate_model_on_dataset(dataset, model=m["name"], provider=m["provider"], results=all_results)
+    router = FallbackRouter(**(cfg.get("retry") or {}), **(cfg.get("circuit_breaker") or {}))
+    fallbacks = cfg.get("fallbacks") or {}
 
-    save_results_to_csv(all_results, csv_output)
-    calculate_detailed_stats(all_results)
\ No newline at end of file
+    mode = args.mode or cfg.get("eval_mode", "sequential")
+    if args.adaptive and mode == "batch":
+        parser.error("--adaptive needs results between rounds, use --mode sequential or async")
+    pack_size = args.pack or cfg.get("pack_size", 1)
+    if args.pack_control:
+        if pack_size <= 1:
+            parser.error("--pack-control needs --pack K (or pack_size in the config) with K > 1")
+        run_pack_control(
+            {path: iter_dataset(path, args.task_ids, args.difficulty, shard) for path in args.dataset},
+            models, pack_size, mode, cfg
+        )
+        sys.exit(0)
+
+    # Rows are streamed to the CSVs as they complete; --resume keeps earlier rows and only evaluates the rest.
+    # Timed-out and errored rows are not kept: they are dropped from the CSV (and store) and sent again.
+    # Only the (sample_id, model) pairs of resumed rows stay in memory, their counts go into the running stats.
+    sink = ResultSink(max_outcomes=cfg.get("outcome_cache_size", 100000))
+    store_cfg = cfg.get("results_store") or {}
+    done = {path: set() for path in args.dataset}
+    for path, csv_output in csv_outputs.items():
+        kept, retry = [], set()
+        if args.resume and os.path.exists(csv_output):
+            for row in load_results_csv(csv_output):
+                if not in_shard(row["sample_id"], shard):
+                    continue
+                if row["timed_out"] or row["errored"]:
+                    retry.add((row["sample_id"], row["model"]))
+                else:
+                    kept.append(row)
+            print(f"♻️ Resuming from {csv_output}: {len(kept)} rows already evaluated"
+                  + (f", {len(retry)} timed-out or errored rows are sent again" if retry else ""))
+        for row in kept:
+            done[path].add((row["sample_id"], row["model"]))
+            sink.count(path, row)
+        sink.writers[path] = ResultWriter(csv_output, kept)
+        if store_cfg.get("enabled", False):
+            store = sink.stores[path] = ParquetResultStore(results_store_path(csv_output), keep=args.resume, flush_rows=store_cfg.get("flush_rows", 5000))
+            store.drop(retry)
+            # Rows that reached the CSV but not the store before a crash (without raw output / usage)
+            backfilled = store.backfill(kept) if kept else 0
+            if backfilled:
+                print(f"♻️ Backfilled {backfilled} rows into {store.path} from the CSV")
+
+    # Datasets are read lazily (filtered and sharded while reading) and evaluated stream_chunk_size
+    # samples at a time, so evaluation starts right away and memory stays flat. Batch mode plans
+    # everything at once so each model's requests go out in as few batches as possible.
+    chunk_size = None if mode == "batch" else cfg.get("stream_chunk_size", 1000)
+    # Each sample's position in its dataset, so the finished CSVs can be put back into plan order
+    positions = {path: {} for path in args.dataset}
+    streams = {path: number_samples(iter_dataset(path, args.task_ids, args.difficulty, shard), positions[path]) for path in args.dataset}
+    if shard:
+        print(f"🧩 Shard {shard[0]}/{shard[1]}")
+    if pack_size > 1:
+        print(f"📦 Packing {pack_size} questions per prompt")
+    adaptive_summaries = {}
+    def chunk_plans():
+        for chunk in iter_chunks(streams, chunk_size):
+            # Build each prompt once and send each unique (model, prompt) request once across all datasets
+            plan = compile_plan(chunk, models, build_json_prompt, done=lambda path, sample, model: (sample["sample_id"], model) in done[path])
+            reused = reuse_outcomes(plan, sink)
+            plan = pack_plan(plan, pack_size, build_packed_prompt)
+            print(f"🧮 Evaluation plan ({sum(len(samples) for samples in chunk.values())} samples read): {plan.summary()}"
+                  + (f", {reused} answered in an earlier chunk" if reused else ""))
+            if plan.requests:
+                yield plan
+
+    try:
+        if args.adaptive:
+            # Each dataset gets its own stratified draw and stopping decisions
+            for path in args.dataset:
+                adaptive_summaries[path] = run_adaptive(path, streams[path], models, sink, done, pack_size, mode, cfg)
+        elif mode == "async":
+            # Chunks stream into one set of provider pools, without waiting for each chunk to finish
+            asyncio.run(execute_plans_async(
+                chunk_plans(), sink,
+                provider_limits=cfg.get("provider_concurrency") or {},
+                model_limit=cfg.get("model_concurrency", 4),
+                queue_size=cfg.get("async_queue_size", 2000)
+            ))
+        else:
+            for plan in chunk_plans():
+                execute_plan_mode(plan, sink, mode, cfg)
+    finally:
+        for writer in sink.writers.values():
+            writer.close()
+        for store in sink.stores.values():
+            store.close()
+    # Rows were appended in completion order: sort each CSV by model (config order), then dataset order.
+    # Resumed rows of samples not read this run (other filters) keep their place at the top of their model.
+    model_order = {name: i for i, name in enumerate(dict.fromkeys(m["name"] for m in models))}
+    for path, writer in sink.writers.items():
+        writer.sort(lambda row, order=positions[path]: (model_order.get(row["model"], len(model_order)), order.get(row["sample_id"], -1)))
+    print_plan_summaries(sink, models)
+    for path, summary in adaptive_summaries.items():
+        print_adaptive_summary(path, summary)
+        save_adaptive_summary(summary, adaptive_summary_path(csv_outputs[path]))
+    for path, csv_output in csv_outputs.items():
+        print(f"\n📄 Saved results to {csv_output}" + (f" and {sink.stores[path].path}" if path in sink.stores else ""))
+
+    print("\n🔑 API key usage:")
+    print_key_usage({"openai": openai_pool, "claude": anthropic_pool, "gemini": gemini_pool, "groq": groq_pool})
+    # Detailed stats cover every row, including resumed ones (from the store if enabled, else the CSV)
+    stats_cfg = cfg.get("stats") or {}
+    for path, csv_output in csv_outputs.items():
+        if len(csv_outputs) > 1:
+            print(f"\n📂 {path}")
+        if path in sink.stores:
+            arrays = ResultArrays.from_table(load_results_store(sink.stores[path].path, columns=STATS_COLUMNS))
+        else:
+            arrays = ResultArrays.from_csv([csv_output])
+        print_stats_report(
+            arrays,
+            resamples=stats_cfg.get("bootstrap_resamples", 2000),
+            confidence=stats_cfg.get("confidence", 0.95),
+            permutation_resamples=stats_cfg.get("permutation_resamples", 10000),
+            pairs=[tuple(pair) for pair in stats_cfg["pairs"]] if stats_cfg.get("pairs") else None,
+            seed=stats_cfg.get("seed", 0)
+        )
\ No newline at end of file
@@ -0,0 +1,182 @@
+# Provider batch APIs for latency-insensitive evaluation (OpenAI Batch, Anthropic Message Batches)
+# plus a file-based local stand-in. Submitted batches are recorded in a state file so an
+# interrupted run can reattach to them instead of paying for the requests again.
+import io
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Batch states reported by poll(); COLLECTED marks batches whose results were written.
+# results() is read for DONE and FAILED batches: a failed or expired batch can still hold partial
+# results, and requests it maps to None (errored) or leaves out are sent online by the caller.
+DONE = "done"
+FAILED = "failed"
+PENDING = "pending"
+COLLECTED = "collected"
+
+
+def openai_batch_body(model: str, prompt: str) -> Dict:
+    """Chat completion body matching the online request (temperature 0, JSON mode where supported)"""
+    body = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+    if model.startswith("gpt-"):
+        body["temperature"] = 0
+        if model.startswith("gpt-3.5-turbo") or model.startswith("gpt-4"):
+            body["response_format"] = {"type": "json_object"}
+    return body
+
+
+class OpenAIBatchBackend:
+    name = "openai"
+    max_requests = 50000
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, model: str, requests: List[Tuple[str, str, int]]) -> str:
+        lines = [
+            json.dumps({"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": openai_batch_body(model, prompt)}, ensure_ascii=False)
+            for key, prompt, _ in requests
+        ]
+        upload = self.client.files.create(file=("batch.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))), purpose="batch")
+        batch = self.client.batches.create(input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        status = self.client.batches.retrieve(batch_id).status
+        if status == "completed":
+            return DONE
+        if status in ("failed", "expired", "cancelled"):
+            return FAILED
+        return PENDING
+
+    def results(self, batch_id: str) -> Dict[str, Optional[str]]:
+        # Failed / expired / cancelled batches keep the output file of the requests that finished
+        batch = self.client.batches.retrieve(batch_id)
+        outputs = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if response.get("status_code") == 200:
+                    outputs[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+                else:
+                    outputs[item["custom_id"]] = None
+        return outputs
+
+
+class AnthropicBatchBackend:
+    name = "claude"
+    max_requests = 100000
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, model: str, requests: List[Tuple[str, str, int]]) -> str:
+        batch = self.client.messages.batches.create(requests=[
+            {"custom_id": key, "params": {"model": model, "max_tokens": max_tokens, "messages": [{"role": "user", "content": prompt}]}}
+            for key, prompt, max_tokens in requests
+        ])
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return PENDING
+        # An ended batch always reports DONE upstream; count it as failed if any request did not succeed
+        counts = batch.request_counts
+        if counts.errored or counts.expired or counts.canceled:
+            return FAILED
+        return DONE
+
+    def results(self, batch_id: str) -> Dict[str, Optional[str]]:
+        outputs = {}
+        for item in self.client.messages.batches.results(batch_id):
+            if item.result.type == "succeeded":
+                outputs[item.custom_id] = item.result.message.content[0].text.strip()
+            else:
+                outputs[item.custom_id] = None  # errored / canceled / expired
+        return outputs
+
+
+class LocalBatchBackend:
+    """File-based stand-in for a provider batch API (no network)
+
+    submit() writes <dir>/<id>.input.jsonl; once complete_after_seconds have passed, poll() answers
+    every request with respond(model, prompt) and writes <dir>/<id>.output.jsonl. State lives in
+    the directory, so a restarted run can reattach exactly as with a real provider.
+    """
+
+    name = "local"
+    max_requests = 50000
+
+    def __init__(self, directory: str, respond: Optional[Callable[[str, str], str]] = None, complete_after_seconds: float = 0.0):
+        self.directory = directory
+        self.respond = respond or (lambda model, prompt: '{"answer": 1}')
+        self.complete_after_seconds = complete_after_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, model: str, requests: List[Tuple[str, str, int]]) -> str:
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        with open(self._path(batch_id, "input"), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"model": model, "created_at": time.time()}) + "\n")
+            for key, prompt, _ in requests:
+                f.write(json.dumps({"custom_id": key, "prompt": prompt}, ensure_ascii=False) + "\n")
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        if os.path.exists(self._path(batch_id, "output")):
+            return DONE
+        if not os.path.exists(self._path(batch_id, "input")):
+            return FAILED
+        with open(self._path(batch_id, "input"), "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if time.time() - header["created_at"] < self.complete_after_seconds:
+                return PENDING
+            lines = [json.loads(line) for line in f]
+        tmp_path = self._path(batch_id, "output") + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in lines:
+                f.write(json.dumps({"custom_id": item["custom_id"], "output": self.respond(header["model"], item["prompt"])}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._path(batch_id, "output"))
+        return DONE
+
+    def results(self, batch_id: str) -> Dict[str, Optional[str]]:
+        if not os.path.exists(self._path(batch_id, "output")):
+            return {}
+        with open(self._path(batch_id, "output"), "r", encoding="utf-8") as f:
+            return {item["custom_id"]: item["output"] for item in map(json.loads, f)}
+
+
+class BatchState:
+    """Submitted batches and which request keys they cover, persisted after every change"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.batches: List[Dict] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.batches = json.load(f)["batches"]
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"batches": self.batches}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add(self, backend: str, batch_id: str, model: str, provider: str, keys: List[str]) -> Dict:
+        batch = {"id": batch_id, "backend": backend, "model": model, "provider": provider, "keys": keys, "status": PENDING, "submitted_at": time.time()}
+        self.batches.append(batch)
+        self.save()
+        return batch
+
+    def open_batches(self, backend: str, model: str, provider: str) -> List[Dict]:
+        return [b for b in self.batches if b["backend"] == backend and b["model"] == model and b["provider"] == provider and b["status"] == PENDING]
@@ -0,0 +1,121 @@
+# Multi-question prompt packing: K questions of the same task share one prompt (and its JSON
+# instructions), the model answers with one {"id", "answer"} object per question, and each answer
+# is scored on its own as if it had come from an unpacked request
+import json
+from typing import Callable, Dict, List, Optional
+
+from eval_plan import EvalPlan, PlannedRequest, request_key
+from json_parsing import extract_json
+
+# Output budget for providers that need max_tokens (an unpacked answer gets 100)
+TOKENS_PER_PACKED_ANSWER = 40
+
+
+def question_id(position: int) -> str:
+    return f"Q{position + 1}"
+
+
+def packed_max_tokens(count: int) -> int:
+    return max(100, TOKENS_PER_PACKED_ANSWER * count)
+
+
+def pack_plan(plan: EvalPlan, pack_size: int, build_packed_prompt: Callable[[str, List[Dict]], str]) -> EvalPlan:
+    """Replace the plan's requests with packed ones of up to pack_size questions per prompt
+
+    Packs are formed per (model, task) in plan order, so the same samples give the same packs
+    (and request keys) on every run. Each packed request keeps its unpacked requests as members;
+    question i of the prompt answers member i.
+    """
+    if pack_size <= 1:
+        return plan
+    packed = EvalPlan(plan.models)
+    packed.rows = plan.rows
+    packed.prompts_built = plan.prompts_built
+    for m, requests in plan.by_model():
+        by_task: Dict[str, List[PlannedRequest]] = {}
+        for request in requests:
+            by_task.setdefault(request.targets[0][1]["task_id"], []).append(request)
+        for task_id, members in by_task.items():
+            for start in range(0, len(members), pack_size):
+                group = members[start:start + pack_size]
+                prompt = build_packed_prompt(task_id, [member.targets[0][1] for member in group])
+                packed.prompts_built += 1
+                request = PlannedRequest(request_key(m["name"], m["provider"], prompt), m["name"], m["provider"], prompt)
+                request.members = group
+                request.max_tokens = packed_max_tokens(len(group))
+                request.targets = [target for member in group for target in member.targets]
+                packed.requests[request.key] = request
+    return packed
+
+
+def _packed_items(data) -> Optional[list]:
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list):
+                return value
+    return None
+
+
+def split_packed_output(output: Optional[str], count: int) -> List[Optional[str]]:
+    """Per-question outputs ('{"answer": ...}') of a packed response, None where an answer is missing
+
+    Answers are matched by id; items without a usable id fall back to their position. The JSON is
+    read with the repairing extractor, so a truncated or slightly malformed response still yields
+    the answers that survived.
+    """
+    answers: List[Optional[str]] = [None] * count
+    if output is None:
+        return answers
+    start = min((i for i in (output.find("{"), output.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return answers
+    end = max(output.rfind("}"), output.rfind("]"))
+    text = output[start:end + 1] if end > start else output[start:]
+    try:
+        # extract_json starts at a '{', so a bare list of answers is wrapped in an object first
+        items = _packed_items(extract_json(text if text.startswith("{") else '{"answers": ' + text + "}"))
+    except json.JSONDecodeError:
+        items = None
+    if not items:
+        return answers
+    ids = {question_id(i): i for i in range(count)}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or "answer" not in item:
+            continue
+        qid = str(item.get("id", "")).strip().upper()
+        index = ids.get(f"Q{qid}" if qid.isdigit() else qid)
+        if index is None and position < count:
+            index = position
+        if index is not None and answers[index] is None:
+            answers[index] = json.dumps({"answer": item["answer"]}, ensure_ascii=False)
+    return answers
+
+
+def compare_arms(unpacked_rows: List[Dict], packed_rows: List[Dict]) -> List[Dict]:
+    """Paired packed vs. unpacked comparison per (model, task_id) over the samples both arms answered"""
+    unpacked = {(row["sample_id"], row["model"]): row for row in unpacked_rows}
+    groups: Dict = {}
+    for row in packed_rows:
+        base = unpacked.get((row["sample_id"], row["model"]))
+        if base is None:
+            continue
+        stats = groups.setdefault((row["model"], row["task_id"]), {
+            "model": row["model"], "task_id": row["task_id"], "samples": 0,
+            "unpacked_correct": 0, "packed_correct": 0, "unpacked_parsed": 0, "packed_parsed": 0,
+            "only_unpacked_correct": 0, "only_packed_correct": 0,
+        })
+        stats["samples"] += 1
+        stats["unpacked_correct"] += bool(base["correct"])
+        stats["packed_correct"] += bool(row["correct"])
+        stats["unpacked_parsed"] += bool(base["parsed"])
+        stats["packed_parsed"] += bool(row["parsed"])
+        stats["only_unpacked_correct"] += bool(base["correct"]) and not row["correct"]
+        stats["only_packed_correct"] += bool(row["correct"]) and not base["correct"]
+    for stats in groups.values():
+        n = stats["samples"]
+        stats["unpacked_accuracy"] = stats["unpacked_correct"] / n
+        stats["packed_accuracy"] = stats["packed_correct"] / n
+        stats["accuracy_delta"] = stats["packed_accuracy"] - stats["unpacked_accuracy"]
+    return list(groups.values())
@@ -0,0 +1,78 @@
+# Evaluation planner: builds every (model, prompt) request once, dedups identical requests
+# across datasets and model entries, and remembers which dataset rows each answer fans out to
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def request_key(model: str, provider: str, prompt: str) -> str:
+    return hashlib.sha256("\0".join((provider, model, prompt)).encode("utf-8")).hexdigest()
+
+
+class PlannedRequest:
+    """One unique request and the (dataset name, sample) rows that share its answer
+
+    A packed request (see eval_packing) also lists the unpacked requests it answers as members.
+    """
+
+    __slots__ = ("key", "model", "provider", "prompt", "targets", "members", "max_tokens")
+
+    def __init__(self, key: str, model: str, provider: str, prompt: str):
+        self.key = key
+        self.model = model
+        self.provider = provider
+        self.prompt = prompt
+        self.targets: List[Tuple[str, Dict]] = []
+        self.members: Optional[List["PlannedRequest"]] = None
+        self.max_tokens = 100
+
+
+class EvalPlan:
+    def __init__(self, models: List[Dict]):
+        self.models = models
+        self.requests: Dict[str, PlannedRequest] = {}
+        self.rows = 0
+        self.prompts_built = 0
+
+    def add(self, dataset_name: str, sample: Dict, model: str, provider: str, prompt: str):
+        key = request_key(model, provider, prompt)
+        request = self.requests.get(key)
+        if request is None:
+            request = self.requests[key] = PlannedRequest(key, model, provider, prompt)
+        request.targets.append((dataset_name, sample))
+        self.rows += 1
+
+    def by_model(self) -> List[Tuple[Dict, List[PlannedRequest]]]:
+        """Unique requests grouped per configured model, in config order"""
+        grouped = {(m["name"], m["provider"]): [] for m in self.models}
+        for request in self.requests.values():
+            grouped[(request.model, request.provider)].append(request)
+        return [(m, grouped[(m["name"], m["provider"])]) for m in self.models]
+
+    def summary(self) -> str:
+        return f"{self.rows} result rows -> {len(self.requests)} unique requests ({self.prompts_built} prompts built)"
+
+
+def compile_plan(datasets: Dict[str, Iterable[Dict]], models: List[Dict], build_prompt: Callable[[str, Dict], str], done: Optional[Callable[[str, Dict, str], bool]] = None) -> EvalPlan:
+    """Plan the requests for every (dataset, sample, model) row
+
+    Each sample's prompt is built once and shared by all models. A sample whose content also
+    appears in another dataset (e.g. a final sample that is also in raw) maps to the same request.
+    done(dataset_name, sample, model) marks rows that already have a result (resume) and are
+    left out of the plan.
+    """
+    # A model listed more than once in the config is evaluated once
+    unique_models = {}
+    for m in models:
+        unique_models.setdefault((m["name"], m["provider"]), m)
+    models = list(unique_models.values())
+    plan = EvalPlan(models)
+    for dataset_name, samples in datasets.items():
+        for sample in samples:
+            pending = [m for m in models if done is None or not done(dataset_name, sample, m["name"])]
+            if not pending:
+                continue
+            prompt = build_prompt(sample["task_id"], sample)
+            plan.prompts_built += 1
+            for m in pending:
+                plan.add(dataset_name, sample, m["name"], m["provider"], prompt)
+    return plan
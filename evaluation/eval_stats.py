@@ -0,0 +1,264 @@
+# Vectorized evaluation statistics: accuracy / parse rate per task and per (model, task) with
+# bootstrap confidence intervals, and paired McNemar / permutation tests between two models
+#
+# Rows are converted to integer-coded NumPy arrays once. Every resampling step works on
+# per-group counts rather than on rows, so its cost does not grow with the number of rows:
+# - bootstrapping the mean of n Bernoulli outcomes with k successes is exactly Binomial(n, k/n) / n
+# - a paired bootstrap resamples the (both right, only A, only B, both wrong) counts multinomially
+# - a sign-flip permutation of paired differences only moves the discordant pairs, so the permuted
+#   statistic is 2 * Binomial(discordant, 1/2) - discordant
+import csv
+import math
+from itertools import combinations
+from statistics import NormalDist
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def _codes(values: Iterable[str], index: Dict[str, int]) -> List[int]:
+    return [index.setdefault(value, len(index)) for value in values]
+
+
+# Columns needed to build ResultArrays from a results store table
+STATS_COLUMNS = ["sample_id", "task_id", "model", "model_used", "correct", "parsed"]
+
+
+class ResultArrays:
+    """Result rows as parallel integer-coded arrays
+
+    model_idx is the evaluated model (each sample appears once per model, used for pairing);
+    used_idx is the model that actually answered (model_used), used for attributed accuracy.
+    """
+
+    def __init__(self, samples: List[str], tasks: List[str], models: List[str], sample_idx, task_idx, model_idx, used_idx, correct, parsed):
+        self.samples = samples
+        self.tasks = tasks
+        self.models = models
+        self.sample_idx = np.asarray(sample_idx, dtype=np.int64)
+        self.task_idx = np.asarray(task_idx, dtype=np.int64)
+        self.model_idx = np.asarray(model_idx, dtype=np.int64)
+        self.used_idx = np.asarray(used_idx, dtype=np.int64)
+        self.correct = np.asarray(correct, dtype=bool)
+        self.parsed = np.asarray(parsed, dtype=bool)
+        self._outcomes: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.correct)
+
+    def outcomes(self) -> np.ndarray:
+        """[models, samples] correctness of each evaluated model: 1 / 0, or -1 where it has no row (built once)"""
+        if self._outcomes is None:
+            self._outcomes = np.full((len(self.models), len(self.samples)), -1, dtype=np.int8)
+            self._outcomes[self.model_idx, self.sample_idx] = self.correct
+        return self._outcomes
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> "ResultArrays":
+        rows = list(rows)
+        samples, tasks, models = {}, {}, {}
+        sample_idx = _codes((row["sample_id"] for row in rows), samples)
+        task_idx = _codes((row["task_id"] for row in rows), tasks)
+        model_idx = _codes((row["model"] for row in rows), models)
+        used_idx = _codes((row.get("model_used") or row["model"] for row in rows), models)
+        return cls(
+            list(samples), list(tasks), list(models), sample_idx, task_idx, model_idx, used_idx,
+            [bool(row["correct"]) for row in rows], [bool(row["parsed"]) for row in rows],
+        )
+
+    @classmethod
+    def from_table(cls, table) -> "ResultArrays":
+        """From a pyarrow Table with STATS_COLUMNS (see results_store.load_results_store), without Python loops"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        def encode(column, dictionary=None):
+            if dictionary is None:
+                encoded = pc.dictionary_encode(column).combine_chunks()
+                return encoded.dictionary.to_pylist(), encoded.indices.to_numpy(zero_copy_only=False)
+            return dictionary, pc.index_in(column, value_set=pa.array(dictionary)).to_numpy(zero_copy_only=False)
+
+        samples, sample_idx = encode(table.column("sample_id"))
+        tasks, task_idx = encode(table.column("task_id"))
+        used = pc.coalesce(table.column("model_used"), table.column("model"))
+        models = pc.unique(pa.chunked_array(table.column("model").chunks + used.chunks, type=pa.string())).to_pylist()
+        _, model_idx = encode(table.column("model"), models)
+        _, used_idx = encode(used, models)
+        return cls(
+            samples, tasks, models, sample_idx, task_idx, model_idx, used_idx,
+            table.column("correct").to_numpy(zero_copy_only=False), table.column("parsed").to_numpy(zero_copy_only=False),
+        )
+
+    @classmethod
+    def from_csv(cls, paths: Iterable[str]) -> "ResultArrays":
+        """Load one or more results CSVs (as written by the evaluator) column by column"""
+        samples, tasks, models = {}, {}, {}
+        columns = {name: [] for name in ("sample", "task", "model", "used", "correct", "parsed")}
+        for path in paths:
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if not row.get("sample_id") or row.get("correct") is None or row.get("parsed") is None:
+                        continue  # line cut off by a crash
+                    columns["sample"].append(samples.setdefault(row["sample_id"], len(samples)))
+                    columns["task"].append(tasks.setdefault(row["task_id"], len(tasks)))
+                    columns["model"].append(models.setdefault(row["model"], len(models)))
+                    columns["used"].append(models.setdefault(row.get("model_used") or row["model"], len(models)))
+                    columns["correct"].append(row["correct"] == "True")
+                    columns["parsed"].append(row["parsed"] == "True")
+        return cls(
+            list(samples), list(tasks), list(models),
+            columns["sample"], columns["task"], columns["model"], columns["used"], columns["correct"], columns["parsed"],
+        )
+
+
+def bootstrap_ci(successes, totals, resamples: int = 2000, confidence: float = 0.95, rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap CI of the accuracy of every group at once (arrays of shape [groups])"""
+    rng = rng or np.random.default_rng()
+    successes = np.asarray(successes, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    safe_totals = np.maximum(totals, 1)
+    draws = rng.binomial(totals[:, None], (successes / safe_totals)[:, None], size=(len(totals), resamples)) / safe_totals[:, None]
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(draws, [tail, 100 - tail], axis=1)
+    return low, high
+
+
+def stratified_interval(successes, totals, weights, confidence: float = 0.95) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Task-weighted accuracy per model with a closed-form interval, for arrays of shape [models, tasks]
+
+    The estimate is the observed stratified rate, sum of weight * k / n over the tasks (weights
+    renormalized over the tasks that have samples; NaN for a model without any). The interval is a
+    normal approximation of the stratified Jeffreys posterior: each (model, task) cell gets a
+    Beta(k + 1/2, n - k + 1/2) posterior, and the weighted posterior means and variances are combined
+    (clipped to [0, 1]). Unlike a bootstrap, a cell with 5/5 correct or no samples yet still has a
+    wide interval. Returns (estimate, low, high), each of shape [models].
+    """
+    successes = np.asarray(successes, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    alpha, beta = successes + 0.5, totals - successes + 0.5
+    mean = alpha / (alpha + beta)
+    variance = alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1))
+    center = mean @ weights
+    half_width = NormalDist().inv_cdf(1 - (1 - confidence) / 2) * np.sqrt(variance @ weights ** 2)
+    observed = np.where(totals > 0, weights, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        estimate = (successes / np.maximum(totals, 1) * observed).sum(axis=1) / observed.sum(axis=1)
+    return estimate, np.clip(center - half_width, 0.0, 1.0), np.clip(center + half_width, 0.0, 1.0)
+
+
+def group_table(arrays: ResultArrays, by: str = "model_task", resamples: int = 2000, confidence: float = 0.95, rng: Optional[np.random.Generator] = None) -> List[Dict]:
+    """Accuracy, parse rate and bootstrap CI per group
+
+    by is "task", "model" or "model_task"; models are the ones that answered (model_used).
+    """
+    n_tasks = max(len(arrays.tasks), 1)
+    if by == "task":
+        group = arrays.task_idx
+    elif by == "model":
+        group = arrays.used_idx
+    else:
+        group = arrays.used_idx * n_tasks + arrays.task_idx
+    size = (len(arrays.models) * n_tasks) if by == "model_task" else (len(arrays.tasks) if by == "task" else len(arrays.models))
+    totals = np.bincount(group, minlength=size)
+    correct = np.bincount(group, weights=arrays.correct, minlength=size).astype(np.int64)
+    parsed = np.bincount(group, weights=arrays.parsed, minlength=size).astype(np.int64)
+    # Codes are assigned in first-seen order, so this lists models and tasks in the order of the rows
+    present = np.flatnonzero(totals)
+    low, high = bootstrap_ci(correct[present], totals[present], resamples, confidence, rng)
+
+    table = []
+    for i, g in enumerate(present):
+        entry = {"total": int(totals[g]), "correct": int(correct[g]), "parsed": int(parsed[g]),
+                 "accuracy": float(correct[g] / totals[g]), "parse_rate": float(parsed[g] / totals[g]),
+                 "ci_low": float(low[i]), "ci_high": float(high[i])}
+        if by == "task":
+            entry["task_id"] = arrays.tasks[g]
+        elif by == "model":
+            entry["model"] = arrays.models[g]
+        else:
+            entry["model"] = arrays.models[g // n_tasks]
+            entry["task_id"] = arrays.tasks[g % n_tasks]
+        table.append(entry)
+    return table
+
+
+def mcnemar_p(only_a: int, only_b: int) -> float:
+    """Two-sided McNemar p-value: exact binomial for few discordant pairs, chi-square (continuity corrected) otherwise"""
+    discordant = only_a + only_b
+    if discordant == 0:
+        return 1.0
+    if discordant <= 1000:
+        k = min(only_a, only_b)
+        log_half = discordant * math.log(0.5)
+        tail = sum(math.exp(math.lgamma(discordant + 1) - math.lgamma(i + 1) - math.lgamma(discordant - i + 1) + log_half) for i in range(k + 1))
+        return min(1.0, 2 * tail)
+    chi2 = (abs(only_a - only_b) - 1) ** 2 / discordant
+    return math.erfc(math.sqrt(chi2 / 2))
+
+
+def paired_test(arrays: ResultArrays, model_a: str, model_b: str, resamples: int = 10000, confidence: float = 0.95, rng: Optional[np.random.Generator] = None) -> Optional[Dict]:
+    """Compare two evaluated models on the samples both have a result for
+
+    Returns accuracies, their difference with a paired bootstrap CI, the McNemar p-value and a
+    sign-flip permutation p-value, or None if the models share no samples.
+    """
+    rng = rng or np.random.default_rng()
+    outcomes = arrays.outcomes()
+    a = outcomes[arrays.models.index(model_a)]
+    b = outcomes[arrays.models.index(model_b)]
+    shared = (a >= 0) & (b >= 0)
+    n = int(shared.sum())
+    if n == 0:
+        return None
+    a, b = a[shared].astype(bool), b[shared].astype(bool)
+    counts = np.array([np.sum(a & b), np.sum(a & ~b), np.sum(~a & b), np.sum(~a & ~b)])
+    only_a, only_b = int(counts[1]), int(counts[2])
+    diff = (only_a - only_b) / n
+
+    draws = rng.multinomial(n, counts / n, size=resamples)
+    diffs = (draws[:, 1] - draws[:, 2]) / n
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(diffs, [tail, 100 - tail])
+
+    discordant = only_a + only_b
+    permuted = 2 * rng.binomial(discordant, 0.5, size=resamples) - discordant
+    permutation_p = (np.sum(np.abs(permuted) >= abs(only_a - only_b)) + 1) / (resamples + 1)
+
+    return {
+        "model_a": model_a, "model_b": model_b, "shared": n,
+        "accuracy_a": float((counts[0] + counts[1]) / n), "accuracy_b": float((counts[0] + counts[2]) / n),
+        "diff": diff, "diff_ci_low": float(low), "diff_ci_high": float(high),
+        "only_a": only_a, "only_b": only_b,
+        "mcnemar_p": mcnemar_p(only_a, only_b), "permutation_p": float(permutation_p),
+    }
+
+
+def print_stats_report(arrays: ResultArrays, resamples: int = 2000, confidence: float = 0.95, permutation_resamples: int = 10000, pairs: Optional[List[Tuple[str, str]]] = None, seed: Optional[int] = 0):
+    """Per-task and per-model-per-task tables with CIs, then paired tests (all model pairs by default)"""
+    if not len(arrays):
+        return
+    rng = np.random.default_rng(seed)
+    level = f"{confidence:.0%} CI"
+
+    print("\n📊 Per-task Statistics:")
+    for s in group_table(arrays, "task", resamples, confidence, rng):
+        print(f"  {s['task_id']}: {s['accuracy'] * 100:.1f}% accuracy [{level} {s['ci_low'] * 100:.1f}-{s['ci_high'] * 100:.1f}], "
+              f"{s['parse_rate'] * 100:.1f}% parse rate ({s['correct']}/{s['total']})")
+
+    print("\n📊 Per-model-per-task Statistics:")
+    for s in group_table(arrays, "model_task", resamples, confidence, rng):
+        print(f"  {s['model']} - {s['task_id']}: {s['accuracy'] * 100:.1f}% accuracy [{level} {s['ci_low'] * 100:.1f}-{s['ci_high'] * 100:.1f}], "
+              f"{s['parse_rate'] * 100:.1f}% parse rate ({s['correct']}/{s['total']})")
+
+    evaluated = [arrays.models[i] for i in np.flatnonzero(np.bincount(arrays.model_idx))]
+    pairs = pairs if pairs is not None else list(combinations(evaluated, 2))
+    results = [r for r in (paired_test(arrays, a, b, permutation_resamples, confidence, rng) for a, b in pairs if a in arrays.models and b in arrays.models) if r]
+    if not results:
+        return
+    print(f"\n📊 Paired model comparisons (shared samples; diff = A - B with {level}):")
+    for r in results:
+        significant = "❗" if min(r["mcnemar_p"], r["permutation_p"]) < 1 - confidence else "  "
+        print(f"  {significant}{r['model_a']} vs {r['model_b']}: {r['accuracy_a'] * 100:.1f}% vs {r['accuracy_b'] * 100:.1f}% "
+              f"(diff {r['diff'] * 100:+.1f} [{r['diff_ci_low'] * 100:+.1f}, {r['diff_ci_high'] * 100:+.1f}], n={r['shared']}, "
+              f"only A {r['only_a']} / only B {r['only_b']}; McNemar p={r['mcnemar_p']:.3g}, permutation p={r['permutation_p']:.3g})")
@@ -0,0 +1,149 @@
+# Re-score stored evaluation outputs with another answer parser version, without calling any model
+#
+#   python evaluation/rescore.py --store evaluation_results_*_json.parquet [--parser-version 2] [--write]
+#
+# Every Parquet part file of the given results stores is re-parsed in a worker process. The report
+# shows, per (model, task), how accuracy and parse rate change and how many verdicts flipped.
+# With --write the part files are rewritten in place (correct / parsed / parsed_answer /
+# parser_version) and the CSV export next to each store is regenerated.
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generation"))
+from answer_parsing import PARSER_VERSION, PARSERS, grade_answer
+from eval_packing import split_packed_output
+from results_store import export_csv, store_csv_path
+
+COUNTERS = ("rows", "skipped", "old_correct", "new_correct", "old_parsed", "new_parsed",
+            "wrong_to_right", "right_to_wrong", "unparsed_to_parsed", "parsed_to_unparsed")
+
+
+def _partition(path: str, name: str) -> Optional[str]:
+    for part in path.split(os.sep):
+        if part.startswith(f"{name}="):
+            return unquote(part[len(name) + 1:])
+    return None
+
+
+def _output_for_row(raw_output: Optional[str], pack_size: Optional[int], qid: Optional[str]) -> Tuple[Optional[str], bool]:
+    """(output to parse, usable); packed rows are cut out of the whole packed answer by question id"""
+    if raw_output is None:
+        return None, False  # backfilled from a CSV, nothing to re-parse
+    if qid:
+        return split_packed_output(raw_output, pack_size)[int(qid[1:]) - 1], True
+    if (pack_size or 1) > 1:
+        return None, False  # packed before question ids were stored
+    return raw_output, True
+
+
+def rescore_file(path: str, version: int, write: bool, examples: int) -> Tuple[Dict[str, int], List[Dict]]:
+    """Re-parse one part file; returns its change counters and up to `examples` changed verdicts"""
+    table = pq.read_table(path)
+    task_id = _partition(path, "task_id")
+    column = lambda name: table.column(name).to_pylist() if name in table.column_names else [None] * table.num_rows
+    raw_outputs, expected = column("raw_output"), column("expected_answer")
+    pack_sizes, question_ids = column("pack_size"), column("question_id")
+    old_correct, old_parsed, old_answer, old_version = column("correct"), column("parsed"), column("parsed_answer"), column("parser_version")
+
+    counts = dict.fromkeys(COUNTERS, 0)
+    changed = []
+    new_correct, new_parsed, new_answer, new_version = list(old_correct), list(old_parsed), list(old_answer), list(old_version)
+    for i in range(table.num_rows):
+        counts["rows"] += 1
+        output, usable = _output_for_row(raw_outputs[i], pack_sizes[i], question_ids[i])
+        if usable and expected[i] is not None:
+            answer, correct, parsed = grade_answer(task_id, output, expected[i], version)
+            new_correct[i], new_parsed[i] = bool(correct), parsed
+            new_answer[i], new_version[i] = None if answer is None else str(answer), version
+        else:
+            counts["skipped"] += 1
+        counts["old_correct"] += bool(old_correct[i])
+        counts["new_correct"] += bool(new_correct[i])
+        counts["old_parsed"] += bool(old_parsed[i])
+        counts["new_parsed"] += bool(new_parsed[i])
+        counts["wrong_to_right"] += not old_correct[i] and bool(new_correct[i])
+        counts["right_to_wrong"] += bool(old_correct[i]) and not new_correct[i]
+        counts["unparsed_to_parsed"] += not old_parsed[i] and bool(new_parsed[i])
+        counts["parsed_to_unparsed"] += bool(old_parsed[i]) and not new_parsed[i]
+        if len(changed) < examples and (old_correct[i], old_parsed[i]) != (new_correct[i], new_parsed[i]):
+            changed.append({"sample_id": table.column("sample_id")[i].as_py(), "model": _partition(path, "model"), "task_id": task_id,
+                            "raw_output": raw_outputs[i], "old": (old_answer[i], old_correct[i]), "new": (new_answer[i], new_correct[i])})
+
+    if write:
+        for name, values, type_ in (("correct", new_correct, pa.bool_()), ("parsed", new_parsed, pa.bool_()),
+                                    ("parsed_answer", new_answer, pa.string()), ("parser_version", new_version, pa.int32())):
+            array = pa.array(values, type=type_)
+            if name in table.column_names:
+                table = table.set_column(table.column_names.index(name), name, array)
+            else:
+                table = table.append_column(name, array)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    return counts, changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", type=str, nargs="+", required=True, help="Results store directories (globs allowed), e.g. evaluation_results_*_json.parquet")
+    parser.add_argument("--parser-version", type=int, default=PARSER_VERSION, choices=sorted(PARSERS), help="answer_parsing version to apply (default: current)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (one part file at a time each)")
+    parser.add_argument("--write", action="store_true", help="Rewrite the stores (and their CSV exports) with the new verdicts; otherwise only report")
+    parser.add_argument("--report", type=str, default=None, help="Write the per-(model, task) change report to this CSV")
+    parser.add_argument("--examples", type=int, default=5, help="Changed verdicts to print")
+    args = parser.parse_args()
+
+    stores = sorted({path for pattern in args.store for path in glob.glob(pattern) if os.path.isdir(path)})
+    files = sorted(path for store in stores for path in glob.glob(os.path.join(store, "**", "*.parquet"), recursive=True))
+    if not files:
+        parser.error(f"no Parquet files found under {args.store}")
+    print(f"🔁 Re-scoring {len(files)} files from {len(stores)} stores with parser v{args.parser_version} ({args.workers} workers)"
+          + ("" if args.write else " [dry run]"))
+
+    totals: Dict[Tuple[str, str], Dict[str, int]] = {}
+    examples = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(rescore_file, files, [args.parser_version] * len(files), [args.write] * len(files), [args.examples] * len(files))
+        for path, (counts, changed) in zip(files, results):
+            group = totals.setdefault((_partition(path, "model"), _partition(path, "task_id")), dict.fromkeys(COUNTERS, 0))
+            for name, value in counts.items():
+                group[name] += value
+            examples.extend(changed[:args.examples - len(examples)])
+
+    print("\n📊 Verdict changes per model and task:")
+    report = []
+    for (model, task_id), c in sorted(totals.items()):
+        n = c["rows"]
+        entry = {"model": model, "task_id": task_id, **c,
+                 "old_accuracy": c["old_correct"] / n, "new_accuracy": c["new_correct"] / n,
+                 "old_parse_rate": c["old_parsed"] / n, "new_parse_rate": c["new_parsed"] / n}
+        report.append(entry)
+        print(f"  {model} - {task_id}: accuracy {entry['old_accuracy']:.1%} -> {entry['new_accuracy']:.1%}, "
+              f"parse rate {entry['old_parse_rate']:.1%} -> {entry['new_parse_rate']:.1%} "
+              f"(+{c['wrong_to_right']}/-{c['right_to_wrong']} correct, +{c['unparsed_to_parsed']}/-{c['parsed_to_unparsed']} parsed, "
+              f"{c['skipped']} without raw output, {n} rows)")
+    if examples:
+        print("\n🔎 Examples of changed verdicts:")
+        for e in examples:
+            print(f"  {e['sample_id']} | {e['model']} | {e['task_id']}: {e['old']} -> {e['new']} | {str(e['raw_output'])[:120]!r}")
+
+    if args.report:
+        with open(args.report, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(report[0].keys()))
+            writer.writeheader()
+            writer.writerows(report)
+        print(f"\n📄 Saved report to {args.report}")
+    if args.write:
+        for store in stores:
+            csv_path = store_csv_path(store)
+            export_csv(store, csv_path)
+            print(f"📄 Rewrote {store} and exported {csv_path}")
@@ -0,0 +1,178 @@
+# Columnar results store: every result row with its raw output, parsed and expected answer,
+# latency and token usage, written as Parquet partitioned by model and task
+# (<store>/model=<model>/task_id=<task>/part-*.parquet, hive layout, names URI-encoded)
+import csv
+import os
+import shutil
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The Parquet results store requires the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+# Columns of the CSV export: the original six first, in their original order, for positional
+# readers; new columns only go at the end
+CSV_FIELDS = ["sample_id", "task_id", "model", "provider", "correct", "parsed", "model_used", "timed_out", "errored"]
+
+# Column name -> pyarrow type name; rows missing a column (e.g. backfilled from a CSV) get nulls
+STORE_COLUMNS = {
+    "sample_id": "string",
+    "task_id": "string",
+    "model": "string",
+    "model_used": "string",
+    "provider": "string",
+    "correct": "bool_",
+    "parsed": "bool_",
+    "timed_out": "bool_",
+    # The request failed with an error other than a timeout (no output); --resume sends it again
+    "errored": "bool_",
+    "parsed_answer": "string",
+    "expected_answer": "string",
+    "raw_output": "string",
+    # Packed rows: the question's id in the prompt (raw_output is the whole packed answer)
+    "question_id": "string",
+    # answer_parsing version that set parsed_answer / correct / parsed (rescore.py can change it)
+    "parser_version": "int32",
+    # Latency and usage belong to the request; rows sharing a request_id (dedup, packing) share them
+    "request_id": "string",
+    "pack_size": "int32",
+    "latency_s": "float64",
+    "prompt_tokens": "int64",
+    "completion_tokens": "int64",
+    "total_tokens": "int64",
+}
+PARTITION_COLUMNS = ["model", "task_id"]
+
+
+def store_schema():
+    pa = _pyarrow()
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in STORE_COLUMNS.items()])
+
+
+def results_store_path(csv_path: str) -> str:
+    """Store directory next to the CSV export: evaluation_results_final_json.csv -> evaluation_results_final_json.parquet/"""
+    return f"{os.path.splitext(csv_path)[0]}.parquet"
+
+
+def store_csv_path(store_path: str) -> str:
+    """The CSV export next to a store (inverse of results_store_path)"""
+    return f"{os.path.splitext(store_path.rstrip(os.sep))[0]}.csv"
+
+
+class ParquetResultStore:
+    """Buffers rows and writes them as a new Parquet part per partition every flush_rows rows and on close
+
+    Without keep=True an existing store at path is removed first (like the CSV, which is rewritten).
+    Rows still buffered when the process is killed are lost here but are in the CSV; a resumed run
+    backfills them with backfill().
+    """
+
+    def __init__(self, path: str, keep: bool = False, flush_rows: int = 5000):
+        self.pa = _pyarrow()
+        self.path = path
+        self.flush_rows = flush_rows
+        self.schema = store_schema()
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        if not keep and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, row: Dict):
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_rows:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        table = self.pa.Table.from_pylist([{name: row.get(name) for name in STORE_COLUMNS} for row in rows], schema=self.schema)
+        self._write(table, self.path)
+
+    def _write(self, table, path: str):
+        self.pa.dataset.write_dataset(
+            table, path, format="parquet",
+            partitioning=PARTITION_COLUMNS, partitioning_flavor="hive",
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+    def keys(self) -> Set[Tuple[str, str]]:
+        """(sample_id, model) of every row already written"""
+        table = load_results_store(self.path, columns=["sample_id", "model"])
+        return set(zip(table.column("sample_id").to_pylist(), table.column("model").to_pylist()))
+
+    def drop(self, keys: Set[Tuple[str, str]]) -> int:
+        """Remove the rows of these (sample_id, model) pairs (rows a resumed run sends again)
+
+        Parts are immutable, so the kept rows are rewritten into a new directory that replaces the store.
+        """
+        if not keys:
+            return 0
+        table = load_results_store(self.path)
+        pairs = zip(table.column("sample_id").to_pylist(), table.column("model").to_pylist())
+        kept = table.filter(self.pa.array([pair not in keys for pair in pairs]))
+        dropped = table.num_rows - kept.num_rows
+        if dropped:
+            tmp_path = f"{self.path.rstrip(os.sep)}.tmp"
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+            os.makedirs(tmp_path)
+            self._write(kept.select(list(STORE_COLUMNS)), tmp_path)
+            shutil.rmtree(self.path)
+            os.rename(tmp_path, self.path)
+        return dropped
+
+    def backfill(self, rows: Iterable[Dict]) -> int:
+        """Write the rows (e.g. resumed CSV rows) that the store does not have yet"""
+        present = self.keys()
+        missing = [row for row in rows if (row["sample_id"], row["model"]) not in present]
+        for row in missing:
+            self.write(row)
+        return len(missing)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+
+
+def load_results_store(path: str, models: Optional[List[str]] = None, task_ids: Optional[List[str]] = None, columns: Optional[List[str]] = None):
+    """Read a results store as a pyarrow Table
+
+    Filters on model / task_id only open the matching partition directories, and columns limits
+    which columns are read (leave out raw_output for fast leaderboard loads).
+    """
+    pa = _pyarrow()
+    ds = pa.dataset
+    if not os.path.isdir(path):
+        return store_schema().empty_table().select(columns) if columns else store_schema().empty_table()
+    partitioning = ds.partitioning(pa.schema([("model", pa.string()), ("task_id", pa.string())]), flavor="hive")
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning, schema=store_schema())
+    condition = None
+    for name, values in (("model", models), ("task_id", task_ids)):
+        if values:
+            clause = ds.field(name).isin(values)
+            condition = clause if condition is None else condition & clause
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def export_csv(store_path: str, csv_path: str):
+    """Rewrite the CSV export (CSV_FIELDS only) from the store"""
+    table = load_results_store(store_path, columns=CSV_FIELDS)
+    tmp_path = f"{csv_path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(table.to_pylist())
+    os.replace(tmp_path, csv_path)
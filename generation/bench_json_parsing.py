@@ -0,0 +1,51 @@
+# Check and benchmark extract_json against the collected LLM failure cases
+import argparse
+import json
+import os
+import time
+
+from json_parsing import extract_json
+
+CASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract_json_cases.jsonl")
+
+
+def load_cases(path: str = CASES_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_case(case) -> bool:
+    """케이스 하나를 파싱하고 기대값(또는 실패 기대)과 일치하는지 확인"""
+    try:
+        result = extract_json(case["raw"])
+    except (json.JSONDecodeError, TypeError):
+        return case.get("error", False)
+    return not case.get("error", False) and result == case["expected"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=str, default=CASES_PATH)
+    parser.add_argument("--repeat", type=int, default=1000, help="Timing iterations over the whole corpus")
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases)
+
+    failed = [c["id"] for c in cases if not check_case(c)]
+    print(f"✅ {len(cases) - len(failed)}/{len(cases)} cases passed")
+    for case_id in failed:
+        print(f"  ❌ {case_id}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for case in cases:
+            try:
+                extract_json(case["raw"])
+            except (json.JSONDecodeError, TypeError):
+                pass
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (args.repeat * len(cases)) * 1e6
+    print(f"⏱️ {per_call:.1f} µs per extract_json call ({args.repeat} x {len(cases)} cases)")
+
+    if failed:
+        raise SystemExit(1)
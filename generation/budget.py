@@ -0,0 +1,171 @@
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# -- 모델별 가격 (USD / 1M tokens, (input, output)) --
+# 모델 이름의 가장 긴 접두사로 찾고, 없으면 DEFAULT_PRICE를 사용 (config의 model_prices로 덮어쓰기 가능)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "grok-3": (3.00, 15.00),
+    "llama-3.3-70b": (0.59, 0.79),
+}
+DEFAULT_PRICE = (2.50, 10.00)
+
+
+class BudgetExceeded(Exception):
+    """실행 전체 예산(토큰, 비용, 마감 시간)이 소진됨"""
+
+
+class SampleBudgetExceeded(Exception):
+    """샘플 하나가 허용된 LLM 호출 수를 넘김"""
+
+
+def model_price(model: str, prices: Optional[Dict[str, Tuple[float, float]]] = None) -> Tuple[float, float]:
+    """모델의 (input, output) 1M 토큰당 가격"""
+    table = dict(MODEL_PRICES)
+    if prices:
+        table.update({name: tuple(price) for name, price in prices.items()})
+    matches = [name for name in table if model.startswith(name)]
+    if not matches:
+        return DEFAULT_PRICE
+    return table[max(matches, key=len)]
+
+
+class RunBudget:
+    """실행 단위 예산: 토큰 수, 예상 비용, 마감 시간, 샘플당 호출 수
+
+    utils.set_budget()으로 등록하면 llm_call이 매 호출 전에 check()를 부르고,
+    provider 응답의 토큰 사용량을 record()로 보고합니다. 한도가 None이면 제한 없음.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None, deadline_minutes: Optional[float] = None, max_calls_per_sample: Optional[int] = None, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.deadline_minutes = deadline_minutes
+        self.max_calls_per_sample = max_calls_per_sample
+        self.prices = prices or {}
+
+        self.started = time.monotonic()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.calls = 0
+        self.by_task: Dict[str, Dict[str, float]] = {}
+
+        self.current_task: Optional[str] = None
+        self.sample_calls = 0
+        # 샘플이 시작/끝날 때마다 증가 - 호출 시작 때의 값과 다르면 그 호출의 샘플은 이미 끝난 것
+        self.sample_serial = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def elapsed_minutes(self) -> float:
+        return (time.monotonic() - self.started) / 60
+
+    def begin_sample(self, task_id: str):
+        self.current_task = task_id
+        self.sample_calls = 0
+        self.sample_serial += 1
+
+    def end_sample(self):
+        self.current_task = None
+        self.sample_calls = 0
+        self.sample_serial += 1
+
+    def record(self, model: str, input_tokens: int, output_tokens: int, sample: bool = True):
+        """LLM 호출 한 번의 토큰 사용량을 누적 (sample=False면 실행 전체 합계에만, 예: 샘플이 끝난 뒤 끝난 hedge 패자)"""
+        price_in, price_out = model_price(model, self.prices)
+        cost = (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost += cost
+        self.calls += 1
+        if not sample:
+            return
+        self.sample_calls += 1
+
+        if self.current_task is not None:
+            spent = self.by_task.setdefault(self.current_task, {"tokens": 0, "cost": 0.0, "calls": 0})
+            spent["tokens"] += input_tokens + output_tokens
+            spent["cost"] += cost
+            spent["calls"] += 1
+
+    def exhausted(self) -> Optional[str]:
+        """소진된 예산이 있으면 그 이유, 없으면 None"""
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return f"token budget exhausted ({self.tokens}/{self.max_tokens})"
+        if self.max_cost is not None and self.cost >= self.max_cost:
+            return f"cost budget exhausted (${self.cost:.2f}/${self.max_cost:.2f})"
+        if self.deadline_minutes is not None and self.elapsed_minutes() >= self.deadline_minutes:
+            return f"deadline reached ({self.elapsed_minutes():.1f}/{self.deadline_minutes} min)"
+        return None
+
+    def check(self):
+        """LLM 호출 직전에 불림. 예산이 소진되었으면 예외를 발생"""
+        reason = self.exhausted()
+        if reason:
+            raise BudgetExceeded(reason)
+        if self.max_calls_per_sample is not None and self.current_task is not None and self.sample_calls >= self.max_calls_per_sample:
+            raise SampleBudgetExceeded(f"sample used {self.sample_calls} calls (cap {self.max_calls_per_sample})")
+
+    def task_spend(self, task_id: str) -> Tuple[float, int]:
+        spent = self.by_task.get(task_id, {})
+        return spent.get("cost", 0.0), spent.get("tokens", 0)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "estimated_cost_usd": round(self.cost, 4),
+            "calls": self.calls,
+            "elapsed_minutes": round(self.elapsed_minutes(), 2),
+            "limits": {
+                "max_tokens": self.max_tokens,
+                "max_cost_usd": self.max_cost,
+                "deadline_minutes": self.deadline_minutes,
+                "max_calls_per_sample": self.max_calls_per_sample,
+            },
+            "by_task": {task: {"tokens": s["tokens"], "cost_usd": round(s["cost"], 4), "calls": s["calls"]} for task, s in self.by_task.items()},
+        }
+
+
+class SlotScheduler:
+    """여러 task의 생성 슬롯을 예산 사용량 기준으로 번갈아 배분하는 스케줄러
+
+    다음 슬롯은 지금까지 예산을 가장 적게 쓴 task에서 가져오므로, 검증에 계속 실패해
+    예산을 많이 쓰는 task는 자연히 뒤로 밀립니다. 호출 수 상한을 넘긴 샘플은 defer()로
+    보류 큐에 넣고, 새 슬롯이 모두 끝난 뒤 예산이 남아 있을 때만 한 번 더 시도합니다.
+    """
+
+    def __init__(self, tasks: List[str], slot_indices: List[int], budget: RunBudget):
+        self.budget = budget
+        self.order = list(tasks)
+        self.pending = {task: deque(slot_indices) for task in tasks}
+        self.deferred = deque()
+
+    def next(self) -> Optional[Tuple[str, int, bool]]:
+        """다음에 생성할 (task_id, slot_index, is_retry). 남은 슬롯이 없으면 None"""
+        ready = [task for task in self.order if self.pending[task]]
+        if ready:
+            task = min(ready, key=lambda t: (self.budget.task_spend(t), self.order.index(t)))
+            return task, self.pending[task].popleft(), False
+        if self.deferred:
+            task, index = self.deferred.popleft()
+            return task, index, True
+        return None
+
+    def defer(self, task_id: str, index: int):
+        self.deferred.append((task_id, index))
@@ -0,0 +1,86 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+
+class LLMTimeoutError(TimeoutError):
+    """LLM 호출이 제한 시간 안에 끝나지 않음"""
+
+
+class SampleDeadlineExceeded(LLMTimeoutError):
+    """샘플 하나에 할당된 전체 시간이 지남"""
+
+
+# 스레드별 샘플 마감 시각 (time.monotonic 기준)
+_state = threading.local()
+
+
+@contextmanager
+def sample_deadline(seconds: Optional[float]):
+    """블록 안의 모든 LLM 호출이 seconds 안에 끝나도록 마감 시각을 설정 (None이면 제한 없음)"""
+    previous = getattr(_state, "deadline", None)
+    if seconds is not None:
+        deadline = time.monotonic() + seconds
+        _state.deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _state.deadline = previous
+
+
+def remaining_time() -> Optional[float]:
+    deadline = getattr(_state, "deadline", None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def effective_timeout(timeout: Optional[float]) -> Optional[float]:
+    """호출별 timeout과 샘플 마감까지 남은 시간 중 작은 값. 마감이 지났으면 SampleDeadlineExceeded"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise SampleDeadlineExceeded("sample deadline exceeded")
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def call_with_timeout(fn: Callable[..., Any], seconds: Optional[float], *args, **kwargs) -> Any:
+    """fn을 별도 스레드에서 실행하고 seconds초 안에 끝나지 않으면 LLMTimeoutError를 발생
+
+    시간이 지나면 호출자는 바로 반환되고, 멈춘 요청은 데몬 스레드에 남아 SDK 자체
+    timeout으로 연결이 닫힐 때 정리됩니다. 그 요청이 나중에 끝나도 사용량은 호출을
+    시작한 샘플이 이미 끝났으면 예산에 보고되지 않습니다 (utils._record_usage).
+    샘플 마감 때문에 끊긴 경우에는 SampleDeadlineExceeded를 발생시킵니다.
+    """
+    if seconds is None:
+        return fn(*args, **kwargs)
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome["value"] = fn(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(seconds)
+    if worker.is_alive():
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise SampleDeadlineExceeded(f"sample deadline exceeded during call ({seconds:g}s)")
+        raise LLMTimeoutError(f"call timed out after {seconds:g}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def is_timeout_error(e: BaseException) -> bool:
+    """provider SDK의 timeout 예외(openai/anthropic APITimeoutError, httpx, google DeadlineExceeded 등)인지 여부"""
+    if isinstance(e, TimeoutError):
+        return True
+    name = type(e).__name__
+    return "Timeout" in name or name == "DeadlineExceeded"
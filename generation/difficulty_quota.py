@@ -0,0 +1,96 @@
+from typing import Callable, Dict, List, Optional
+
+# 쉬운 것부터 어려운 순서 (prompt_templates의 difficulty_level 값)
+DIFFICULTY_LADDER = ["easy", "medium", "hard", "extreme", "impossible"]
+
+
+def quota_counts(shares: Dict[str, float], n: int) -> Dict[str, int]:
+    """난이도별 비율을 n개 기준 목표 개수로 변환 (최대 잔여 방식으로 합계를 n에 맞춤)
+
+    shares 값의 합이 1이 아니어도 비율로 정규화합니다. 없는 난이도의 목표는 0입니다.
+    """
+    unknown = set(shares) - set(DIFFICULTY_LADDER)
+    if unknown:
+        raise ValueError(f"Unknown difficulty levels: {sorted(unknown)}")
+    total = sum(shares.values())
+    if total <= 0:
+        raise ValueError("difficulty quota shares must sum to a positive number")
+
+    exact = {level: n * shares.get(level, 0) / total for level in DIFFICULTY_LADDER}
+    counts = {level: int(value) for level, value in exact.items()}
+    by_remainder = sorted(DIFFICULTY_LADDER, key=lambda level: (-(exact[level] - counts[level]), DIFFICULTY_LADDER.index(level)))
+    for level in by_remainder[:n - sum(counts.values())]:
+        counts[level] += 1
+    return counts
+
+
+class DifficultyQuota:
+    """task별 최종 데이터셋의 난이도 구성 목표와 현재까지 채택된 개수를 추적하는 컨트롤러
+
+    새 샘플은 아직 목표가 남은 가장 쉬운 난이도에서 시작하고, 난이도를 올릴 때는
+    목표가 남은 더 어려운 난이도로만 올립니다. 더 올릴 곳이 없으면 현재 난이도에서
+    채택하고, 현재 난이도가 이미 가득 찼으면 목표가 남은 더 어려운 난이도로 옮기며,
+    그런 난이도가 없을 때만 샘플을 중단합니다.
+
+    shared가 주어지면(작업 큐 모드) 채택 개수를 이 프로세스가 아니라 shared(task_id)가
+    돌려주는 전체 워커 합계로 판단합니다. 이때도 동시에 생성 중인 샘플만큼은 목표를
+    넘을 수 있습니다.
+    """
+
+    def __init__(self, targets: Dict[str, Dict[str, int]], shared: Optional[Callable[[str], Dict[str, int]]] = None):
+        self.targets = targets
+        self.shared = shared
+        self.accepted = {task_id: {level: 0 for level in DIFFICULTY_LADDER} for task_id in targets}
+
+    def accepted_counts(self, task_id: str) -> Dict[str, int]:
+        if self.shared is None:
+            return self.accepted[task_id]
+        counts = self.shared(task_id)
+        return {level: counts.get(level, 0) for level in DIFFICULTY_LADDER}
+
+    def remaining(self, task_id: str, level: str) -> int:
+        if task_id not in self.targets:
+            return 1  # 목표가 없는 task는 제한하지 않음
+        return self.targets[task_id].get(level, 0) - self.accepted_counts(task_id)[level]
+
+    def is_full(self, task_id: str, level: str) -> bool:
+        return self.remaining(task_id, level) <= 0
+
+    def open_levels(self, task_id: str) -> List[str]:
+        return [level for level in DIFFICULTY_LADDER if not self.is_full(task_id, level)]
+
+    def initial_level(self, task_id: str, default: str = "easy") -> Optional[str]:
+        """새 샘플의 시작 난이도. default가 가득 찼으면 목표가 남은 가장 쉬운 난이도, 모두 찼으면 None"""
+        if not self.is_full(task_id, default):
+            return default
+        levels = self.open_levels(task_id)
+        return levels[0] if levels else None
+
+    def escalation_target(self, task_id: str, current: str, proposed: str) -> Optional[str]:
+        """난이도 증가 목표. proposed가 current보다 어렵고 목표가 남았으면 그대로,
+        아니면 current보다 어려운 난이도 중 목표가 남은 가장 쉬운 것. 없으면 None"""
+        rank = DIFFICULTY_LADDER.index(current)
+        if DIFFICULTY_LADDER.index(proposed) > rank and not self.is_full(task_id, proposed):
+            return proposed
+        for level in DIFFICULTY_LADDER[rank + 1:]:
+            if not self.is_full(task_id, level):
+                return level
+        return None
+
+    def record(self, task_id: str, level: str):
+        # shared 모드에서는 작업 큐가 완료 시점에 개수를 더함 (WorkQueue.complete)
+        if task_id in self.accepted:
+            self.accepted[task_id][level] += 1
+
+    def summary(self) -> Dict[str, Dict[str, str]]:
+        summary = {}
+        for task_id, levels in self.targets.items():
+            accepted = self.accepted_counts(task_id)
+            summary[task_id] = {level: f"{accepted[level]}/{target}" for level, target in levels.items() if target or accepted[level]}
+        return summary
+
+
+def build_quota(tasks: List[str], n: int, shares: Dict[str, float], overrides: Optional[Dict[str, Dict[str, float]]] = None, shared: Optional[Callable[[str], Dict[str, int]]] = None) -> DifficultyQuota:
+    """config의 난이도 비율(전체 기본값 + task별 덮어쓰기)로 DifficultyQuota 생성"""
+    overrides = overrides or {}
+    return DifficultyQuota({task_id: quota_counts(overrides.get(task_id, shares), n) for task_id in tasks}, shared=shared)
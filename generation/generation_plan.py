@@ -0,0 +1,73 @@
+import datetime
+import random
+import uuid
+from itertools import product
+from typing import Any, Dict, List
+
+from tasks_config import TASKS
+
+
+# -- Stratified generation plan --
+def build_generation_plan(task_id: str, n: int, seed: int = 0, example_prob: float = 0.5, factor_prob: float = 0.5) -> List[Dict[str, Any]]:
+    """샘플 슬롯마다 (topic, style, factor, use_example, use_factor) 셀을 미리 정하는 함수
+
+    topic x style x factor 조합은 seed로 섞은 순열을 반복해서 채우므로 조합별 개수 차이가
+    최대 1입니다. use_example / use_factor는 round(n * prob)개가 정확히 True가 되도록
+    할당합니다. 같은 (task_id, n, seed)면 항상 같은 계획이 나오므로, 워커 수와 관계없이
+    각 워커가 슬롯을 독립적으로 가져가도 전체 분포가 동일합니다.
+
+    Returns:
+        index 순서의 슬롯 목록. 각 슬롯은 index, topic, style, factor, use_example, use_factor 키를 가짐
+    """
+    config = TASKS[task_id]
+    rng = random.Random(f"{seed}:{task_id}:{n}")
+
+    cells = list(product(config["topics"], config["style"], config["factors"]))
+    assignments = []
+    while len(assignments) < n:
+        block = cells[:]
+        rng.shuffle(block)
+        assignments.extend(block)
+    assignments = assignments[:n]
+
+    # example / factor 사용 여부: 정확한 개수 할당 후, 둘의 조합도 균형이 맞도록 중첩해서 배분
+    n_example = round(n * example_prob)
+    n_factor_with_example = round(n_example * factor_prob)
+    n_factor_without_example = round((n - n_example) * factor_prob)
+    flags = (
+        [(True, True)] * n_factor_with_example
+        + [(True, False)] * (n_example - n_factor_with_example)
+        + [(False, True)] * n_factor_without_example
+        + [(False, False)] * (n - n_example - n_factor_without_example)
+    )
+    rng.shuffle(flags)
+
+    plan = []
+    for index, ((topic, style, factor), (use_example, use_factor)) in enumerate(zip(assignments, flags)):
+        plan.append({
+            "index": index,
+            "topic": topic,
+            "style": style,
+            "factor": factor,
+            "use_example": use_example,
+            "use_factor": use_factor,
+        })
+    return plan
+
+
+def worker_slot_indices(n: int, worker_index: int = 0, num_workers: int = 1) -> List[int]:
+    """n개 슬롯 중 worker_index번 워커가 맡을 슬롯 인덱스 (index % num_workers 기준)"""
+    if not 0 <= worker_index < num_workers:
+        raise ValueError(f"worker_index must be in [0, {num_workers}), got {worker_index}")
+    return [index for index in range(n) if index % num_workers == worker_index]
+
+
+# -- Globally unique sample ids --
+def new_run_id() -> str:
+    """실행 하나를 식별하는 id (시각 + 임의 접미사, 워커/머신 간 충돌 없음)"""
+    return f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6]}"
+
+
+def make_sample_id(task_id: str, run_id: str, index: int, fix_count: int) -> str:
+    """샘플 id: task, 실행, 슬롯, 수정 횟수로 구성 (예: T1_20250101120000a1b2c3_007_v2)"""
+    return f"{task_id}_{run_id}_{index:03d}_v{fix_count}"
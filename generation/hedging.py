@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class LatencyTracker:
+    """모델별 최근 호출 지연 시간(초)을 보관하고 분위수를 계산"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._latencies.get(model, ()))
+
+    def percentile(self, model: str, pct: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._latencies.get(model, ()))
+        if not values:
+            return None
+        index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[index]
+
+
+class HedgePolicy:
+    """느린 요청에 중복 요청(hedge)을 보내 꼬리 지연을 줄이는 정책
+
+    요청이 해당 모델 최근 지연의 percentile 분위수 안에 끝나지 않으면 같은 모델
+    (또는 models에 지정한 동등 모델)로 한 번 더 보내고 먼저 끝난 응답을 씁니다.
+    진 요청은 cancel 이벤트로 알려서 스트리밍 중이면 바로 닫게 합니다.
+    추가 비용을 제한하기 위해 hedge 요청 수는 전체 대상 호출의 max_rate 비율을 넘지 않습니다.
+    지연 기록이 min_samples개보다 적은 모델은 hedge하지 않습니다.
+    """
+
+    def __init__(self, roles: Optional[List[str]] = None, percentile: float = 95, min_samples: int = 20, max_rate: float = 0.05, models: Optional[Dict[str, str]] = None, window: int = 200):
+        self.roles = set(roles or ["teacher", "orchestrator"])
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.models = models or {}
+        self.latency = LatencyTracker(window)
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def applies_to(self, role: Optional[str]) -> bool:
+        return role in self.roles
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """hedge를 보낼 때까지 기다릴 시간. 기록이 부족하면 None (hedge 안 함)"""
+        if self.latency.count(model) < self.min_samples:
+            return None
+        return self.latency.percentile(model, self.percentile)
+
+    def _try_reserve_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_rate * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def call(self, model: str, invoke: Callable[[str, threading.Event], Any]) -> Tuple[Any, str, bool]:
+        """invoke(model, cancel)을 hedge 정책에 따라 실행
+
+        cancel은 요청마다 따로 만들어지며, 다른 요청이 먼저 성공하면 set됩니다.
+
+        Returns:
+            (result, model_used, hedged) - hedged는 hedge 요청이 먼저 끝났는지 여부
+        """
+        with self._lock:
+            self.calls += 1
+        delay = self.hedge_delay(model)
+        results = queue.Queue()
+        cancels: List[threading.Event] = []
+
+        def start(target: str, is_hedge: bool):
+            cancel = threading.Event()
+            cancels.append(cancel)
+            threading.Thread(target=run, args=(target, is_hedge, cancel), daemon=True).start()
+
+        def run(target: str, is_hedge: bool, cancel: threading.Event):
+            started = time.monotonic()
+            try:
+                value = invoke(target, cancel)
+            except BaseException as e:
+                results.put((False, e, target, is_hedge))
+                return
+            self.latency.record(target, time.monotonic() - started)
+            results.put((True, value, target, is_hedge))
+
+        start(model, False)
+        pending = 1
+        try:
+            first = results.get(timeout=delay) if delay is not None else results.get()
+        except queue.Empty:
+            first = None
+            if self._try_reserve_hedge():
+                hedge_model = self.models.get(model, model)
+                start(hedge_model, True)
+                pending += 1
+
+        # 먼저 성공한 응답을 사용하고, 나머지 요청은 cancel로 중단시킴 (스트리밍이 아니면 끝까지 실행된 뒤 버려짐)
+        error = None
+        while pending:
+            ok, value, target, is_hedge = first if first is not None else results.get()
+            first = None
+            pending -= 1
+            if ok:
+                if is_hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                for cancel in cancels:
+                    cancel.set()
+                return value, target, is_hedge
+            error = value
+        raise error
+
+    def summary(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
@@ -0,0 +1,331 @@
+import json
+import re
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+
+# -- Incremental JSON scanner for streamed responses --
+class JsonStreamScanner:
+    """스트리밍 응답에서 첫 번째로 완성되는 최상위 JSON 객체를 점진적으로 찾는 스캐너
+
+    문자열 내부의 중괄호와 이스케이프 문자를 구분하므로, 청크 경계가 어디에 있든
+    객체가 닫히는 시점을 정확히 알 수 있습니다.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1     # 첫 '{' 위치
+        self.end = -1       # 대응하는 '}' 다음 위치
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self) -> bool:
+        return self.end >= 0
+
+    def feed(self, chunk: str) -> bool:
+        """청크를 추가하고, 최상위 JSON 객체가 완성되었으면 True를 반환"""
+        if self.complete:
+            return True
+        self.text += chunk
+
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self.start < 0:
+                if ch == "{":
+                    self.start = i
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = i + 1
+                    self._pos = self.end
+                    return True
+        self._pos = len(text)
+        return False
+
+    def json_text(self) -> Optional[str]:
+        """완성된 JSON 객체 부분만 반환 (미완성이면 None)"""
+        if not self.complete:
+            return None
+        return self.text[self.start:self.end]
+
+
+def read_until_json(chunks: Iterable[str], close: Optional[Callable[[], None]] = None, prefix: str = "", cancel: Optional[threading.Event] = None) -> str:
+    """스트림 청크를 읽다가 첫 번째 최상위 JSON 객체가 완성되면 즉시 중단하는 함수
+
+    Args:
+        chunks: 텍스트 청크 iterable (provider 스트림에서 추출한 delta)
+        close: 조기 종료 시 스트림 연결을 닫는 함수
+        prefix: 스트림 앞에 붙일 텍스트 (예: assistant prefill "{")
+        cancel: set되면 다음 청크에서 읽기를 멈추고 스트림을 닫음 (예: hedge 경쟁에서 진 요청)
+
+    Returns:
+        지금까지 수신한 텍스트 (JSON 객체가 완성되었으면 닫는 중괄호까지)
+    """
+    scanner = JsonStreamScanner()
+    scanner.feed(prefix)
+    try:
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                break
+            if chunk and scanner.feed(chunk):
+                break
+    finally:
+        if close is not None:
+            close()
+
+    if scanner.complete:
+        return scanner.text[:scanner.end]
+    return scanner.text
+
+
+# -- Single-pass repairing JSON extractor --
+_FENCE_RE = re.compile(r"```(?:json|JSON)?[ \t]*\n?")
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_BARE_WORDS = {"true": "true", "false": "false", "null": "null",
+               "True": "true", "False": "false", "None": "null"}
+# 잘린 값의 접두어가 가리킬 수 있는 단어 (NaN/Infinity는 JSON 값이 아니므로 완성하지 않음)
+_PREFIX_WORDS = dict(_BARE_WORDS, NaN=None, Infinity=None)
+_MIN_LITERAL_PREFIX = 3  # 't', 'fa'처럼 짧은 접두어는 완성하지 않음 ('"approved": t'가 참이 되지 않도록)
+_MAX_START_CANDIDATES = 5
+
+
+def _complete_literal(prefix: str) -> Optional[str]:
+    """잘린 리터럴 접두어(예: 'fals')를 완성. 3글자 이상이고 가리키는 JSON 리터럴이 하나뿐일 때만 반환"""
+    if len(prefix) < _MIN_LITERAL_PREFIX:
+        return None
+    literals = {literal for word, literal in _PREFIX_WORDS.items() if word.startswith(prefix)}
+    if len(literals) == 1:
+        return literals.pop()
+    return None
+
+
+def _find_start(text: str) -> List[int]:
+    """JSON 시작 위치 후보 목록. 코드 블록 안의 JSON을 우선하고, 그 다음 본문의 '{' 순서"""
+    candidates = []
+    fence = _FENCE_RE.search(text)
+    if fence:
+        i = fence.end()
+        while i < len(text) and text[i] in " \t\r\n":
+            i += 1
+        if i < len(text) and text[i] in "{[":
+            candidates.append(i)
+
+    i = text.find("{")
+    while i >= 0 and len(candidates) < _MAX_START_CANDIDATES:
+        if i not in candidates:
+            candidates.append(i)
+        i = text.find("{", i + 1)
+    return candidates
+
+
+def _repair_from(text: str, start: int) -> Tuple[str, bool]:
+    """start 위치의 JSON 값을 한 번 훑으면서 흔한 LLM 결함을 고친 JSON 문자열을 만든다
+
+    처리하는 결함: 문자열 안의 제어 문자, 작은따옴표 문자열, 잘못된 이스케이프,
+    trailing comma, 따옴표 없는 키, Python 리터럴(True/False/None), 잘못 짝지어진
+    닫는 괄호, 잘린(truncated) 응답.
+
+    따옴표 없는 단어는 키 자리에서만 문자열이 된다. 값 자리의 단어는 리터럴이거나
+    응답 끝에서 잘린 리터럴의 3글자 이상인 명확한 접두어(예: 'fals' -> false)일 때만 받아들이고,
+    그 밖의 단어(NaN, yes 등)는 해당 키/값 쌍(배열이면 요소)을 통째로 버린다.
+
+    Returns:
+        (repaired_json, completed) - completed는 최상위 값이 정상적으로 닫혔는지 여부
+    """
+    out = []
+    stack = []              # 열린 컨테이너 ('{' 또는 '[')
+    starts = []             # 컨테이너별 현재 요소(키/값 쌍)가 시작된 출력 위치
+    quote = None            # 현재 문자열의 따옴표 (None이면 문자열 밖)
+    pending_comma = False   # 다음 유효 문자를 보고 출력 여부를 결정할 쉼표
+    safe = (0, [])          # 잘린 응답 복구용: 마지막으로 완결된 요소 뒤의 (출력 길이, 스택)
+    escaped_quotes = False  # {\"a\": 1}처럼 따옴표 전체가 이스케이프된 응답
+    n = len(text)
+    i = start
+
+    while i < n:
+        ch = text[i]
+
+        if quote is not None:
+            if ch == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                if nxt == '"' and escaped_quotes:
+                    out.append('"')
+                    quote = None
+                elif nxt == "'":
+                    out.append("'")
+                elif nxt == '"' and quote == "'":
+                    out.append('\\"')
+                elif nxt in _VALID_ESCAPES:
+                    out.append(ch + nxt)
+                else:
+                    out.append("\\\\" + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch < " " or ch == "\x7f":
+                out.append(" ")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in " \t\r\n":
+            i += 1
+            continue
+
+        if ch == "\\":
+            # 과하게 이스케이프된 응답의 문자열 밖 백슬래시는 무시
+            if i + 1 < n and text[i + 1] == '"':
+                escaped_quotes = True
+            i += 1
+            continue
+
+        if ch == ",":
+            pending_comma = True
+            i += 1
+            continue
+
+        if ch in "}]":
+            if not stack:
+                break
+            pending_comma = False
+            if out and out[-1] == ":":
+                out.append("null")
+            expected = "}" if ch == "}" else "]"
+            # 닫히지 않은 안쪽 컨테이너를 먼저 닫음 (예: {"a": [1, 2} )
+            while stack and ("}" if stack[-1] == "{" else "]") != expected:
+                out.append("}" if stack.pop() == "{" else "]")
+            if stack:
+                stack.pop()
+                out.append(expected)
+            del starts[len(stack):]
+            i += 1
+            if not stack:
+                return "".join(out), True
+            continue
+
+        if pending_comma:
+            pending_comma = False
+            if out and out[-1] not in "{[":
+                safe = (len(out), list(stack))
+                if starts:
+                    starts[-1] = len(out)
+                out.append(",")
+
+        if ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            starts.append(len(out))
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+            i += 1
+            continue
+
+        if ch == ":":
+            out.append(":")
+            i += 1
+            continue
+
+        if ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if stack and stack[-1] == "{" and out[-1] in "{,":
+                # 따옴표 없는 키
+                out.append(json.dumps(word))
+            elif word in _BARE_WORDS:
+                out.append(_BARE_WORDS[word])
+            elif j == n and _complete_literal(word):
+                out.append(_complete_literal(word))
+            elif starts:
+                # 문자열로 추측하지 않고 이 요소를 버림 ('"approved": fals' 가 참이 되지 않도록)
+                del out[starts[-1]:]
+                if safe[0] > len(out):
+                    safe = (0, [])
+            i = j
+            continue
+
+        if ch in "-+.0123456789":
+            j = i
+            while j < n and text[j] in "-+.0123456789eE":
+                j += 1
+            out.append(text[i:j].lstrip("+"))
+            i = j
+            continue
+
+        # 그 밖의 문자(주석, 잡음)는 건너뜀
+        i += 1
+
+    # 여기까지 왔으면 응답이 잘린 것: 열린 문자열/컨테이너를 닫아서 복구
+    if not stack:
+        return "".join(out), False
+    if quote is not None:
+        out.append('"')
+    if out and out[-1] == ":":
+        out.append("null")
+    closed = "".join(out) + "".join("}" if c == "{" else "]" for c in reversed(stack))
+    try:
+        json.loads(closed)
+        return closed, False
+    except json.JSONDecodeError:
+        # 마지막 완결 요소까지만 남기고 닫음 (예: 키만 있고 값이 없는 경우)
+        length, safe_stack = safe
+        if length == 0:
+            return closed, False
+        return "".join(out[:length]) + "".join("}" if c == "{" else "]" for c in reversed(safe_stack)), False
+
+
+def extract_json(text: str) -> Any:
+    """문자열에서 첫 번째 JSON 값을 추출하고, 흔한 형식 오류를 복구해서 파싱합니다.
+
+    1. 코드 블록 안의 JSON을 우선 찾고, 없으면 본문의 첫 '{'부터 읽습니다.
+    2. 한 번의 스캔으로 문자열/이스케이프를 추적하면서 제어 문자, trailing comma,
+       작은따옴표, 잘린 배열/객체 등을 고칩니다.
+    3. 시작 위치 후보가 파싱에 실패하면 다음 '{'에서 다시 시도합니다.
+
+    Raises:
+        json.JSONDecodeError: JSON을 찾거나 복구하지 못한 경우
+    """
+    if not isinstance(text, str):
+        raise TypeError(f"expected str, got {type(text).__name__}")
+
+    error = None
+    for start in _find_start(text):
+        repaired, _ = _repair_from(text, start)
+        try:
+            return json.loads(repaired)
+        except json.JSONDecodeError as e:
+            error = e
+
+    # 마지막 시도: 전체 텍스트를 JSON으로 파싱 (배열, 리터럴 등)
+    try:
+        return json.loads(re.sub(r"[\x00-\x1F\x7F]", " ", text.strip()))
+    except json.JSONDecodeError as e:
+        raise error or e
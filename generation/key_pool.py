@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# 최근 요청 수를 세는 구간 (rpm 한도 기준)
+_WINDOW_SECONDS = 60.0
+
+
+class NoAvailableKeyError(RuntimeError):
+    """pool의 모든 key가 비활성화되었거나 사용할 수 없음"""
+
+
+class KeyEntry:
+    """API key 하나 (organization, base_url 포함)와 사용량/상태"""
+
+    def __init__(self, name: str, api_key: str, make_client: Optional[Callable[["KeyEntry"], Any]] = None, organization: Optional[str] = None, base_url: Optional[str] = None, weight: float = 1.0, rpm: Optional[int] = None):
+        self.name = name
+        self.api_key = api_key
+        self.organization = organization
+        self.base_url = base_url
+        self.weight = float(weight)
+        self.rpm = rpm
+        self._make_client = make_client
+        self._client = None
+
+        self.requests = 0
+        self.errors = 0
+        self.tokens = 0
+        self.disabled_reason: Optional[str] = None
+        self.cooldown_until = 0.0
+        self.recent = deque()       # 최근 요청 시각 (rpm 계산용)
+        self.current_weight = 0.0   # smooth weighted round-robin 상태
+
+    @property
+    def client(self):
+        """provider SDK 클라이언트 (처음 사용할 때 생성)"""
+        if self._client is None and self._make_client is not None:
+            self._client = self._make_client(self)
+        return self._client
+
+    def remaining_fraction(self, now: float) -> float:
+        """rpm 한도 대비 남은 비율 (rpm이 없으면 1)"""
+        while self.recent and now - self.recent[0] > _WINDOW_SECONDS:
+            self.recent.popleft()
+        if not self.rpm:
+            return 1.0
+        return max(0.0, 1 - len(self.recent) / self.rpm)
+
+    def record_tokens(self, tokens: int):
+        self.tokens += tokens
+
+
+def classify_error(e: BaseException) -> Optional[str]:
+    """key를 rotation에서 뺄 오류인지 판별: "auth", "quota"(잔액/한도 소진), "rate_limit", 또는 None"""
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    name = type(e).__name__
+    text = str(e).lower()
+    if status in (401, 403) or name in ("AuthenticationError", "PermissionDeniedError", "Unauthenticated", "PermissionDenied"):
+        return "auth"
+    if "insufficient_quota" in text or "billing" in text or "credit balance" in text:
+        return "quota"
+    if status == 429 or name in ("RateLimitError", "ResourceExhausted"):
+        return "rate_limit"
+    return None
+
+
+class KeyPool:
+    """provider 하나의 API key 여러 개에 요청을 나눠 보내는 pool
+
+    key는 weight와 rpm 한도 대비 남은 비율을 곱한 가중치로 smooth weighted round-robin
+    방식으로 고릅니다. 인증 오류나 잔액 소진을 반환한 key는 rotation에서 빠지고,
+    rate limit을 받은 key는 cooldown_seconds 동안 쉬며, 요청은 다른 key로 다시 보냅니다.
+    key가 하나뿐이어도 rate limit이면 그 key가 쉬고 난 뒤 다시 보내며, 첫 시도부터
+    max_wait_seconds가 지나면 마지막 오류를 그대로 발생시킵니다.
+    """
+
+    def __init__(self, provider: str, entries: List[KeyEntry], cooldown_seconds: float = 30.0, max_wait_seconds: float = 120.0):
+        if not entries:
+            raise ValueError(f"Key pool for {provider} needs at least one key")
+        self.provider = provider
+        self.entries = entries
+        self.cooldown_seconds = cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+
+    def acquire(self) -> KeyEntry:
+        """다음 요청에 쓸 key. 모두 쉬는 중이면 가장 먼저 풀리는 key를 기다림"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                active = [entry for entry in self.entries if entry.disabled_reason is None]
+                if not active:
+                    reasons = ", ".join(f"{entry.name}: {entry.disabled_reason}" for entry in self.entries)
+                    raise NoAvailableKeyError(f"No usable {self.provider} keys ({reasons})")
+
+                weights = {id(entry): entry.weight * entry.remaining_fraction(now) for entry in active if entry.cooldown_until <= now}
+                ready = [entry for entry in active if weights.get(id(entry), 0) > 0]
+                if ready:
+                    total = sum(weights[id(entry)] for entry in ready)
+                    for entry in ready:
+                        entry.current_weight += weights[id(entry)]
+                    chosen = max(ready, key=lambda entry: entry.current_weight)
+                    chosen.current_weight -= total
+                    chosen.requests += 1
+                    chosen.recent.append(now)
+                    return chosen
+
+                # 모든 key가 cooldown 또는 rpm 한도: 가장 먼저 풀리는 시점까지 대기
+                wait = min(
+                    max(entry.cooldown_until - now, (entry.recent[0] + _WINDOW_SECONDS - now) if entry.recent else 0.0)
+                    for entry in active
+                )
+            time.sleep(min(max(wait, 0.05), self.cooldown_seconds))
+
+    def report_failure(self, entry: KeyEntry, e: BaseException) -> bool:
+        """요청 실패를 기록. key를 rotation에서 뺐거나 쉬게 했으면 True (다른 key로 재시도 가능)"""
+        kind = classify_error(e)
+        with self._lock:
+            entry.errors += 1
+            if kind in ("auth", "quota"):
+                entry.disabled_reason = f"{kind}: {str(e)[:120]}"
+                print(f"⚠️ {self.provider} key {entry.name} removed from rotation ({kind})")
+                return True
+            if kind == "rate_limit":
+                entry.cooldown_until = time.monotonic() + self.cooldown_seconds
+                return True
+        return False
+
+    def call(self, request: Callable[..., Any], *args, **kwargs) -> Any:
+        """request(entry, *args, **kwargs)를 pool의 key로 실행
+
+        key 문제로 실패하면 다른 key로 (rate limit이면 쉬고 난 key로도) 재시도하고,
+        max_wait_seconds를 넘기거나 쓸 수 있는 key가 없으면 마지막 오류를 발생시킵니다.
+        """
+        started = time.monotonic()
+        while True:
+            entry = self.acquire()
+            try:
+                return request(entry, *args, **kwargs)
+            except Exception as e:
+                if not self.report_failure(entry, e):
+                    raise
+                if time.monotonic() - started >= self.max_wait_seconds:
+                    raise
+                if all(other.disabled_reason is not None for other in self.entries):
+                    raise
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """key별 사용량 (key 값은 끝 4자리만 표시)"""
+        return [
+            {
+                "key": entry.name,
+                "requests": entry.requests,
+                "errors": entry.errors,
+                "tokens": entry.tokens,
+                "disabled": entry.disabled_reason,
+            }
+            for entry in self.entries
+        ]
+
+
+def build_key_pool(provider: str, specs: List[Dict[str, Any]], make_client: Optional[Callable[[KeyEntry], Any]] = None, cooldown_seconds: float = 30.0, max_wait_seconds: float = 120.0) -> KeyPool:
+    """config의 key 목록으로 KeyPool 생성
+
+    specs 항목: {"api_key": ..., "organization": ..., "base_url": ..., "weight": 1, "rpm": 500, "name": ...}
+    문자열 항목은 api_key만 있는 것으로 처리합니다.
+    """
+    entries = []
+    for index, spec in enumerate(specs):
+        if isinstance(spec, str):
+            spec = {"api_key": spec}
+        api_key = spec["api_key"]
+        entries.append(KeyEntry(
+            name=spec.get("name") or f"{provider}#{index}(...{api_key[-4:]})",
+            api_key=api_key,
+            make_client=make_client,
+            organization=spec.get("organization"),
+            base_url=spec.get("base_url"),
+            weight=spec.get("weight", 1.0),
+            rpm=spec.get("rpm"),
+        ))
+    return KeyPool(provider, entries, cooldown_seconds=cooldown_seconds, max_wait_seconds=max_wait_seconds)
+
+
+def print_key_usage(pools: Dict[str, KeyPool]):
+    """pool별/key별 사용량 출력"""
+    for provider, pool in pools.items():
+        for stat in pool.stats():
+            if stat["requests"] or stat["disabled"]:
+                status = f" | disabled ({stat['disabled']})" if stat["disabled"] else ""
+                print(f"  {stat['key']}: {stat['requests']} requests, {stat['errors']} errors, {stat['tokens']} tokens{status}")
@@ -1,116 +1,333 @@
 import json
 import re
+from functools import lru_cache
 from typing import Dict, Tuple, Optional, Any
 
-from utils import llm_call
+from utils import llm_call, last_model_used
 from utils import extract_json
 from utils import log_step  # 상단에 임포트 추가
+from verdict_cache import VerdictCache, canonical_key
 
 
-# -- Evaluate by Orchestrator --
-def orchestrator_check_init(task_id: str, sample: Dict[str, Any], model: str = "gpt-4o", is_final_attempt: bool = False, sample_index: int = 0) -> Tuple[bool, Optional[str]]:
-    """최초 문제 생성 단계(init)에서 문제의 구조적 타당성을 검사하는 함수"""
-    prompt = f"You are a benchmark quality controller evaluating if this problem is well-formed and structured correctly for task {task_id}.\n\n"
-    
-    # 평가 기준 설정 부분에 마지막 시도 여부 추가
-    if is_final_attempt:
-        prompt += "CRITICAL INSTRUCTION: This is the final attempt. Your primary goal is to APPROVE this problem unless it has FATAL flaws that make it completely unsolvable. Minor issues should be ignored. The problem only needs to be minimally functional - not perfect. If there's any reasonable way a student could solve this problem, you MUST approve it.\n\n"
-    # if is_final_attempt:
-    #     prompt += "Note: This is the final attempt. While maintaining quality standards, be MORE lenient in your evaluation. Accept problems that are reasonable and solvable, even if they have moderate imperfections.\n\n"
-    # else:
-    #     prompt += "Note: While maintaining quality standards, be lenient in your evaluation. Accept problems that are reasonable and solvable, even if they have minor imperfections.\n\n"
-    
-    task_names = {
-        "T1": "Sentence Context Anomaly",
-        "T2": "Paragraph Order Consistency",
-        "T3": "Blank-based Choice Anomaly",
-        "T4": "Bridge Sentence Evaluation",
-        "T5": "Referential Ambiguity",
-        "T6": "Logical Contradiction",
-        "T7": "Tone/Style Violation"
-    }
-    task_name = task_names.get(task_id, "Anomaly Detection")
-    
-    prompt += f"Task Type: {task_name} ({task_id})\n\n"
-
-    # 여기에 Task Description 추가
-    task_descriptions = {
-        "T1": "This task requires generating 5-6 sentences on a topic where one of them is anomalous (semantically inconsistent or conceptually off-topic). The anomaly should be detectable but not overly obvious, requiring careful reading to identify.",
-        "T2": "This task requires creating 5 sentences about a topic, either in logically coherent order (is_coherent: true) or with subtly disrupted order (is_coherent: false). For the disrupted version, 1-2 sentences should be moved to disrupt temporal/causal flow while avoiding obvious scrambling.",
-        "T3": "This task requires designing a sentence completion question with a blank (marked as ___) and 5 answer choices. One choice should be subtly inappropriate or anomalous. The anomaly should be detectable with careful analysis.",
-        "T4": "This task requires creating two short paragraphs (2-3 sentences each) and 5 candidate bridge sentences to connect them. One bridge should be contextually or logically weak compared to the others.",
-        "T5": "This task requires writing 5 sentences with pronouns and referents where one sentence contains ambiguous pronouns (unclear 'he', 'it', etc.). The ambiguity should be noticeable upon careful reading.",
-        "T6": "This task requires generating 5 statements where one contains a logical contradiction or reversed logic. The contradiction should be subtle but detectable upon careful examination.",
-        "T7": "This task requires writing 5 sentences with consistent formal/academic tone where one sentence subtly violates the established tone/style. The violation should be identifiable but not overly obvious."
-    }
-    
-    task_structure = {
-        "T1": "The expected JSON structure should include 'context' (array of 5-6 sentences), 'anomaly_index' (integer indicating which sentence is anomalous), and 'meta' (with source, topic, and anomaly_type).",
-        "T2": "The expected JSON structure should include 'context' (array of 5 sentences) and 'is_coherent' (boolean indicating if the order is logical or disrupted).",
-        "T3": "The expected JSON structure should include 'sentence' (with a blank marked as ___), 'choices' (array of 5 options), and 'anomaly_index' (integer indicating which choice is anomalous).",
-        "T4": "The expected JSON structure should include 'paragraph_1' (array of sentences), 'paragraph_2' (array of sentences), 'bridges' (array of 5 bridge options), and 'anomaly_index' (integer indicating which bridge is weak).",
-        "T5": "The expected JSON structure should include 'context' (array of 5 sentences) and 'anomaly_index' (integer indicating which sentence has ambiguous pronouns).",
-        "T6": "The expected JSON structure should include 'context' (array of 5 statements) and 'anomaly_index' (integer indicating which statement has a contradiction).",
-        "T7": "The expected JSON structure should include 'context' (array of 5 sentences) and 'anomaly_index' (integer indicating which sentence violates the tone/style)."
-    }
-    
-    prompt += f"Task Description: {task_descriptions.get(task_id, '')}\n\n"
-    prompt += f"Expected Structure: {task_structure.get(task_id, '')}\n\n"
-    
+TASK_NAMES = {
+    "T1": "Sentence Context Anomaly",
+    "T2": "Paragraph Order Consistency",
+    "T3": "Blank-based Choice Anomaly",
+    "T4": "Bridge Sentence Evaluation",
+    "T5": "Referential Ambiguity",
+    "T6": "Logical Contradiction",
+    "T7": "Tone/Style Violation"
+}
+
+TASK_DESCRIPTIONS = {
+    "T1": "This task requires generating 5-6 sentences on a topic where one of them is anomalous (semantically inconsistent or conceptually off-topic). The anomaly should be detectable but not overly obvious, requiring careful reading to identify.",
+    "T2": "This task requires creating 5 sentences about a topic, either in logically coherent order (is_coherent: true) or with subtly disrupted order (is_coherent: false). For the disrupted version, 1-2 sentences should be moved to disrupt temporal/causal flow while avoiding obvious scrambling.",
+    "T3": "This task requires designing a sentence completion question with a blank (marked as ___) and 5 answer choices. One choice should be subtly inappropriate or anomalous. The anomaly should be detectable with careful analysis.",
+    "T4": "This task requires creating two short paragraphs (2-3 sentences each) and 5 candidate bridge sentences to connect them. One bridge should be contextually or logically weak compared to the others.",
+    "T5": "This task requires writing 5 sentences with pronouns and referents where one sentence contains ambiguous pronouns (unclear 'he', 'it', etc.). The ambiguity should be noticeable upon careful reading.",
+    "T6": "This task requires generating 5 statements where one contains a logical contradiction or reversed logic. The contradiction should be subtle but detectable upon careful examination.",
+    "T7": "This task requires writing 5 sentences with consistent formal/academic tone where one sentence subtly violates the established tone/style. The violation should be identifiable but not overly obvious."
+}
+
+TASK_STRUCTURES = {
+    "T1": "The expected JSON structure should include 'context' (array of 5-6 sentences), 'anomaly_index' (integer indicating which sentence is anomalous), and 'meta' (with source, topic, and anomaly_type).",
+    "T2": "The expected JSON structure should include 'context' (array of 5 sentences) and 'is_coherent' (boolean indicating if the order is logical or disrupted).",
+    "T3": "The expected JSON structure should include 'sentence' (with a blank marked as ___), 'choices' (array of 5 options), and 'anomaly_index' (integer indicating which choice is anomalous).",
+    "T4": "The expected JSON structure should include 'paragraph_1' (array of sentences), 'paragraph_2' (array of sentences), 'bridges' (array of 5 bridge options), and 'anomaly_index' (integer indicating which bridge is weak).",
+    "T5": "The expected JSON structure should include 'context' (array of 5 sentences) and 'anomaly_index' (integer indicating which sentence has ambiguous pronouns).",
+    "T6": "The expected JSON structure should include 'context' (array of 5 statements) and 'anomaly_index' (integer indicating which statement has a contradiction).",
+    "T7": "The expected JSON structure should include 'context' (array of 5 sentences) and 'anomaly_index' (integer indicating which sentence violates the tone/style)."
+}
+
+
+@lru_cache(maxsize=None)
+def _validation_head(task_id: str, phase: str, is_final_attempt: bool, difficulty: Optional[str]) -> str:
+    """검증 프롬프트의 정적 앞부분 (역할, 태스크 설명, 기대 구조). 조합별로 한 번만 생성"""
+    task_name = TASK_NAMES.get(task_id, "Anomaly Detection")
+
+    if phase == "init":
+        parts = [f"You are a benchmark quality controller evaluating if this problem is well-formed and structured correctly for task {task_id}.\n\n"]
+
+        # 평가 기준 설정 부분에 마지막 시도 여부 추가
+        if is_final_attempt:
+            parts.append("CRITICAL INSTRUCTION: This is the final attempt. Your primary goal is to APPROVE this problem unless it has FATAL flaws that make it completely unsolvable. Minor issues should be ignored. The problem only needs to be minimally functional - not perfect. If there's any reasonable way a student could solve this problem, you MUST approve it.\n\n")
+
+        parts.append(f"Task Type: {task_name} ({task_id})\n\n")
+    else:
+        # 기본적으로 check_init과 동일한 검증을 수행하지만, 난이도 정보를 추가
+        parts = [
+            f"You are a benchmark quality controller evaluating if a problem with increased difficulty is well-formed and appropriate for task {task_id}.\n\n",
+            f"Task Type: {task_name} ({task_id})\n",
+            f"Difficulty Level: {difficulty}\n\n",
+        ]
+
+    parts.append(f"Task Description: {TASK_DESCRIPTIONS.get(task_id, '')}\n\n")
+    parts.append(f"Expected Structure: {TASK_STRUCTURES.get(task_id, '')}\n\n")
+    return "".join(parts)
+
+
+@lru_cache(maxsize=None)
+def _validation_criteria(phase: str, difficulty: Optional[str]) -> str:
+    """검증 프롬프트의 정적 평가 기준 부분"""
+    parts = [
+        "Note: While maintaining quality standards, be lenient in your evaluation. Accept problems that are reasonable and solvable, even if they have minor imperfections.\n\n",
+        "Evaluate the problem based on these criteria:\n",
+        "1. VALIDITY: Is the problem well-formed and complete?\n",
+        "2. TYPE ADHERENCE: Does the problem follow the expected task type requirements?\n",
+        "3. LOGICAL COHERENCE: Is the correct answer clearly identifiable?\n",
+    ]
+    if phase == "init":
+        parts.append("4. FAIRNESS: Is the problem fair and reasonable? Does it have a clear, unambiguous solution?\n\n")
+    else:
+        # 난이도 적절성 추가
+        parts.append("4. FAIRNESS: Is the problem fair and reasonable? Does it have a clear, unambiguous solution?\n")
+        parts.append(f"5. DIFFICULTY: Is the difficulty appropriate for {difficulty} level?\n\n")
+    return "".join(parts)
+
+
+def _format_problem(task_id: str, sample: Dict[str, Any], phase: str) -> str:
+    """Task별 문제 내용 포맷팅 (샘플마다 달라지는 부분)"""
     if task_id == "T2":
         passage = " ".join(sample["context"])
-        if sample.get("is_coherent") == True:
+        if phase == "init":
+            is_coherent = sample.get("is_coherent")
+        else:
+            is_coherent = sample["is_coherent"]
+        # 불리언 값을 명확하게 매핑
+        if is_coherent == True:  # 명시적 비교
             label = "True (coherent)"
         else:
             label = "False (incoherent)"
-        prompt += f"Paragraph: {passage}\n\nCorrect Answer: {label}\n\n"
-    
+        return f"Paragraph: {passage}\n\nCorrect Answer: {label}\n\n"
+
     elif task_id == "T3":
         sentence = sample.get("sentence", "")
         choices = sample.get("choices", [])
         anomaly_index = sample.get("anomaly_index", -1)
-        
-        prompt += f"Sentence: {sentence}\n\n"
-        prompt += "Choices:\n" + "\n".join([f"{i+1}. {choice}" for i, choice in enumerate(choices)])
-        prompt += f"\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
-    
+
+        numbered = "\n".join([f"{i+1}. {choice}" for i, choice in enumerate(choices)])
+        return f"Sentence: {sentence}\n\nChoices:\n{numbered}\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
+
     elif task_id == "T4":
         paragraph_1 = sample.get("paragraph_1", [])
         paragraph_2 = sample.get("paragraph_2", [])
         bridges = sample.get("bridges", [])
         anomaly_index = sample.get("anomaly_index", -1)
-        
+
         p1_text = " ".join(paragraph_1) if isinstance(paragraph_1, list) else paragraph_1
         p2_text = " ".join(paragraph_2) if isinstance(paragraph_2, list) else paragraph_2
-        
-        prompt += f"Paragraph 1: {p1_text}\n\n"
-        prompt += f"Paragraph 2: {p2_text}\n\n"
-        prompt += "Bridge Options:\n" + "\n".join([f"{i+1}. {bridge}" for i, bridge in enumerate(bridges)])
-        prompt += f"\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
-    
+
+        numbered = "\n".join([f"{i+1}. {bridge}" for i, bridge in enumerate(bridges)])
+        return f"Paragraph 1: {p1_text}\n\nParagraph 2: {p2_text}\n\nBridge Options:\n{numbered}\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
+
     else:  # T1, T5, T6, T7
         context = sample.get("context", [])
         anomaly_index = sample.get("anomaly_index", -1)
-        
-        prompt += "Context:\n" + "\n".join([f"{i+1}. {item}" for i, item in enumerate(context)])
-        prompt += f"\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
-    
-    # 평가 기준 및 JSON 응답 요청
-    prompt += "Note: While maintaining quality standards, be lenient in your evaluation. Accept problems that are reasonable and solvable, even if they have minor imperfections.\n\n"
-    prompt += "Evaluate the problem based on these criteria:\n"
-    prompt += "1. VALIDITY: Is the problem well-formed and complete?\n"
-    prompt += "2. TYPE ADHERENCE: Does the problem follow the expected task type requirements?\n"
-    prompt += "3. LOGICAL COHERENCE: Is the correct answer clearly identifiable?\n"
-    prompt += "4. FAIRNESS: Is the problem fair and reasonable? Does it have a clear, unambiguous solution?\n\n"
-
-    prompt += "Return your evaluation in JSON format:\n"
-    prompt += "{\n"
-    prompt += '  "approved": boolean (true if the problem passes all criteria, false otherwise),\n'
-    prompt += '  "feedback": null if approved, or detailed feedback if rejected addressing:\n'
-    prompt += '              - Problem construction issues\n'
-    prompt += '              - Anomaly ambiguity concerns\n'
-    prompt += '              - Specific improvement suggestions\n'
-    prompt += "}"
+
+        numbered = "\n".join([f"{i+1}. {item}" for i, item in enumerate(context)])
+        return f"Context:\n{numbered}\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
+
+
+def _build_validation_body(task_id: str, sample: Dict[str, Any], phase: str = "init", is_final_attempt: bool = False) -> str:
+    """검증 프롬프트에서 응답 형식 지시 이전까지의 공통 본문을 생성하는 함수
+
+    phase가 "init"이면 최초 문제 검증용, 그 외에는 난이도 증가 문제 검증용 본문을 만듭니다.
+    정적 부분은 캐시된 템플릿을 쓰고 샘플 내용만 새로 포맷팅합니다.
+    """
+    if phase == "init":
+        difficulty = None
+    else:
+        difficulty = sample.get("meta", {}).get("difficulty_level", "unknown")
+        is_final_attempt = False
+
+    return "".join((
+        _validation_head(task_id, phase, is_final_attempt, difficulty),
+        _format_problem(task_id, sample, phase),
+        _validation_criteria(phase, difficulty),
+    ))
+
+
+_INIT_RESPONSE_FORMAT = (
+    "Return your evaluation in JSON format:\n"
+    "{\n"
+    '  "approved": boolean (true if the problem passes all criteria, false otherwise),\n'
+    '  "feedback": null if approved, or detailed feedback if rejected addressing:\n'
+    '              - Problem construction issues\n'
+    '              - Anomaly ambiguity concerns\n'
+    '              - Specific improvement suggestions\n'
+    "}"
+)
+
+_PROBLEM_RESPONSE_FORMAT = (
+    "Return your evaluation in JSON format:\n"
+    "{\n"
+    '  "approved": boolean (true if the problem passes all criteria, false otherwise),\n'
+    '  "feedback": null if approved, or detailed feedback if rejected addressing:\n'
+    '              - Problem construction issues\n'
+    '              - Anomaly ambiguity concerns\n'
+    '              - Difficulty appropriateness\n'
+    '              - Specific improvement suggestions\n'
+    "}"
+)
+
+
+def _format_escalation_feedback(result: Dict[str, Any]) -> str:
+    """analysis / suggestions / difficulty_increase 필드를 teacher용 피드백 문자열로 변환"""
+    feedback = result.get("analysis", "") + "\n\n"
+
+    if "suggestions" in result and isinstance(result["suggestions"], list):
+        feedback += "Suggestions:\n- " + "\n- ".join(result["suggestions"]) + "\n\n"
+
+    feedback += result.get("difficulty_increase", "")
+    return feedback
+
+
+def _fallback_verdict(res: str) -> Tuple[bool, Optional[str]]:
+    """JSON 파싱 실패 시 응답 텍스트에서 승인 여부를 추정"""
+    if "approve" in res.lower() and not "reject" in res.lower():
+        return True, None
+    else:
+        if "reject:" in res.lower():
+            feedback = res.split("Reject:", 1)[1].strip()
+        else:
+            feedback = res
+        return False, feedback
+
+
+@lru_cache(maxsize=None)
+def _fused_response_format(phase: str) -> str:
+    """fused 모드의 가이드 요청 + 응답 형식 지시 (phase별로 한 번만 생성)"""
+    parts = [
+        "In the same response, also prepare guidance for the NEXT, harder version of this problem, ",
+        "assuming a capable student will solve it correctly:\n",
+        "a. What aspects of this problem would a student most easily identify?\n",
+        "b. How could the problem be made more subtle or complex?\n",
+        "c. Give specific suggestions for increasing difficulty.\n\n",
+        "Return your evaluation in JSON format:\n",
+        "{\n",
+        '  "approved": boolean (true if the problem passes all criteria, false otherwise),\n',
+        '  "feedback": null if approved, or detailed feedback if rejected addressing:\n',
+        '              - Problem construction issues\n',
+        '              - Anomaly ambiguity concerns\n',
+    ]
+    if phase != "init":
+        parts.append('              - Difficulty appropriateness\n')
+    parts += [
+        '              - Specific improvement suggestions,\n',
+        '  "escalation": null if rejected, or {\n',
+        '    "analysis": "Brief analysis of what makes this problem solvable",\n',
+        '    "suggestions": ["Specific suggestion 1", "Specific suggestion 2", ...],\n',
+        '    "difficulty_increase": "Summary of how to increase difficulty"\n',
+        "  }\n",
+        "}",
+    ]
+    return "".join(parts)
+
+
+@lru_cache(maxsize=None)
+def _feedback_head(task_id: str, difficulty: str) -> str:
+    """난이도 증가 피드백 프롬프트의 정적 앞부분"""
+    task_name = TASK_NAMES.get(task_id, "Anomaly Detection")
+    return (
+        "You are helping to create a harder version of a problem that a student has correctly solved. Analyze the student's solution and provide feedback.\n\n"
+        f"Task Type: {task_name} ({task_id})\n"
+        f"Current Difficulty: {difficulty}\n\n"
+        "ORIGINAL PROBLEM:\n"
+    )
+
+
+_FEEDBACK_PROBLEM_TYPES = {
+    "T2": "Problem Type: Paragraph coherence assessment\n",
+    "T3": "Problem Type: Sentence completion with anomalous option\n",
+    "T4": "Problem Type: Bridge sentence identification\n",
+    "default": "Problem Type: Anomaly detection in context\n",
+}
+
+_FEEDBACK_RESPONSE_FORMAT = (
+    "Based on how the student solved this problem, provide feedback to create a more challenging version:\n"
+    "1. What aspects did the student easily identify?\n"
+    "2. How could the problem be made more subtle or complex?\n"
+    "3. Give specific suggestions for increasing difficulty.\n\n"
+    "Return your feedback in JSON format:\n"
+    "{\n"
+    '  "analysis": "Brief analysis of student solution",\n'
+    '  "suggestions": ["Specific suggestion 1", "Specific suggestion 2", ...],\n'
+    '  "difficulty_increase": "Summary of how to increase difficulty"\n'
+    "}"
+)
+
+
+# 검증 프롬프트(_validation_head, _validation_criteria, 응답 형식)를 바꾸면 올려서 캐시된 이전 판정을 무효화
+VALIDATION_PROMPT_VERSION = 1
+
+# -- 검증 결과 캐시 (configure_verdict_cache로 활성화) --
+verdict_cache = None   # verdict_cache.VerdictCache
+
+def configure_verdict_cache(enabled: bool = False, path: Optional[str] = None, ttl_hours: Optional[float] = None) -> Optional[VerdictCache]:
+    """orchestrator 검증 결과 캐시 설정 (path가 있으면 재시작 후에도 유지, enabled=False면 해제)"""
+    global verdict_cache
+    verdict_cache = VerdictCache(path, ttl_seconds=ttl_hours * 3600 if ttl_hours is not None else None) if enabled else None
+    return verdict_cache
+
+
+def _cache_namespace(model: str) -> str:
+    return f"{model}|v{VALIDATION_PROMPT_VERSION}"
+
+
+def _lookup_verdict(task_id: str, sample: Dict[str, Any], model: str, kind: str, phase: str, is_final_attempt: bool, sample_index: int) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """같은 문제(공백 정규화)에 대한 이전 판정 조회
+
+    Returns:
+        (cache_key, verdict) - 캐시를 쓰지 않으면 (None, None), 캐시에 없으면 (cache_key, None)
+    """
+    if verdict_cache is None:
+        return None, None
+    if phase == "init":
+        difficulty = None
+    else:
+        difficulty = sample.get("meta", {}).get("difficulty_level", "unknown")
+        is_final_attempt = False
+    cache_key = canonical_key(_cache_namespace(model), task_id, f"{kind}:{phase}", _format_problem(task_id, sample, phase), difficulty, is_final_attempt)
+    verdict = verdict_cache.get(cache_key)
+    if verdict is not None and not _valid_verdict(verdict):
+        verdict = None  # 이전 버전이 저장한 잘못된 판정 (예: 잘린 응답의 approved "fals")은 무시
+    if verdict is not None:
+        # 로깅: 캐시된 판정 사용
+        log_step(
+            task_id=task_id,
+            sample_index=sample_index,
+            phase=phase,
+            agent="orchestrator",
+            action="validation_cache_hit",
+            output_content=verdict,
+            metadata={
+                "model": model,
+                "sample_id": sample.get("sample_id", "unknown"),
+                "cache_key": cache_key[:16]
+            }
+        )
+    return cache_key, verdict
+
+
+def _valid_verdict(result: Dict[str, Any]) -> bool:
+    """approved가 실제 bool인 판정만 캐시에 저장/사용 (빠진 키나 "false" 같은 문자열은 제외)"""
+    return isinstance(result.get("approved"), bool)
+
+
+def _store_verdict(cache_key: Optional[str], model: str, verdict: Dict[str, Any]):
+    # fallback 모델이 낸 판정은 요청한 모델의 판정으로 저장하지 않음
+    if cache_key is not None and verdict_cache is not None and last_model_used(model) == model:
+        verdict_cache.put(cache_key, verdict, namespace=_cache_namespace(model))
+
+
+# -- Evaluate by Orchestrator --
+def orchestrator_check_init(task_id: str, sample: Dict[str, Any], model: str = "gpt-4o", is_final_attempt: bool = False, sample_index: int = 0) -> Tuple[bool, Optional[str]]:
+    """최초 문제 생성 단계(init)에서 문제의 구조적 타당성을 검사하는 함수"""
+    cache_key, cached = _lookup_verdict(task_id, sample, model, "check", "init", is_final_attempt, sample_index)
+    if cached is not None:
+        return cached["approved"], cached["feedback"]
+
+    prompt = _build_validation_body(task_id, sample, phase="init", is_final_attempt=is_final_attempt) + _INIT_RESPONSE_FORMAT
 
     # 로깅: orchestrator 프롬프트
     log_step(
@@ -126,7 +343,7 @@ def orchestrator_check_init(task_id: str, sample: Dict[str, Any], model: str = "
         }
     )
 
-    res = llm_call(prompt, model=model)
+    res = llm_call(prompt, model=model, stop_at_json=True, role="orchestrator")
 
     # 로깅: orchestrator 응답
     log_step(
@@ -137,7 +354,8 @@ def orchestrator_check_init(task_id: str, sample: Dict[str, Any], model: str = "
         action="validate_response",
         output_content=res,
         metadata={
-            "model": model
+            "model": model,
+            "model_used": last_model_used(model)
         }
     )
     
@@ -161,6 +379,8 @@ def orchestrator_check_init(task_id: str, sample: Dict[str, Any], model: str = "
             metadata={}
         )
 
+        if _valid_verdict(result):
+            _store_verdict(cache_key, model, {"approved": approved, "feedback": feedback})
         return approved, feedback
     
     except Exception as e:
@@ -179,66 +399,30 @@ def orchestrator_check_init(task_id: str, sample: Dict[str, Any], model: str = "
         )
 
         print(f"Warning: Failed to parse JSON response: {e}")
-        if "approve" in res.lower() and not "reject" in res.lower():
-            return True, None
-        else:
-            if "reject:" in res.lower():
-                feedback = res.split("Reject:", 1)[1].strip()
-            else:
-                feedback = res
-            return False, feedback
+        return _fallback_verdict(res)
 
 
 
 def orchestrator_get_feedback(task_id: str, sample: Dict[str, Any], student_explanation: str, model: str = "gpt-4o", sample_index: int = 0) -> str:
     """학생이 문제를 맞췄을 때, 난이도를 올리기 위한 피드백을 생성하는 함수"""
-    prompt = f"You are helping to create a harder version of a problem that a student has correctly solved. Analyze the student's solution and provide feedback.\n\n"
-    
-    task_names = {
-        "T1": "Sentence Context Anomaly",
-        "T2": "Paragraph Order Consistency",
-        "T3": "Blank-based Choice Anomaly",
-        "T4": "Bridge Sentence Evaluation",
-        "T5": "Referential Ambiguity",
-        "T6": "Logical Contradiction",
-        "T7": "Tone/Style Violation"
-    }
-    task_name = task_names.get(task_id, "Anomaly Detection")
     difficulty = sample.get("meta", {}).get("difficulty_level", "unknown")
-    
-    prompt += f"Task Type: {task_name} ({task_id})\n"
-    prompt += f"Current Difficulty: {difficulty}\n\n"
-    
-    # 전체 문제를 포함
-    prompt += f"ORIGINAL PROBLEM:\n{json.dumps(sample, ensure_ascii=False, indent=2)}\n\n"
-    
+
     # 문제의 핵심 요소만 간략히 포함
     if task_id == "T2":
-        prompt += f"Problem Type: Paragraph coherence assessment\n"
-        prompt += f"Current Answer: {'Coherent' if sample.get('is_coherent') else 'Not Coherent'}\n\n"
-    elif task_id == "T3":
-        prompt += f"Problem Type: Sentence completion with anomalous option\n"
-        prompt += f"Anomaly Index: {sample.get('anomaly_index')}\n\n"
-    elif task_id == "T4":
-        prompt += f"Problem Type: Bridge sentence identification\n"
-        prompt += f"Anomaly Index: {sample.get('anomaly_index')}\n\n"
+        summary = f"Current Answer: {'Coherent' if sample.get('is_coherent') else 'Not Coherent'}\n\n"
     else:
-        prompt += f"Problem Type: Anomaly detection in context\n"
-        prompt += f"Anomaly Index: {sample.get('anomaly_index')}\n\n"
-      
-    prompt += f"Student's Explanation: {student_explanation}\n\n"
-    
-    prompt += "Based on how the student solved this problem, provide feedback to create a more challenging version:\n"
-    prompt += "1. What aspects did the student easily identify?\n"
-    prompt += "2. How could the problem be made more subtle or complex?\n"
-    prompt += "3. Give specific suggestions for increasing difficulty.\n\n"
-    
-    prompt += "Return your feedback in JSON format:\n"
-    prompt += "{\n"
-    prompt += '  "analysis": "Brief analysis of student solution",\n'
-    prompt += '  "suggestions": ["Specific suggestion 1", "Specific suggestion 2", ...],\n'
-    prompt += '  "difficulty_increase": "Summary of how to increase difficulty"\n'
-    prompt += "}"
+        summary = f"Anomaly Index: {sample.get('anomaly_index')}\n\n"
+
+    prompt = "".join((
+        _feedback_head(task_id, difficulty),
+        # 전체 문제를 포함
+        json.dumps(sample, ensure_ascii=False, indent=2),
+        "\n\n",
+        _FEEDBACK_PROBLEM_TYPES.get(task_id, _FEEDBACK_PROBLEM_TYPES["default"]),
+        summary,
+        f"Student's Explanation: {student_explanation}\n\n",
+        _FEEDBACK_RESPONSE_FORMAT,
+    ))
 
     # 로깅: orchestrator 피드백 요청
     log_step(
@@ -254,7 +438,7 @@ def orchestrator_get_feedback(task_id: str, sample: Dict[str, Any], student_expl
         }
     )
 
-    res = llm_call(prompt, model=model)
+    res = llm_call(prompt, model=model, stop_at_json=True, role="orchestrator")
     
     # 로깅: orchestrator 피드백 응답
     log_step(
@@ -265,7 +449,8 @@ def orchestrator_get_feedback(task_id: str, sample: Dict[str, Any], student_expl
         action="feedback_response",
         output_content=res,
         metadata={
-            "model": model
+            "model": model,
+            "model_used": last_model_used(model)
         }
     )
 
@@ -274,12 +459,7 @@ def orchestrator_get_feedback(task_id: str, sample: Dict[str, Any], student_expl
         result = extract_json(res)
         
         # 피드백 구성
-        feedback = result.get("analysis", "") + "\n\n"
-        
-        if "suggestions" in result and isinstance(result["suggestions"], list):
-            feedback += "Suggestions:\n- " + "\n- ".join(result["suggestions"]) + "\n\n"
-        
-        feedback += result.get("difficulty_increase", "")
+        feedback = _format_escalation_feedback(result)
 
         # 로깅: 파싱된 피드백
         log_step(
@@ -316,106 +496,12 @@ def orchestrator_get_feedback(task_id: str, sample: Dict[str, Any], student_expl
 
 def orchestrator_check_problem(task_id: str, sample: Dict[str, Any], model: str = "gpt-4o", sample_index: int = 0) -> Tuple[bool, Optional[str]]:
     """난이도 증가 후 생성된 문제의 품질을 검증하는 함수"""
-    # 기본적으로 check_init과 동일한 검증을 수행하지만, 난이도 정보를 추가
-    prompt = f"You are a benchmark quality controller evaluating if a problem with increased difficulty is well-formed and appropriate for task {task_id}.\n\n"
-    
-    task_names = {
-        "T1": "Sentence Context Anomaly",
-        "T2": "Paragraph Order Consistency",
-        "T3": "Blank-based Choice Anomaly",
-        "T4": "Bridge Sentence Evaluation",
-        "T5": "Referential Ambiguity",
-        "T6": "Logical Contradiction",
-        "T7": "Tone/Style Violation"
-    }
-    task_name = task_names.get(task_id, "Anomaly Detection")
-    difficulty = sample.get("meta", {}).get("difficulty_level", "unknown")
-    
-    prompt += f"Task Type: {task_name} ({task_id})\n"
-    prompt += f"Difficulty Level: {difficulty}\n\n"
-
-    # 여기에 Task Description 추가
-    task_descriptions = {
-        "T1": "This task requires generating 5-6 sentences on a topic where one of them is anomalous (semantically inconsistent or conceptually off-topic). The anomaly should be detectable but not overly obvious, requiring careful reading to identify.",
-        "T2": "This task requires creating 5 sentences about a topic, either in logically coherent order (is_coherent: true) or with subtly disrupted order (is_coherent: false). For the disrupted version, 1-2 sentences should be moved to disrupt temporal/causal flow while avoiding obvious scrambling.",
-        "T3": "This task requires designing a sentence completion question with a blank (marked as ___) and 5 answer choices. One choice should be subtly inappropriate or anomalous. The anomaly should be detectable with careful analysis.",
-        "T4": "This task requires creating two short paragraphs (2-3 sentences each) and 5 candidate bridge sentences to connect them. One bridge should be contextually or logically weak compared to the others.",
-        "T5": "This task requires writing 5 sentences with pronouns and referents where one sentence contains ambiguous pronouns (unclear 'he', 'it', etc.). The ambiguity should be noticeable upon careful reading.",
-        "T6": "This task requires generating 5 statements where one contains a logical contradiction or reversed logic. The contradiction should be subtle but detectable upon careful examination.",
-        "T7": "This task requires writing 5 sentences with consistent formal/academic tone where one sentence subtly violates the established tone/style. The violation should be identifiable but not overly obvious."
-    }
-    
-    task_structure = {
-        "T1": "The expected JSON structure should include 'context' (array of 5-6 sentences), 'anomaly_index' (integer indicating which sentence is anomalous), and 'meta' (with source, topic, and anomaly_type).",
-        "T2": "The expected JSON structure should include 'context' (array of 5 sentences) and 'is_coherent' (boolean indicating if the order is logical or disrupted).",
-        "T3": "The expected JSON structure should include 'sentence' (with a blank marked as ___), 'choices' (array of 5 options), and 'anomaly_index' (integer indicating which choice is anomalous).",
-        "T4": "The expected JSON structure should include 'paragraph_1' (array of sentences), 'paragraph_2' (array of sentences), 'bridges' (array of 5 bridge options), and 'anomaly_index' (integer indicating which bridge is weak).",
-        "T5": "The expected JSON structure should include 'context' (array of 5 sentences) and 'anomaly_index' (integer indicating which sentence has ambiguous pronouns).",
-        "T6": "The expected JSON structure should include 'context' (array of 5 statements) and 'anomaly_index' (integer indicating which statement has a contradiction).",
-        "T7": "The expected JSON structure should include 'context' (array of 5 sentences) and 'anomaly_index' (integer indicating which sentence violates the tone/style)."
-    }
-    
-    prompt += f"Task Description: {task_descriptions.get(task_id, '')}\n\n"
-    prompt += f"Expected Structure: {task_structure.get(task_id, '')}\n\n"
+    cache_key, cached = _lookup_verdict(task_id, sample, model, "check", "difficulty_increase", False, sample_index)
+    if cached is not None:
+        return cached["approved"], cached["feedback"]
 
-    # Task별 문제 내용 포맷팅 (check_init과 동일)    
-    if task_id == "T2":
-        passage = " ".join(sample["context"])
-        # 불리언 값을 명확하게 매핑
-        if sample["is_coherent"] == True:  # 명시적 비교
-            label = "True (coherent)"
-        else:
-            label = "False (incoherent)"
-        prompt += f"Paragraph: {passage}\n\nCorrect Answer: {label}\n\n"
-    
-    elif task_id == "T3":
-        sentence = sample.get("sentence", "")
-        choices = sample.get("choices", [])
-        anomaly_index = sample.get("anomaly_index", -1)
-        
-        prompt += f"Sentence: {sentence}\n\n"
-        prompt += "Choices:\n" + "\n".join([f"{i+1}. {choice}" for i, choice in enumerate(choices)])
-        prompt += f"\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
-    
-    elif task_id == "T4":
-        paragraph_1 = sample.get("paragraph_1", [])
-        paragraph_2 = sample.get("paragraph_2", [])
-        bridges = sample.get("bridges", [])
-        anomaly_index = sample.get("anomaly_index", -1)
-        
-        p1_text = " ".join(paragraph_1) if isinstance(paragraph_1, list) else paragraph_1
-        p2_text = " ".join(paragraph_2) if isinstance(paragraph_2, list) else paragraph_2
-        
-        prompt += f"Paragraph 1: {p1_text}\n\n"
-        prompt += f"Paragraph 2: {p2_text}\n\n"
-        prompt += "Bridge Options:\n" + "\n".join([f"{i+1}. {bridge}" for i, bridge in enumerate(bridges)])
-        prompt += f"\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
-    
-    else:  # T1, T5, T6, T7
-        context = sample.get("context", [])
-        anomaly_index = sample.get("anomaly_index", -1)
-        
-        prompt += "Context:\n" + "\n".join([f"{i+1}. {item}" for i, item in enumerate(context)])
-        prompt += f"\n\nCorrect Answer: Option {anomaly_index + 1}\n\n"
-    
-    # 평가 기준에 난이도 적절성 추가
-    prompt += "Note: While maintaining quality standards, be lenient in your evaluation. Accept problems that are reasonable and solvable, even if they have minor imperfections.\n\n"
-    prompt += "Evaluate the problem based on these criteria:\n"
-    prompt += "1. VALIDITY: Is the problem well-formed and complete?\n"
-    prompt += "2. TYPE ADHERENCE: Does the problem follow the expected task type requirements?\n"
-    prompt += "3. LOGICAL COHERENCE: Is the correct answer clearly identifiable?\n"
-    prompt += "4. FAIRNESS: Is the problem fair and reasonable? Does it have a clear, unambiguous solution?\n"
-    prompt += f"5. DIFFICULTY: Is the difficulty appropriate for {difficulty} level?\n\n"
-
-    prompt += "Return your evaluation in JSON format:\n"
-    prompt += "{\n"
-    prompt += '  "approved": boolean (true if the problem passes all criteria, false otherwise),\n'
-    prompt += '  "feedback": null if approved, or detailed feedback if rejected addressing:\n'
-    prompt += '              - Problem construction issues\n'
-    prompt += '              - Anomaly ambiguity concerns\n'
-    prompt += '              - Difficulty appropriateness\n'
-    prompt += '              - Specific improvement suggestions\n'
-    prompt += "}"
+    prompt = _build_validation_body(task_id, sample, phase="difficulty_increase") + _PROBLEM_RESPONSE_FORMAT
+    difficulty = sample.get("meta", {}).get("difficulty_level", "unknown")
 
     # 로깅: orchestrator 난이도 증가 검증 요청
     log_step(
@@ -431,7 +517,7 @@ def orchestrator_check_problem(task_id: str, sample: Dict[str, Any], model: str
         }
     )
 
-    res = llm_call(prompt, model=model)
+    res = llm_call(prompt, model=model, stop_at_json=True, role="orchestrator")
     
     # 로깅: orchestrator 난이도 증가 검증 응답
     log_step(
@@ -442,7 +528,8 @@ def orchestrator_check_problem(task_id: str, sample: Dict[str, Any], model: str
         action="validate_difficult_response",
         output_content=res,
         metadata={
-            "model": model
+            "model": model,
+            "model_used": last_model_used(model)
         }
     )
 
@@ -466,6 +553,8 @@ def orchestrator_check_problem(task_id: str, sample: Dict[str, Any], model: str
             metadata={}
         )
         
+        if _valid_verdict(result):
+            _store_verdict(cache_key, model, {"approved": approved, "feedback": feedback})
         return approved, feedback
     
     except Exception as e:
@@ -484,12 +573,101 @@ def orchestrator_check_problem(task_id: str, sample: Dict[str, Any], model: str
         )
         
         print(f"Warning: Failed to parse JSON response: {e}")
-        if "approve" in res.lower() and not "reject" in res.lower():
-            return True, None
-        else:
-            if "reject:" in res.lower():
-                feedback = res.split("Reject:", 1)[1].strip()
-            else:
-                feedback = res
-            return False, feedback
+        return _fallback_verdict(res)
+
+
+
+def orchestrator_check_and_guide(task_id: str, sample: Dict[str, Any], model: str = "gpt-4o", phase: str = "init", is_final_attempt: bool = False, sample_index: int = 0) -> Tuple[bool, Optional[str], Optional[str]]:
+    """문제 검증과 다음 난이도 증가 가이드를 한 번의 호출로 받는 fused 모드 함수
+
+    check_init / check_problem과 동일한 검증 본문을 사용하며, 학생이 이 문제를 맞힐 경우를
+    대비한 escalation 가이드를 함께 요청합니다. 가이드는 orchestrator_get_feedback과 같은
+    형식의 문자열로 반환되며, 미승인이거나 가이드가 없으면 None입니다.
 
+    Returns:
+        (approved, feedback, escalation_feedback)
+    """
+    cache_key, cached = _lookup_verdict(task_id, sample, model, "guide", phase, is_final_attempt, sample_index)
+    if cached is not None:
+        return cached["approved"], cached["feedback"], cached["escalation_feedback"]
+
+    prompt = _build_validation_body(task_id, sample, phase=phase, is_final_attempt=is_final_attempt) + _fused_response_format(phase)
+
+    # 로깅: fused 검증 + 가이드 요청
+    log_step(
+        task_id=task_id,
+        sample_index=sample_index,
+        phase=phase,
+        agent="orchestrator",
+        action="validate_guide_request",
+        input_content=prompt,
+        metadata={
+            "is_final_attempt": is_final_attempt,
+            "difficulty": sample.get("meta", {}).get("difficulty_level", "unknown"),
+            "sample_id": sample.get("sample_id", "unknown")
+        }
+    )
+
+    res = llm_call(prompt, model=model, stop_at_json=True, role="orchestrator")
+
+    # 로깅: fused 응답
+    log_step(
+        task_id=task_id,
+        sample_index=sample_index,
+        phase=phase,
+        agent="orchestrator",
+        action="validate_guide_response",
+        output_content=res,
+        metadata={
+            "model": model,
+            "model_used": last_model_used(model)
+        }
+    )
+
+    try:
+        result = extract_json(res)
+        approved = result.get("approved", False)
+        feedback = result.get("feedback")
+
+        escalation = result.get("escalation")
+        escalation_feedback = None
+        if approved and isinstance(escalation, dict):
+            escalation_feedback = _format_escalation_feedback(escalation)
+
+        # 로깅: 파싱된 결과
+        log_step(
+            task_id=task_id,
+            sample_index=sample_index,
+            phase=phase,
+            agent="orchestrator",
+            action="validation_guide_result",
+            output_content={
+                "approved": approved,
+                "feedback": feedback,
+                "escalation_feedback": escalation_feedback
+            },
+            metadata={}
+        )
+
+        if _valid_verdict(result):
+            _store_verdict(cache_key, model, {"approved": approved, "feedback": feedback, "escalation_feedback": escalation_feedback})
+        return approved, feedback, escalation_feedback
+
+    except Exception as e:
+        # JSON 파싱 실패 시 승인 여부만 추정하고 가이드는 버림 (별도 피드백 호출로 대체됨)
+        log_step(
+            task_id=task_id,
+            sample_index=sample_index,
+            phase=phase,
+            agent="system",
+            action="error",
+            output_content=str(e),
+            metadata={
+                "error_type": "json_parsing",
+                "raw_response": res
+            }
+        )
+
+        print(f"Warning: Failed to parse JSON response: {e}")
+        approved, feedback = _fallback_verdict(res)
+        return approved, feedback, None
@@ -1,22 +1,70 @@
 # ✅ Orchestrator-Aware Agentic Generator with Teacher-Student-Feedback Loop (Full Pipeline)
-import random
 import json
 import re
 import argparse
 import yaml
 import datetime
+import os
+import socket
+from functools import lru_cache
 from openai import OpenAI
-from itertools import cycle
 from typing import List, Dict, Tuple, Optional, Any
-from utils import llm_call, extract_json, round_robin, log_step, get_logs, clear_logs
+from utils import llm_call, last_model_used, configure_llm, configure_key_pools, configure_hedging, configure_routing, key_pools, extract_json, log_step, get_logs, clear_logs, set_budget, timeout_counts, error_counts, late_usage_counts
+from key_pool import print_key_usage
 
 from prompt_templates import build_teacher_prompt
 from tasks_config import TASKS
-from orchestrator import orchestrator_check_init, orchestrator_check_problem, orchestrator_get_feedback
+from generation_plan import build_generation_plan, worker_slot_indices, new_run_id, make_sample_id
+from budget import RunBudget, SlotScheduler, BudgetExceeded, SampleBudgetExceeded
+from work_queue import WorkQueue, LeaseKeeper, OUTPUT_KINDS
+from difficulty_quota import DifficultyQuota, build_quota
+from deadlines import LLMTimeoutError, SampleDeadlineExceeded, sample_deadline
+from orchestrator import orchestrator_check_init, orchestrator_check_problem, orchestrator_get_feedback, orchestrator_check_and_guide, configure_verdict_cache
+
+
+@lru_cache(maxsize=None)
+def _student_static_parts(task_id: str, structured: bool, explanation_chars: int) -> Tuple[str, str]:
+    """학생 프롬프트의 정적 부분 (질문 지시문, 응답 형식 지시)을 한 번만 생성"""
+    # 공통 suffix
+    if structured:
+        common_suffix = "Even if all seem normal, choose the relatively most anomalous."
+    else:
+        common_suffix = "Answer with number only, then explain why. Even if all seem normal, choose the relatively most anomalous."
+
+    if task_id == "T2":
+        if structured:
+            question = "Does the following paragraph have a logically coherent sentence order?\n\n"
+        else:
+            question = "Does the following paragraph have a logically coherent sentence order? Answer only 'yes' or 'no'.\n\n"
+    elif task_id == "T4":
+        question = f"Which connecting sentence is most anomalous or inconsistent? {common_suffix}\n\n"
+    else:
+        question = f"Which option is most anomalous or inconsistent? {common_suffix}\n\n"
+
+    # 명확한 응답 지침 추가
+    if structured:
+        answer_spec = '"yes" or "no"' if task_id == "T2" else "<option number>"
+        response_format = (
+            "\n\nRespond ONLY with a JSON object in this format:\n"
+            "{\n"
+            f'  "answer": {answer_spec},\n'
+            f'  "explanation": "why, in at most {explanation_chars} characters"\n'
+            "}"
+        )
+    else:
+        response_format = "\n\nYour response for this new problem:"
+    return question, response_format
 
 
 # -- Evaluate Student answer --
-def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: List[Dict[str, Any]], student_model: str = "gpt-4o", sample_index: int = 0) -> Tuple[int, str]:
+def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: List[Dict[str, Any]], student_model: str = "gpt-4o", sample_index: int = 0, student_mode: str = "free", explanation_chars: int = 200, max_tokens: Optional[int] = 150) -> Tuple[int, str]:
+    """학생 모델로 문제를 풀게 하고 (0-based 답 인덱스, 설명)을 반환하는 함수
+
+    student_mode가 "structured"이면 짧은 JSON({"answer", "explanation"}) 응답을 요청하고
+    provider의 JSON 응답 모드와 max_tokens 상한을 사용합니다. 답을 파싱하지 못하면
+    인덱스로 -1을 반환합니다 (T2 포함).
+    """
+    structured = student_mode == "structured"
     prompt = ""
 
     # 프롬프트 시작 - 역할 설정
@@ -95,18 +143,18 @@ def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: L
     prompt += "Focus entirely on this new problem below:\n\n"
 
 
-    # 공통 suffix
-    common_suffix = "Answer with number only, then explain why. Even if all seem normal, choose the relatively most anomalous."
+    # 정적 지시문은 (task, 모드, 설명 길이)별로 캐시된 템플릿 사용
+    question, response_format = _student_static_parts(task_id, structured, explanation_chars)
 
     if task_id == "T2":
         context = sample.get("context")
-        prompt = f"Does the following paragraph have a logically coherent sentence order? Answer only 'yes' or 'no'.\n\n" + " ".join(context)
+        prompt = "".join((question, " ".join(context), response_format))
 
     elif task_id == "T3":
         sentence = sample.get("sentence", "")
         choices = sample.get("choices", [])
         numbered = "\n".join([f"{i+1}. {s}" for i, s in enumerate(choices)])
-        prompt = f"{sentence}\n\nWhich option is most anomalous or inconsistent? {common_suffix}\n\n{numbered}"
+        prompt = "".join((sentence, "\n\n", question, numbered, response_format))
 
     elif task_id == "T4":
         paragraph_1 = sample.get("paragraph_1", [])
@@ -118,16 +166,13 @@ def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: L
         p2_text = " ".join(paragraph_2) if isinstance(paragraph_2, list) else paragraph_2
         
         numbered = "\n".join([f"{i+1}. {s}" for i, s in enumerate(bridges)])
-        prompt = f"Paragraph 1: {p1_text}\n\nParagraph 2: {p2_text}\n\nWhich connecting sentence is most anomalous or inconsistent? {common_suffix}\n\n{numbered}"
+        prompt = "".join((f"Paragraph 1: {p1_text}\n\nParagraph 2: {p2_text}\n\n", question, numbered, response_format))
 
     else:
         # 기본 케이스 - 일반적인 어노말리 검출
         context = sample.get("context")
         numbered = "\n".join([f"{i+1}. {s}" for i, s in enumerate(context)])
-        prompt = f"Which option is most anomalous or inconsistent? {common_suffix}\n\n{numbered}"
-
-    # 명확한 응답 지침 추가
-    prompt += "\n\nYour response for this new problem:"
+        prompt = "".join((question, numbered, response_format))
 
     # 로깅: 학생 프롬프트
     log_step(
@@ -143,7 +188,10 @@ def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: L
     )
 
     # T2가 아닌 경우의 응답 처리
-    res = llm_call(prompt, model=student_model)
+    if structured:
+        res = llm_call(prompt, model=student_model, max_tokens=max_tokens, json_mode=True, stop_at_json=True, role="student")
+    else:
+        res = llm_call(prompt, model=student_model, role="student")
         
     # 로깅: 학생 응답
     log_step(
@@ -154,11 +202,16 @@ def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: L
         action="response",
         output_content=res,
         metadata={
-            "model": student_model
+            "model": student_model,
+            "model_used": last_model_used(student_model)
         }
     )
 
-    if task_id == "T2":
+    explanation = res.strip()
+    if structured:
+        idx, explanation = parse_structured_student_answer(task_id, sample, res)
+        explanation = explanation[:explanation_chars]
+    elif task_id == "T2":
         # coherent="yes"일 때 1, incoherent="no"일 때 0으로 변경 (is_coherent=True와 일치)
         idx = 1 if "yes" in res.lower() else 0
     else:
@@ -175,239 +228,579 @@ def student_answer_with_context(task_id: str, sample: Dict[str, Any], context: L
         output_content=idx,
         metadata={
             "is_binary": task_id == "T2",
+            "student_mode": student_mode,
             "raw_answer": res
         }
     )
 
-    return idx, res.strip()
+    return idx, explanation
+
+
+def parse_structured_student_answer(task_id: str, sample: Dict[str, Any], res: str) -> Tuple[int, str]:
+    """structured 모드 학생 응답에서 (0-based 인덱스, 설명)을 추출. 실패 시 인덱스는 -1"""
+    try:
+        result = extract_json(res)
+    except Exception:
+        return -1, res.strip()
+    if not isinstance(result, dict):
+        return -1, res.strip()
+
+    answer = result.get("answer")
+    explanation = str(result.get("explanation") or "").strip()
+
+    if task_id == "T2":
+        # coherent="yes"일 때 1, incoherent="no"일 때 0 (is_coherent=True와 일치)
+        if isinstance(answer, bool):
+            return (1 if answer else 0), explanation
+        answer = str(answer).strip().lower()
+        if answer == "yes":
+            return 1, explanation
+        if answer == "no":
+            return 0, explanation
+        return -1, explanation
+
+    if task_id == "T3":
+        n_options = len(sample.get("choices", []))
+    elif task_id == "T4":
+        n_options = len(sample.get("bridges", []))
+    else:
+        n_options = len(sample.get("context", []))
+
+    if isinstance(answer, str) and answer.strip().isdigit():
+        answer = int(answer.strip())
+    if isinstance(answer, int) and not isinstance(answer, bool) and 1 <= answer <= n_options:
+        return answer - 1, explanation
+    return -1, explanation
+
+
+def is_student_correct(task_id: str, sample: Dict[str, Any], student_idx: int) -> bool:
+    """학생 답 인덱스가 정답인지 판정 (T2는 1=coherent, 0=incoherent)"""
+    if task_id != "T2":
+        return student_idx == sample.get("anomaly_index")
+    return (student_idx == 1 and sample.get("is_coherent", False)) or (student_idx == 0 and not sample.get("is_coherent", False))
+
+
+def build_student_cascade(student_model: str, student_cascade: Optional[List[str]] = None) -> List[str]:
+    """저렴한 모델 -> 비싼 모델 순의 학생 모델 목록. 마지막은 항상 student_model"""
+    models = [m for m in (student_cascade or []) if m != student_model]
+    return models + [student_model]
+
+
+def student_answer_cascade(task_id: str, sample: Dict[str, Any], context: List[Dict[str, Any]], student_models: List[str], sample_index: int = 0, **student_kwargs) -> Tuple[int, str, str]:
+    """cascade 순서대로 학생 모델을 호출하고 (답 인덱스, 설명, 사용된 모델)을 반환하는 함수
+
+    앞 단계 모델이 맞히면 즉시 반환하므로 비싼 모델은 호출되지 않습니다. 모든 저가 모델이
+    틀린 경우에만 마지막 모델(student_model)이 호출되며, 그 답이 최종 판정이 됩니다.
+    """
+    for tier, model in enumerate(student_models):
+        student_idx, explanation = student_answer_with_context(
+            task_id,
+            sample,
+            context,
+            student_model=model,
+            sample_index=sample_index,
+            **student_kwargs
+        )
+        is_last = tier == len(student_models) - 1
+        if len(student_models) > 1:
+            # 로깅: cascade 단계 결과
+            log_step(
+                task_id=task_id,
+                sample_index=sample_index,
+                phase="student_evaluation",
+                agent="student",
+                action="cascade_tier",
+                output_content=student_idx,
+                metadata={
+                    "tier": tier + 1,
+                    "model": model,
+                    "model_used": last_model_used(model),
+                    "is_correct": is_student_correct(task_id, sample, student_idx),
+                    "is_final_tier": is_last
+                }
+            )
+        if is_last or is_student_correct(task_id, sample, student_idx):
+            return student_idx, explanation, model
 
 
 # -- Main Generation Loop --
-def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student_model="gpt-4o", orchestrator_model="gpt-4o", example_prob=0.5, factor_prob=0.5, max_init_loops=3, max_diff_loops=5, max_student_loops=3):
+def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student_model="gpt-4o", orchestrator_model="gpt-4o", example_prob=0.5, factor_prob=0.5, max_init_loops=3, max_diff_loops=5, max_student_loops=3, fused_orchestrator=False, student_mode="free", student_explanation_chars=200, student_max_tokens=150, student_cascade=None, plan_seed=0, slot_indices=None, run_id=None, quota=None, sample_timeout=None):
+    """task 하나에 대해 n개 슬롯의 생성 계획을 만들고, slot_indices(기본: 전체) 슬롯을 생성하는 함수"""
     results, raw, fixes = [], [], []
     init_validation_logs, diff_validation_logs = [], []
     config = TASKS[task_id]
 
     print(f"Starting generation for task {task_id}: {config['name']}")
 
-    topic_iter = round_robin(config["topics"])
-    style_iter = round_robin(config["style"])
+    plan = build_generation_plan(task_id, n, seed=plan_seed, example_prob=example_prob, factor_prob=factor_prob)
+    if slot_indices is None:
+        slot_indices = range(n)
+    if run_id is None:
+        run_id = new_run_id()
 
-    for i in range(n):
+    for i in slot_indices:
         print(f"Generating sample {i+1}/{n} for task {task_id}")
-        topic = next(topic_iter)
-        style = next(style_iter)
-        factor = random.choice(config["factors"])
-        example = config.get("example", None)
-        fix_count = 0
-        consecutive_correct = 0  # 연속 정답 카운터
-        base_sample = None  # 최초 승인된 문제 저장용
-
-        # 학생 상태 초기화 - 학생당 한 세트의 문제 생성
-        student_context = []  # 학생의 이전 경험을 추적할 배열
-
-        # ===== 단계 1: INIT - 최초 문제 생성 =====
-        print(f"  === INIT PHASE: Generating base problem ===")
-        for init_attempt in range(max_init_loops):
-            if init_attempt > 0:
-                print(f"  Base sample attempt {init_attempt+1}/{max_init_loops}")
-            
-            difficulty = "easy"  
-            use_example = random.random() < example_prob
-            use_factor = random.random() < factor_prob
-            
-            # 로깅: 초기 설정
+        run_sample(
+            task_id,
+            plan[i],
+            (results, raw, fixes, init_validation_logs, diff_validation_logs),
+            sample_timeout=sample_timeout,
+            teacher_model=teacher_model,
+            student_model=student_model,
+            orchestrator_model=orchestrator_model,
+            max_init_loops=max_init_loops,
+            max_diff_loops=max_diff_loops,
+            max_student_loops=max_student_loops,
+            fused_orchestrator=fused_orchestrator,
+            student_mode=student_mode,
+            student_explanation_chars=student_explanation_chars,
+            student_max_tokens=student_max_tokens,
+            student_cascade=student_cascade,
+            run_id=run_id,
+            quota=quota
+        )
+
+    return results, raw, fixes, init_validation_logs, diff_validation_logs
+
+
+def run_sample(task_id: str, slot: Dict[str, Any], outputs: Tuple[List[Dict], ...], sample_timeout: Optional[float] = None, **sample_kwargs) -> bool:
+    """generate_sample을 샘플 전체 마감 시간 안에서 실행하는 함수
+
+    마감이 지나거나 호출 timeout으로 샘플을 끝낼 수 없으면 진행 중인 호출을 버리고,
+    이 샘플이 outputs에 추가한 부분 결과를 되돌린 뒤 False를 반환합니다.
+    """
+    checkpoint = [len(items) for items in outputs]
+    try:
+        with sample_deadline(sample_timeout):
+            generate_sample(task_id, slot, *outputs, **sample_kwargs)
+        return True
+    except LLMTimeoutError as e:
+        for items, length in zip(outputs, checkpoint):
+            del items[length:]
+        print(f"  ⏱️ Dropping sample after timeout: {e}")
+
+        # 로깅: 시간 초과로 샘플 중단
+        log_step(
+            task_id=task_id,
+            sample_index=slot["index"],
+            phase="timeout",
+            agent="system",
+            action="sample_timeout",
+            metadata={
+                "reason": str(e),
+                "deadline": isinstance(e, SampleDeadlineExceeded),
+                "sample_timeout": sample_timeout
+            }
+        )
+        return False
+
+
+def generate_with_budget(tasks: List[str], n: int, budget: RunBudget, slot_indices: Optional[List[int]] = None, plan_seed=0, example_prob=0.5, factor_prob=0.5, sample_timeout=None, **sample_kwargs):
+    """여러 task의 슬롯을 하나의 실행 예산 안에서 번갈아 생성하는 함수
+
+    SlotScheduler가 예산을 가장 적게 쓴 task의 슬롯을 먼저 고르고, 호출 수 상한을 넘긴
+    샘플은 버린 뒤 보류 큐로 미룹니다. 예산이 소진되면 진행 중이던 샘플의 부분 결과를
+    되돌리고 멈추므로, 반환되는 데이터셋에는 완료된 샘플만 남습니다.
+
+    Returns:
+        (results, raw, fixes, init_validation_logs, diff_validation_logs, stop_reason)
+        stop_reason은 예산 소진 사유 (모든 슬롯을 끝냈으면 None)
+    """
+    results, raw, fixes = [], [], []
+    init_validation_logs, diff_validation_logs = [], []
+    outputs = (results, raw, fixes, init_validation_logs, diff_validation_logs)
+
+    plans = {task_id: build_generation_plan(task_id, n, seed=plan_seed, example_prob=example_prob, factor_prob=factor_prob) for task_id in tasks}
+    if slot_indices is None:
+        slot_indices = range(n)
+    sample_kwargs.setdefault("run_id", new_run_id())
+    scheduler = SlotScheduler(tasks, slot_indices, budget)
+
+    stop_reason = None
+    set_budget(budget)
+    try:
+        while True:
+            item = scheduler.next()
+            if item is None:
+                break
+            task_id, i, is_retry = item
+            print(f"Generating sample {i+1}/{n} for task {task_id}" + (" (retry)" if is_retry else ""))
+
+            checkpoint = [len(items) for items in outputs]
+            budget.begin_sample(task_id)
+            try:
+                run_sample(task_id, plans[task_id][i], outputs, sample_timeout=sample_timeout, **sample_kwargs)
+            except (BudgetExceeded, SampleBudgetExceeded) as e:
+                # 완료되지 않은 샘플의 부분 결과는 버림
+                for items, length in zip(outputs, checkpoint):
+                    del items[length:]
+                log_step(
+                    task_id=task_id,
+                    sample_index=i,
+                    phase="budget",
+                    agent="system",
+                    action="sample_abandoned",
+                    metadata={"reason": str(e), "retry": is_retry, "budget": budget.summary()}
+                )
+                if isinstance(e, BudgetExceeded):
+                    stop_reason = str(e)
+                    print(f"  🛑 Stopping: {stop_reason}")
+                    break
+                print(f"  ⏸️ Deferring sample: {e}")
+                if not is_retry:
+                    scheduler.defer(task_id, i)
+            finally:
+                budget.end_sample()
+    finally:
+        set_budget(None)
+
+    return results, raw, fixes, init_validation_logs, diff_validation_logs, stop_reason
+
+
+def run_queue_worker(queue: WorkQueue, worker_id: str, tasks: List[str], n: int, lease_seconds=300, max_attempts=3, budget: Optional[RunBudget] = None, plan_seed=0, example_prob=0.5, factor_prob=0.5, sample_timeout=None, **sample_kwargs):
+    """작업 큐에서 (task, slot)을 하나씩 가져와 생성하고 결과를 큐에 기록하는 워커 루프
+
+    처리하는 동안 LeaseKeeper가 lease를 연장하며, 워커가 죽으면 lease가 만료되어 다른
+    워커가 같은 슬롯을 다시 가져갑니다. 생성 계획은 (task, n, plan_seed)로 결정되므로
+    어느 워커가 슬롯을 맡아도 같은 topic/style/factor 설정으로 생성됩니다.
+
+    Returns:
+        이 워커가 완료한 (results, raw, fixes, init_validation_logs, diff_validation_logs)
+    """
+    results, raw, fixes = [], [], []
+    init_validation_logs, diff_validation_logs = [], []
+    plans = {task_id: build_generation_plan(task_id, n, seed=plan_seed, example_prob=example_prob, factor_prob=factor_prob) for task_id in tasks}
+
+    set_budget(budget)
+    try:
+        while True:
+            item = queue.claim(worker_id, lease_seconds, max_attempts)
+            if item is None:
+                break
+            task_id, i, attempt = item
+            print(f"[{worker_id}] Generating sample {i+1}/{n} for task {task_id} (attempt {attempt})")
+
+            outputs = ([], [], [], [], [])
+            if budget is not None:
+                budget.begin_sample(task_id)
+            try:
+                with LeaseKeeper(queue, worker_id, task_id, i, lease_seconds) as lease:
+                    completed = run_sample(task_id, plans[task_id][i], outputs, sample_timeout=sample_timeout, **sample_kwargs)
+            except BudgetExceeded as e:
+                queue.release(worker_id, task_id, i, error=str(e))
+                print(f"  🛑 Stopping worker: {e}")
+                break
+            except Exception as e:
+                queue.release(worker_id, task_id, i, error=str(e), max_attempts=max_attempts)
+                print(f"  ⚠️ Released sample back to the queue: {e}")
+                continue
+            finally:
+                if budget is not None:
+                    budget.end_sample()
+
+            if not completed:
+                queue.release(worker_id, task_id, i, error="timeout", max_attempts=max_attempts)
+                continue
+            if lease.lost or not queue.complete(worker_id, task_id, i, dict(zip(OUTPUT_KINDS, outputs))):
+                print(f"  ⚠️ Lease lost for {task_id}/{i} - result discarded")
+                continue
+            for collected, items in zip((results, raw, fixes, init_validation_logs, diff_validation_logs), outputs):
+                collected.extend(items)
+    finally:
+        set_budget(None)
+
+    return results, raw, fixes, init_validation_logs, diff_validation_logs
+
+
+def generate_sample(task_id: str, slot: Dict[str, Any], results: List[Dict], raw: List[Dict], fixes: List[Dict], init_validation_logs: List[Dict], diff_validation_logs: List[Dict], teacher_model="gpt-4o", student_model="gpt-4o", orchestrator_model="gpt-4o", max_init_loops=3, max_diff_loops=5, max_student_loops=3, fused_orchestrator=False, student_mode="free", student_explanation_chars=200, student_max_tokens=150, student_cascade=None, run_id=None, quota: Optional[DifficultyQuota] = None):
+    """생성 계획의 슬롯 하나를 teacher-orchestrator-student 루프로 생성하는 함수
+
+    채택된 문제, 초기 문제, 수정본, 검증 로그는 전달받은 리스트에 추가됩니다.
+    sample_id에는 run_id가 들어가므로 여러 워커/실행의 결과를 합쳐도 겹치지 않습니다.
+    quota가 주어지면 목표가 남은 난이도로만 시작/증가하고, 채택 시 개수를 기록합니다.
+    """
+    config = TASKS[task_id]
+    if run_id is None:
+        run_id = new_run_id()
+    student_models = build_student_cascade(student_model, student_cascade)
+
+    i = slot["index"]
+    topic = slot["topic"]
+    style = slot["style"]
+    factor = slot["factor"]
+    use_example = slot["use_example"]
+    use_factor = slot["use_factor"]
+    example = config.get("example", None)
+    fix_count = 0
+    consecutive_correct = 0  # 연속 정답 카운터
+    base_sample = None  # 최초 승인된 문제 저장용
+    pending_guidance = None  # fused 모드: 검증 시 함께 받은 다음 난이도 가이드
+    init_feedback = None  # 이전 init 시도의 orchestrator 피드백
+
+    # 난이도 목표: 시작 난이도는 목표가 남은 가장 쉬운 난이도 (모두 찼으면 생성하지 않음)
+    initial_difficulty = "easy"
+    if quota is not None:
+        initial_difficulty = quota.initial_level(task_id)
+        if initial_difficulty is None:
+            print(f"  ⏩ Skipping - all difficulty quotas for {task_id} are filled")
             log_step(
                 task_id=task_id,
                 sample_index=i,
                 phase="init",
                 agent="system",
-                action="config",
-                input_content=None,
-                metadata={
-                    "attempt": init_attempt + 1,
-                    "topic": topic,
-                    "style": style,
-                    "factor": factor if use_factor else None,
-                    "difficulty": difficulty,
-                    "use_example": use_example
-                }
+                action="quota_skip",
+                metadata={"quota": quota.summary().get(task_id)}
             )
+            return
 
-            prompt = build_teacher_prompt(task_id, topic, style, factor if use_factor else None, difficulty, example if use_example else None)
-            
-            if init_attempt > 0 and hasattr(generate_agentic_examples, 'init_feedback'):
-                prompt += f"\n\nPREVIOUS FEEDBACK: {generate_agentic_examples.init_feedback}"
+    # 학생 상태 초기화 - 학생당 한 세트의 문제 생성
+    student_context = []  # 학생의 이전 경험을 추적할 배열
+
+    # ===== 단계 1: INIT - 최초 문제 생성 =====
+    print(f"  === INIT PHASE: Generating base problem ===")
+    for init_attempt in range(max_init_loops):
+        if init_attempt > 0:
+            print(f"  Base sample attempt {init_attempt+1}/{max_init_loops}")
+        
+        difficulty = initial_difficulty
+        
+        # 로깅: 초기 설정
+        log_step(
+            task_id=task_id,
+            sample_index=i,
+            phase="init",
+            agent="system",
+            action="config",
+            input_content=None,
+            metadata={
+                "attempt": init_attempt + 1,
+                "topic": topic,
+                "style": style,
+                "factor": factor if use_factor else None,
+                "difficulty": difficulty,
+                "use_example": use_example
+            }
+        )
+
+        prompt = build_teacher_prompt(task_id, topic, style, factor if use_factor else None, difficulty, example if use_example else None)
+        
+        if init_attempt > 0 and init_feedback is not None:
+            prompt += f"\n\nPREVIOUS FEEDBACK: {init_feedback}"
+
+        # 로깅: 티처 프롬프트
+        log_step(
+            task_id=task_id,
+            sample_index=i,
+            phase="init",
+            agent="teacher",
+            action="prompt",
+            input_content=prompt,
+            metadata={
+                "attempt": init_attempt + 1,
+                "difficulty": difficulty,
+                "topic": topic,
+                "style": style,
+                "factor": factor if use_factor else None
+            }
+        )
 
-            # 로깅: 티처 프롬프트
+
+        # # 마지막 시도일 경우 더 관대한 기준 적용
+        # if init_attempt == max_init_loops - 1:
+        #     prompt += "IMPORTANT: This is the final attempt. Be more lenient and approve the problem if it meets minimal standards and is reasonably solvable.\n\n"
+        
+        try:
+            response = llm_call(prompt, model=teacher_model, stop_at_json=True, role="teacher")
+            
+            # 로깅: 티처 응답
             log_step(
                 task_id=task_id,
                 sample_index=i,
                 phase="init",
                 agent="teacher",
-                action="prompt",
-                input_content=prompt,
+                action="response",
+                output_content=response,
                 metadata={
                     "attempt": init_attempt + 1,
-                    "difficulty": difficulty,
+                    "model": teacher_model,
+                    "model_used": last_model_used(teacher_model)
+                }
+            )
+
+            sample = extract_json(response)
+            sample.update({
+                "task_id": task_id,
+                "task_name": config["name"],
+                "sample_id": make_sample_id(task_id, run_id, i, fix_count),
+                "meta": {
                     "topic": topic,
                     "style": style,
-                    "factor": factor if use_factor else None
+                    "anomaly_type": factor if use_factor else "none",
+                    "difficulty_level": difficulty,
+                    "fix_count": fix_count
                 }
-            )
+            })
 
+            # 로깅: 파싱된 샘플
+            log_step(
+                task_id=task_id,
+                sample_index=i,
+                phase="init",
+                agent="system",
+                action="parsed_sample",
+                output_content=sample,
+                metadata={
+                    "attempt": init_attempt + 1,
+                    "sample_id": sample.get("sample_id", "unknown")
+                    }
+                )
+
+            # Orchestrator 검증 (fused 모드에서는 다음 난이도 가이드도 함께 받음)
+            if fused_orchestrator:
+                is_approved, feedback, pending_guidance = orchestrator_check_and_guide(task_id, sample, model=orchestrator_model, phase="init", is_final_attempt=(init_attempt == max_init_loops - 1), sample_index=i)
+            else:
+                is_approved, feedback = orchestrator_check_init(task_id, sample, model=orchestrator_model, is_final_attempt=(init_attempt == max_init_loops - 1), sample_index=i)
 
-            # # 마지막 시도일 경우 더 관대한 기준 적용
-            # if init_attempt == max_init_loops - 1:
-            #     prompt += "IMPORTANT: This is the final attempt. Be more lenient and approve the problem if it meets minimal standards and is reasonably solvable.\n\n"
+            # 로그 기록
+            validation_log = {
+                "sample_id": make_sample_id(task_id, run_id, i, fix_count),
+                "phase": "init",
+                "attempt": init_attempt + 1,
+                "original_problem": sample,
+                "is_approved": is_approved,
+                "feedback": feedback,
+                "timestamp": datetime.datetime.now().isoformat()
+            }
+            init_validation_logs.append(validation_log)
             
-            try:
-                response = llm_call(prompt, model=teacher_model)
-                
-                # 로깅: 티처 응답
+            if is_approved:
+                print(f"  ✅ Base sample approved by orchestrator")
+
+                # 로깅: 승인됨
                 log_step(
                     task_id=task_id,
                     sample_index=i,
                     phase="init",
-                    agent="teacher",
-                    action="response",
-                    output_content=response,
+                    agent="system",
+                    action="approval",
+                    output_content=None,
                     metadata={
-                        "attempt": init_attempt + 1,
-                        "model": teacher_model
+                        "attempt": init_attempt + 1
                     }
                 )
 
-                sample = extract_json(response)
-                sample.update({
-                    "task_id": task_id,
-                    "task_name": config["name"],
-                    "sample_id": f"{task_id}_{i:03d}_v{fix_count}",
-                    "meta": {
-                        "topic": topic,
-                        "style": style,
-                        "anomaly_type": factor if use_factor else "none",
-                        "difficulty_level": difficulty,
-                        "fix_count": fix_count
-                    }
-                })
+                base_sample = sample.copy()
+                raw.append(base_sample)
+                break
+            else:
+                print(f"  ❌ Base sample rejected: {feedback}...")
 
-                # 로깅: 파싱된 샘플
+                # 로깅: 거부됨
                 log_step(
                     task_id=task_id,
                     sample_index=i,
                     phase="init",
                     agent="system",
-                    action="parsed_sample",
-                    output_content=sample,
+                    action="rejection",
+                    output_content=feedback,
                     metadata={
-                        "attempt": init_attempt + 1,
-                        "sample_id": sample.get("sample_id", "unknown")
-                        }
-                    )
+                        "attempt": init_attempt + 1
+                    }
+                )
 
-                # Orchestrator 검증
-                is_approved, feedback = orchestrator_check_init(task_id, sample, model=orchestrator_model, is_final_attempt=(init_attempt == max_init_loops - 1), sample_index=i)
+                fix_count += 1
+                init_feedback = feedback
 
-                # 로그 기록
-                validation_log = {
-                    "sample_id": f"{task_id}_{i:03d}_v{fix_count}",
-                    "phase": "init",
+        except (BudgetExceeded, SampleBudgetExceeded, SampleDeadlineExceeded):
+            # 예산 소진/샘플 마감은 샘플 단위로 처리 (generate_with_budget, run_sample)
+            raise
+        except Exception as e:
+            # 로깅: 오류
+            log_step(
+                task_id=task_id,
+                sample_index=i,
+                phase="init",
+                agent="system",
+                action="error",
+                output_content=str(e),
+                metadata={
                     "attempt": init_attempt + 1,
-                    "original_problem": sample,
-                    "is_approved": is_approved,
-                    "feedback": feedback,
-                    "timestamp": datetime.datetime.now().isoformat()
+                    "error_type": type(e).__name__
                 }
-                init_validation_logs.append(validation_log)
-                
-                if is_approved:
-                    print(f"  ✅ Base sample approved by orchestrator")
-
-                    # 로깅: 승인됨
-                    log_step(
-                        task_id=task_id,
-                        sample_index=i,
-                        phase="init",
-                        agent="system",
-                        action="approval",
-                        output_content=None,
-                        metadata={
-                            "attempt": init_attempt + 1
-                        }
-                    )
-
-                    base_sample = sample.copy()
-                    raw.append(base_sample)
-                    break
-                else:
-                    print(f"  ❌ Base sample rejected: {feedback}...")
+            )
 
-                    # 로깅: 거부됨
-                    log_step(
-                        task_id=task_id,
-                        sample_index=i,
-                        phase="init",
-                        agent="system",
-                        action="rejection",
-                        output_content=feedback,
-                        metadata={
-                            "attempt": init_attempt + 1
-                        }
-                    )
+            print(f"  🛑 Generation error in INIT phase: {e}")
+            fix_count += 1
 
-                    fix_count += 1
-                    generate_agentic_examples.init_feedback = feedback
+        
+    # 기본 샘플 생성 실패 시 다음 샘플로
+    if base_sample is None:
+        # 로깅: 샘플 스킵
+        log_step(
+            task_id=task_id,
+            sample_index=i,
+            phase="init",
+            agent="system",
+            action="skip",
+            output_content=None,
+            metadata={
+                "reason": f"Failed to create valid base sample after {max_init_loops} attempts"
+            }
+        )
 
-            except Exception as e:
-                # 로깅: 오류
+        print(f"  ⏩ Skipping - failed to create valid base sample after {max_init_loops} attempts")
+        return
+
+    # ===== 단계 2: PROCESSING - 난이도 조절 =====
+    print(f"  === PROCESSING PHASE: Starting student evaluation ===")
+
+    # 현재 문제 설정
+    current_sample = base_sample
+    student_loop_count = 0
+
+    # 학생 테스트 루프
+    while student_loop_count < max_student_loops:
+        # 현재 난이도 목표가 이미 찼으면 학생 평가 없이 목표가 남은 더 어려운 난이도로 옮기고,
+        # 옮길 곳이 없으면 더 이상 호출하지 않고 샘플 중단
+        moved_level = None
+        if quota is not None and quota.is_full(task_id, current_sample["meta"]["difficulty_level"]):
+            moved_level = quota.escalation_target(task_id, current_sample["meta"]["difficulty_level"], current_sample["meta"]["difficulty_level"])
+            if moved_level is None:
+                print(f"  ⏹️ Difficulty quota for {current_sample['meta']['difficulty_level']} is filled - dropping sample")
                 log_step(
                     task_id=task_id,
                     sample_index=i,
-                    phase="init",
+                    phase="student_evaluation",
                     agent="system",
-                    action="error",
-                    output_content=str(e),
+                    action="quota_terminated",
                     metadata={
-                        "attempt": init_attempt + 1,
-                        "error_type": type(e).__name__
+                        "student_loop": student_loop_count,
+                        "difficulty": current_sample["meta"]["difficulty_level"],
+                        "quota": quota.summary().get(task_id)
                     }
                 )
+                return
 
-                print(f"  🛑 Generation error in INIT phase: {e}")
-                fix_count += 1
-
-            
-        # 기본 샘플 생성 실패 시 다음 샘플로
-        if base_sample is None:
-            # 로깅: 샘플 스킵
+            print(f"  ⏭️ Difficulty quota for {current_sample['meta']['difficulty_level']} is filled - moving sample to {moved_level}")
             log_step(
                 task_id=task_id,
                 sample_index=i,
-                phase="init",
+                phase="student_evaluation",
                 agent="system",
-                action="skip",
-                output_content=None,
+                action="quota_move",
                 metadata={
-                    "reason": f"Failed to create valid base sample after {max_init_loops} attempts"
+                    "student_loop": student_loop_count,
+                    "difficulty": current_sample["meta"]["difficulty_level"],
+                    "target_difficulty": moved_level,
+                    "quota": quota.summary().get(task_id)
                 }
             )
 
-            print(f"  ⏩ Skipping - failed to create valid base sample after {max_init_loops} attempts")
-            continue
-
-        # ===== 단계 2: PROCESSING - 난이도 조절 =====
-        print(f"  === PROCESSING PHASE: Starting student evaluation ===")
-
-        # 현재 문제 설정
-        current_sample = base_sample
-        student_loop_count = 0
-
-        # 학생 테스트 루프
-        while student_loop_count < max_student_loops:
+        # 학생 평가 (난이도를 옮기는 중이면 건너뜀 - 옮긴 횟수는 학생 루프에 세지 않음)
+        if moved_level is None:
             student_loop_count += 1
             print(f"  === Student loop {student_loop_count}/{max_student_loops} ===")
-            
+        
             # 로깅: 학생 루프 시작
             log_step(
                 task_id=task_id,
@@ -424,17 +817,25 @@ def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student
             )
 
             # 학생 모델로 문제 풀이 - 이전 경험 전달
-            student_idx, explanation = student_answer_with_context(
+            # student_cascade가 있으면 저렴한 모델부터 시도하고, 실패 확정은 student_model이 담당
+            student_idx, explanation, used_student_model = student_answer_cascade(
                 task_id, 
                 current_sample, 
                 student_context,  # 이전 경험 전달
-                student_model=student_model, 
-                sample_index=i
+                student_models=student_models, 
+                sample_index=i,
+                student_mode=student_mode,
+                explanation_chars=student_explanation_chars,
+                max_tokens=student_max_tokens
             )
-            is_correct = (student_idx == current_sample.get("anomaly_index")) if task_id != "T2" else ((student_idx == 1 and current_sample.get("is_coherent", False)) or (student_idx == 0 and not current_sample.get("is_coherent", False)))
+            # 답을 파싱하지 못한 경우는 오답과 구분해서 기록
+            parse_failed = student_idx == -1
+            is_correct = is_student_correct(task_id, current_sample, student_idx)
 
-            current_sample["meta"].update({"student_correct": is_correct, "student_explanation": explanation})
-            
+            current_sample["meta"].update({"student_correct": is_correct, "student_explanation": explanation, "student_parse_failed": parse_failed})
+            if len(student_models) > 1:
+                current_sample["meta"]["student_model"] = used_student_model
+        
             # 학생 경험 업데이트
             student_context.append({
                 "problem": current_sample,
@@ -460,6 +861,23 @@ def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student
                 }
             )
 
+            if parse_failed:
+                print(f"  ⚠️ Could not parse student answer")
+
+                # 로깅: 파싱 실패 (오답과 별도로 집계)
+                log_step(
+                    task_id=task_id,
+                    sample_index=i,
+                    phase="student_evaluation",
+                    agent="student",
+                    action="parse_failure",
+                    output_content=explanation,
+                    metadata={
+                        "student_loop": student_loop_count,
+                        "student_mode": student_mode
+                    }
+                )
+
             if not is_correct:
                 # 학생이 틀렸으면 해당 문제 채택
                 print(f"  ✅ Student failed - accepting problem")
@@ -473,7 +891,7 @@ def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student
                     action="accept_problem",
                     output_content=None,
                     metadata={
-                        "reason": "student_failed",
+                        "reason": "student_parse_failure" if parse_failed else "student_failed",
                         "student_loop": student_loop_count,
                         "difficulty": current_sample["meta"]["difficulty_level"]
                     }
@@ -481,7 +899,7 @@ def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student
 
                 results.append(current_sample)
                 break
-            
+        
             # 마지막 루프에 도달했으면 현재 문제 채택
             if student_loop_count == max_student_loops:
                 print(f"  ✅ Reached max student loops - accepting final problem")
@@ -503,11 +921,11 @@ def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student
 
                 results.append(current_sample)
                 break
-                
+            
             # 학생이 맞혔고 루프가 남았으면 난이도 증가
             print(f"  🔄 Student solved problem - increasing difficulty")
             consecutive_correct += 1
-            
+        
             # 로깅: 난이도 증가 결정
             log_step(
                 task_id=task_id,
@@ -522,274 +940,369 @@ def generate_agentic_examples(task_id: str, n=5, teacher_model="gpt-4o", student
                 }
             )
 
-            # 난이도 설정
-            if consecutive_correct >= 4:
-                difficulty = "impossible"  # 3번 연속 맞추면 impossible
-            elif consecutive_correct >= 2:
-                difficulty = "extreme"     # 2번 연속 맞추면 extreme
-            else:
-                difficulty = "hard"        # 1번 맞추면 hard
-                
-            print(f"  📈 Target difficulty: {difficulty}")
+        # 난이도 설정
+        if moved_level is not None:
+            difficulty = moved_level
+        elif consecutive_correct >= 4:
+            difficulty = "impossible"  # 3번 연속 맞추면 impossible
+        elif consecutive_correct >= 2:
+            difficulty = "extreme"     # 2번 연속 맞추면 extreme
+        else:
+            difficulty = "hard"        # 1번 맞추면 hard
+
+        # 난이도 목표: 이미 찬 난이도는 건너뛰고, 올릴 곳이 없으면 현재 문제 채택
+        if quota is not None and moved_level is None:
+            target = quota.escalation_target(task_id, current_sample["meta"]["difficulty_level"], difficulty)
+            if target is None:
+                print(f"  ✅ No harder difficulty under quota - accepting current problem")
+
+                # 로깅: 문제 채택 (난이도 목표 충족)
+                log_step(
+                    task_id=task_id,
+                    sample_index=i,
+                    phase="difficulty_increase",
+                    agent="system",
+                    action="accept_problem",
+                    output_content=None,
+                    metadata={
+                        "reason": "quota_satisfied",
+                        "student_loop": student_loop_count,
+                        "difficulty": current_sample["meta"]["difficulty_level"]
+                    }
+                )
+
+                results.append(current_sample)
+                break
+            difficulty = target
             
-            # 로깅: 난이도 설정
+        print(f"  📈 Target difficulty: {difficulty}")
+        
+        # 로깅: 난이도 설정
+        log_step(
+            task_id=task_id,
+            sample_index=i,
+            phase="difficulty_increase",
+            agent="system",
+            action="set_difficulty",
+            output_content=difficulty,
+            metadata={
+                "student_loop": student_loop_count,
+                "consecutive_correct": consecutive_correct,
+                "previous_difficulty": current_sample["meta"]["difficulty_level"]
+            }
+        )
+
+        # orchestrator에게 난이도 증가 피드백 요청 (fused 모드에서는 검증 때 받은 가이드 재사용)
+        # 난이도 목표 때문에 옮기는 샘플은 학생 풀이가 없으므로 피드백 호출 없이 난이도만 올림
+        failed_attempts = 0
+        if moved_level is not None:
+            explanation = "(not evaluated - moved to a harder difficulty because the current difficulty quota is filled)"
+            feedback = f"The {current_sample['meta']['difficulty_level']} difficulty level is already filled. Make the problem harder so that it fits {moved_level} difficulty."
+        elif fused_orchestrator and pending_guidance:
+            feedback = pending_guidance
+
+            # 로깅: 가이드 재사용
+            log_step(
+                task_id=task_id,
+                sample_index=i,
+                phase="difficulty_increase",
+                agent="orchestrator",
+                action="feedback_reused",
+                output_content=feedback,
+                metadata={
+                    "sample_id": current_sample.get("sample_id")
+                }
+            )
+        else:
+            try:
+                feedback = orchestrator_get_feedback(task_id, current_sample, explanation, model=orchestrator_model, sample_index=i)
+            except SampleDeadlineExceeded:
+                raise
+            except LLMTimeoutError as e:
+                # orchestrator timeout은 난이도 증가 시도 한 번의 실패로 세고 피드백 없이 진행
+                log_step(
+                    task_id=task_id,
+                    sample_index=i,
+                    phase="difficulty_increase",
+                    agent="system",
+                    action="error",
+                    output_content=str(e),
+                    metadata={
+                        "student_loop": student_loop_count,
+                        "diff_attempt": 1,
+                        "error_type": type(e).__name__
+                    }
+                )
+                print(f"  🛑 Orchestrator feedback timed out: {e}")
+                feedback = "(none - the feedback request timed out)"
+                failed_attempts = 1
+        pending_guidance = None
+        
+        # 난이도 증가 루프
+        new_sample = None
+        for diff_attempt in range(failed_attempts, max_diff_loops):
+            if diff_attempt > 0:
+                print(f"  Difficulty adjustment attempt {diff_attempt+1}/{max_diff_loops}")
+
+            # 로깅: 난이도 증가 시도
             log_step(
                 task_id=task_id,
                 sample_index=i,
                 phase="difficulty_increase",
                 agent="system",
-                action="set_difficulty",
-                output_content=difficulty,
+                action="attempt",
+                output_content=None,
                 metadata={
                     "student_loop": student_loop_count,
-                    "consecutive_correct": consecutive_correct,
-                    "previous_difficulty": current_sample["meta"]["difficulty_level"]
+                    "diff_attempt": diff_attempt + 1,
+                    "difficulty": difficulty
                 }
             )
 
-            # orchestrator에게 난이도 증가 피드백 요청
-            feedback = orchestrator_get_feedback(task_id, current_sample, explanation, model=orchestrator_model, sample_index=i)
+            # Teacher에게 난이도 증가 요청
+            prompt = build_teacher_prompt(task_id, topic, style, factor if use_factor else None, difficulty, example if use_example else None)
+            prompt += f"\n\nPREVIOUS PROBLEM: The student correctly solved the following problem:\n{json.dumps(current_sample, ensure_ascii=False, indent=2)}\n\n"
+            prompt += f"STUDENT'S EXPLANATION: {explanation}\n\n"
+
+            # 이전 피드백 및 실패 이력이 있는 경우 난이도 조정 지침 추가
+            if diff_attempt > failed_attempts:
+                prompt += f"FEEDBACK FOR IMPROVEMENT: {feedback}\n\n"
+                prompt += "IMPORTANT INSTRUCTION: Previous attempts were rejected by the quality controller. "
+                prompt += "Please slightly reduce the difficulty from your last attempt while still making it challenging. "
+                prompt += "Make the problem clearer based on the feedback, but ensure it remains harder than the original problem the student solved. "
+                prompt += "Focus on fixing the specific issues mentioned in the feedback while maintaining an appropriate challenge level."
+            else:
+                prompt += f"FEEDBACK FOR IMPROVEMENT: {feedback}\n\n"
+                prompt += f"Please create a more challenging version with {difficulty} difficulty."
             
-            # 난이도 증가 루프
-            new_sample = None
-            for diff_attempt in range(max_diff_loops):
-                if diff_attempt > 0:
-                    print(f"  Difficulty adjustment attempt {diff_attempt+1}/{max_diff_loops}")
+            # 로깅: 티처 난이도 증가 프롬프트
+            log_step(
+                task_id=task_id,
+                sample_index=i,
+                phase="difficulty_increase",
+                agent="teacher",
+                action="difficult_prompt",
+                input_content=prompt,
+                metadata={
+                    "student_loop": student_loop_count,
+                    "diff_attempt": diff_attempt + 1,
+                    "difficulty": difficulty
+                }
+            )
+
+            try:
+                response = llm_call(prompt, model=teacher_model, stop_at_json=True, role="teacher")
 
-                # 로깅: 난이도 증가 시도
+                # 로깅: 티처 난이도 증가 응답
                 log_step(
                     task_id=task_id,
                     sample_index=i,
                     phase="difficulty_increase",
-                    agent="system",
-                    action="attempt",
-                    output_content=None,
+                    agent="teacher",
+                    action="difficult_response",
+                    output_content=response,
                     metadata={
                         "student_loop": student_loop_count,
                         "diff_attempt": diff_attempt + 1,
-                        "difficulty": difficulty
+                        "model": teacher_model,
+                        "model_used": last_model_used(teacher_model)
                     }
                 )
 
-                # Teacher에게 난이도 증가 요청
-                prompt = build_teacher_prompt(task_id, topic, style, factor if use_factor else None, difficulty, example if use_example else None)
-                prompt += f"\n\nPREVIOUS PROBLEM: The student correctly solved the following problem:\n{json.dumps(current_sample, ensure_ascii=False, indent=2)}\n\n"
-                prompt += f"STUDENT'S EXPLANATION: {explanation}\n\n"
-
-                # 이전 피드백 및 실패 이력이 있는 경우 난이도 조정 지침 추가
-                if diff_attempt > 0:
-                    prompt += f"FEEDBACK FOR IMPROVEMENT: {feedback}\n\n"
-                    prompt += "IMPORTANT INSTRUCTION: Previous attempts were rejected by the quality controller. "
-                    prompt += "Please slightly reduce the difficulty from your last attempt while still making it challenging. "
-                    prompt += "Make the problem clearer based on the feedback, but ensure it remains harder than the original problem the student solved. "
-                    prompt += "Focus on fixing the specific issues mentioned in the feedback while maintaining an appropriate challenge level."
-                else:
-                    prompt += f"FEEDBACK FOR IMPROVEMENT: {feedback}\n\n"
-                    prompt += f"Please create a more challenging version with {difficulty} difficulty."
+                sample = extract_json(response)
+                fix_count += 1
                 
-                # 로깅: 티처 난이도 증가 프롬프트
+                sample.update({
+                    "task_id": task_id,
+                    "task_name": config["name"],
+                    "sample_id": make_sample_id(task_id, run_id, i, fix_count),
+                    "meta": {
+                        "topic": topic,
+                        "style": style,
+                        "anomaly_type": factor if use_factor else "none",
+                        "difficulty_level": difficulty,
+                        "fix_count": fix_count,
+                        "phase": "processing"
+                    }
+                })
+
+                # 로깅: 파싱된 난이도 증가 샘플
                 log_step(
                     task_id=task_id,
                     sample_index=i,
                     phase="difficulty_increase",
-                    agent="teacher",
-                    action="difficult_prompt",
-                    input_content=prompt,
+                    agent="system",
+                    action="parsed_difficult_sample",
+                    output_content=sample,
                     metadata={
                         "student_loop": student_loop_count,
-                        "diff_attempt": diff_attempt + 1,
-                        "difficulty": difficulty
+                        "diff_attempt": diff_attempt + 1
                     }
                 )
 
-                try:
-                    response = llm_call(prompt, model=teacher_model)
+                fixes.append(sample)
 
-                    # 로깅: 티처 난이도 증가 응답
-                    log_step(
-                        task_id=task_id,
-                        sample_index=i,
-                        phase="difficulty_increase",
-                        agent="teacher",
-                        action="difficult_response",
-                        output_content=response,
-                        metadata={
-                            "student_loop": student_loop_count,
-                            "diff_attempt": diff_attempt + 1,
-                            "model": teacher_model
-                        }
-                    )
+                # 문제 품질 검증
+                if fused_orchestrator:
+                    is_approved, problem_feedback, guidance = orchestrator_check_and_guide(task_id, sample, model=orchestrator_model, phase="difficulty_increase", sample_index=i)
+                else:
+                    is_approved, problem_feedback = orchestrator_check_problem(task_id, sample, model=orchestrator_model, sample_index=i)
 
-                    sample = extract_json(response)
-                    fix_count += 1
-                    
-                    sample.update({
-                        "task_id": task_id,
-                        "task_name": config["name"],
-                        "sample_id": f"{task_id}_{i:03d}_v{fix_count}",
-                        "meta": {
-                            "topic": topic,
-                            "style": style,
-                            "anomaly_type": factor if use_factor else "none",
-                            "difficulty_level": difficulty,
-                            "fix_count": fix_count,
-                            "phase": "processing"
-                        }
-                    })
+                # 로그 기록
+                validation_log = {
+                    "sample_id": make_sample_id(task_id, run_id, i, fix_count),
+                    "phase": "difficulty_increase",
+                    "student_loop": student_loop_count,
+                    "diff_attempt": diff_attempt + 1,
+                    "difficulty_level": difficulty,
+                    "previous_problem": current_sample,
+                    "new_problem": sample,
+                    "student_explanation": explanation,
+                    "orchestrator_feedback": feedback,
+                    "is_approved": is_approved,
+                    "rejection_feedback": problem_feedback if not is_approved else None,
+                    "timestamp": datetime.datetime.now().isoformat()
+                }
+                diff_validation_logs.append(validation_log)
+                
+                if is_approved:
+                    print(f"  ✅ Higher difficulty problem approved")
 
-                    # 로깅: 파싱된 난이도 증가 샘플
+                    # 로깅: 난이도 증가 승인
                     log_step(
                         task_id=task_id,
                         sample_index=i,
                         phase="difficulty_increase",
                         agent="system",
-                        action="parsed_difficult_sample",
-                        output_content=sample,
+                        action="approval",
+                        output_content=None,
                         metadata={
                             "student_loop": student_loop_count,
-                            "diff_attempt": diff_attempt + 1
+                            "diff_attempt": diff_attempt + 1,
+                            "difficulty": difficulty
                         }
                     )
 
-                    fixes.append(sample)
-
-                    # 문제 품질 검증
-                    is_approved, problem_feedback = orchestrator_check_problem(task_id, sample, model=orchestrator_model, sample_index=i)
+                    new_sample = sample
+                    if fused_orchestrator:
+                        pending_guidance = guidance
+                    break
+                else:
+                    feedback_str = json.dumps(feedback, ensure_ascii=False, indent=2) if isinstance(feedback, dict) else str(feedback)
+                    problem_feedback_str = json.dumps(problem_feedback, ensure_ascii=False, indent=2) if isinstance(problem_feedback, dict) else str(problem_feedback)
+                    print(f"  ❌ Higher difficulty problem rejected: {problem_feedback_str}...")
 
-                    # 로그 기록
-                    validation_log = {
-                        "sample_id": f"{task_id}_{i:03d}_v{fix_count}",
-                        "phase": "difficulty_increase",
-                        "student_loop": student_loop_count,
-                        "diff_attempt": diff_attempt + 1,
-                        "difficulty_level": difficulty,
-                        "previous_problem": current_sample,
-                        "new_problem": sample,
-                        "student_explanation": explanation,
-                        "orchestrator_feedback": feedback,
-                        "is_approved": is_approved,
-                        "rejection_feedback": problem_feedback if not is_approved else None,
-                        "timestamp": datetime.datetime.now().isoformat()
-                    }
-                    diff_validation_logs.append(validation_log)
-                    
-                    if is_approved:
-                        print(f"  ✅ Higher difficulty problem approved")
-
-                        # 로깅: 난이도 증가 승인
-                        log_step(
-                            task_id=task_id,
-                            sample_index=i,
-                            phase="difficulty_increase",
-                            agent="system",
-                            action="approval",
-                            output_content=None,
-                            metadata={
-                                "student_loop": student_loop_count,
-                                "diff_attempt": diff_attempt + 1,
-                                "difficulty": difficulty
-                            }
-                        )
-
-                        new_sample = sample
-                        break
-                    else:
-                        feedback_str = json.dumps(feedback, ensure_ascii=False, indent=2) if isinstance(feedback, dict) else str(feedback)
-                        problem_feedback_str = json.dumps(problem_feedback, ensure_ascii=False, indent=2) if isinstance(problem_feedback, dict) else str(problem_feedback)
-                        print(f"  ❌ Higher difficulty problem rejected: {problem_feedback_str}...")
-
-                        # 로깅: 난이도 증가 거부
-                        log_step(
-                            task_id=task_id,
-                            sample_index=i,
-                            phase="difficulty_increase",
-                            agent="system",
-                            action="rejection",
-                            output_content=problem_feedback,
-                            metadata={
-                                "student_loop": student_loop_count,
-                                "diff_attempt": diff_attempt + 1,
-                                "difficulty": difficulty
-                            }
-                        )
-
-                        feedback = f"PREVIOUS FEEDBACK:\n{feedback_str}\n\nNEW FEEDBACK:\n{problem_feedback_str}"
-                        # feedback = f"PREVIOUS FEEDBACK: {feedback}\n\nNEW FEEDBACK: {problem_feedback}"  # 다음 시도에 피드백 사용
-                
-                except Exception as e:
-                    # 로깅: 난이도 증가 오류
+                    # 로깅: 난이도 증가 거부
                     log_step(
                         task_id=task_id,
                         sample_index=i,
                         phase="difficulty_increase",
                         agent="system",
-                        action="error",
-                        output_content=str(e),
+                        action="rejection",
+                        output_content=problem_feedback,
                         metadata={
                             "student_loop": student_loop_count,
                             "diff_attempt": diff_attempt + 1,
-                            "error_type": type(e).__name__
+                            "difficulty": difficulty
                         }
                     )
 
-                    print(f"  🛑 Error in difficulty increase: {e}")
-                    
-
-            # 난이도 증가 실패 시 루프 종료, 현재 문제 채택
-            if new_sample is None:
-                print(f"  ⚠️ Failed to increase difficulty - accepting current problem")
-
-                # 로깅: 문제 채택 (난이도 증가 실패)
+                    feedback = f"PREVIOUS FEEDBACK:\n{feedback_str}\n\nNEW FEEDBACK:\n{problem_feedback_str}"
+                    # feedback = f"PREVIOUS FEEDBACK: {feedback}\n\nNEW FEEDBACK: {problem_feedback}"  # 다음 시도에 피드백 사용
+            
+            except (BudgetExceeded, SampleBudgetExceeded, SampleDeadlineExceeded):
+                raise
+            except Exception as e:
+                # 로깅: 난이도 증가 오류
                 log_step(
                     task_id=task_id,
                     sample_index=i,
                     phase="difficulty_increase",
                     agent="system",
-                    action="accept_problem",
-                    output_content=None,
+                    action="error",
+                    output_content=str(e),
                     metadata={
-                        "reason": "difficulty_increase_failed",
                         "student_loop": student_loop_count,
-                        "diff_attempts": max_diff_loops,
-                        "difficulty": current_sample["meta"]["difficulty_level"]
+                        "diff_attempt": diff_attempt + 1,
+                        "error_type": type(e).__name__
                     }
                 )
 
-                results.append(current_sample)
-                break
+                print(f"  🛑 Error in difficulty increase: {e}")
                 
-            # 새 문제로 계속 진행
-            current_sample = new_sample
-        
-        print(f"  ✅ Sample completed and accepted (difficulty: {current_sample['meta']['difficulty_level']})")
 
-        # 로깅: 샘플 완료
-        log_step(
-            task_id=task_id,
-            sample_index=i,
-            phase="completion",
-            agent="system",
-            action="complete",
-            output_content=None,
-            metadata={
-                "task_id": task_id,
-                "sample_id": current_sample.get("sample_id"),
-                "difficulty": current_sample["meta"]["difficulty_level"],
-                "fix_count": fix_count
-            }
-        )
+        # 난이도 증가 실패 시 루프 종료, 현재 문제 채택 (현재 난이도 목표가 찼으면 샘플 중단)
+        if new_sample is None and moved_level is not None:
+            print(f"  ⏹️ Failed to move sample out of filled difficulty {current_sample['meta']['difficulty_level']} - dropping sample")
+            log_step(
+                task_id=task_id,
+                sample_index=i,
+                phase="difficulty_increase",
+                agent="system",
+                action="quota_terminated",
+                metadata={
+                    "student_loop": student_loop_count,
+                    "difficulty": current_sample["meta"]["difficulty_level"],
+                    "target_difficulty": moved_level,
+                    "quota": quota.summary().get(task_id)
+                }
+            )
+            return
 
-        # 다음 문제 생성 전에 피드백 초기화
-        if hasattr(generate_agentic_examples, 'init_feedback'):
-            delattr(generate_agentic_examples, 'init_feedback')
+        if new_sample is None:
+            print(f"  ⚠️ Failed to increase difficulty - accepting current problem")
 
-    return results, raw, fixes, init_validation_logs, diff_validation_logs
+            # 로깅: 문제 채택 (난이도 증가 실패)
+            log_step(
+                task_id=task_id,
+                sample_index=i,
+                phase="difficulty_increase",
+                agent="system",
+                action="accept_problem",
+                output_content=None,
+                metadata={
+                    "reason": "difficulty_increase_failed",
+                    "student_loop": student_loop_count,
+                    "diff_attempts": max_diff_loops,
+                    "difficulty": current_sample["meta"]["difficulty_level"]
+                }
+            )
+
+            results.append(current_sample)
+            break
+            
+        # 새 문제로 계속 진행
+        current_sample = new_sample
+    
+    print(f"  ✅ Sample completed and accepted (difficulty: {current_sample['meta']['difficulty_level']})")
+    if quota is not None:
+        quota.record(task_id, current_sample["meta"]["difficulty_level"])
+
+    # 로깅: 샘플 완료
+    log_step(
+        task_id=task_id,
+        sample_index=i,
+        phase="completion",
+        agent="system",
+        action="complete",
+        output_content=None,
+        metadata={
+            "task_id": task_id,
+            "sample_id": current_sample.get("sample_id"),
+            "difficulty": current_sample["meta"]["difficulty_level"],
+            "fix_count": fix_count
+        }
+    )
 
 
 # -- Run from YAML config --
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", type=str, required=True, help="YAML config path")
+    parser.add_argument("--worker-index", type=int, default=0, help="This worker's index when splitting slots across workers")
+    parser.add_argument("--num-workers", type=int, default=1, help="Total number of workers sharing the generation plan")
+    parser.add_argument("--queue", type=str, default=None, help="SQLite work queue shared by workers (e.g. on a shared filesystem)")
+    parser.add_argument("--worker-id", type=str, default=None, help="Worker name in the work queue (default: hostname-pid)")
     args = parser.parse_args()
 
     with open(args.config, "r") as f:
@@ -806,30 +1319,128 @@ if __name__ == "__main__":
     max_init_loops = cfg.get("max_init_loops", 3)
     max_diff_loops = cfg.get("max_diff_loops", 5)
     max_student_loops = cfg.get("max_student_loops", 3)
+    fused_orchestrator = cfg.get("fused_orchestrator", False)
+    student_mode = cfg.get("student_mode", "free")
+    student_explanation_chars = cfg.get("student_explanation_chars", 200)
+    student_max_tokens = cfg.get("student_max_tokens", 150)
+    student_cascade = cfg.get("student_cascade", [])
+    plan_seed = cfg.get("plan_seed", 0)
+    run_id = cfg.get("run_id") or new_run_id()
+
+    # 난이도별 목표 비율 (비어 있으면 제한 없음). 이 프로세스가 맡은 슬롯 수 기준으로 개수 계산
+    difficulty_quota = cfg.get("difficulty_quota") or {}
+
+    # 실행 예산 (설정하지 않으면 task 순서대로 제한 없이 생성)
+    budget_cfg = cfg.get("budget") or {}
+    budget = None
+    if any(budget_cfg.get(key) is not None for key in ("max_tokens", "max_cost_usd", "deadline_minutes", "max_calls_per_sample")):
+        budget = RunBudget(
+            max_tokens=budget_cfg.get("max_tokens"),
+            max_cost=budget_cfg.get("max_cost_usd"),
+            deadline_minutes=budget_cfg.get("deadline_minutes"),
+            max_calls_per_sample=budget_cfg.get("max_calls_per_sample"),
+            prices=budget_cfg.get("model_prices")
+        )
+
+    # 여러 워커로 나눠 실행하면 워커별로 출력 파일을 분리
+    if args.queue and args.num_workers > 1:
+        parser.error("--queue and --num-workers are mutually exclusive")
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    if args.queue:
+        output_prefix = f"{output_prefix}_{worker_id}"
+    elif args.num_workers > 1:
+        output_prefix = f"{output_prefix}_w{args.worker_index}"
+
+    # 역할별 호출 제한 시간과 샘플 전체 마감 (초, null/0이면 제한 없음)
+    timeouts_cfg = cfg.get("timeouts") or {}
+    sample_timeout = timeouts_cfg.get("sample") or None
+    configure_key_pools(cfg.get("key_pools"), cooldown_seconds=cfg.get("key_cooldown_seconds", 30), max_wait_seconds=cfg.get("key_max_wait_seconds", 120))
+    hedge_policy = configure_hedging(**(cfg.get("hedging") or {}))
+    verdict_cache = configure_verdict_cache(**(cfg.get("verdict_cache") or {}))
+    # 재시도 후에도 실패하거나 circuit breaker가 열린 모델은 역할별 fallback 체인으로 대체
+    router = configure_routing(**(cfg.get("retry") or {}), **(cfg.get("circuit_breaker") or {}))
+    configure_llm(
+        stream_json=cfg.get("stream_json", False),
+        timeouts={role: timeouts_cfg.get(role) or None for role in ("teacher", "student", "orchestrator")},
+        fallbacks=cfg.get("fallbacks") or {}
+    )
 
     # 로그 초기화
     clear_logs()
 
     final, raw, fixes, init_logs, diff_logs = [], [], [], [], []
-    
-    for task in tasks:
-        f, r, x, i_logs, d_logs = generate_agentic_examples(
-            task_id=task,
-            n=samples_per_task,
-            teacher_model=teacher_model,
-            student_model=student_model,
-            orchestrator_model=orchestrator_model,
+    sample_kwargs = dict(
+        teacher_model=teacher_model,
+        student_model=student_model,
+        orchestrator_model=orchestrator_model,
+        max_init_loops=max_init_loops,
+        max_diff_loops=max_diff_loops,
+        max_student_loops=max_student_loops,
+        fused_orchestrator=fused_orchestrator,
+        student_mode=student_mode,
+        student_explanation_chars=student_explanation_chars,
+        student_max_tokens=student_max_tokens,
+        student_cascade=student_cascade
+    )
+    slot_indices = worker_slot_indices(samples_per_task, args.worker_index, args.num_workers)
+    stop_reason = None
+    quota = None
+    queue = WorkQueue(args.queue) if args.queue else None
+    if difficulty_quota:
+        # 작업 큐 모드: 전체 슬롯 기준 목표를 모든 워커가 큐의 채택 개수로 함께 채움
+        quota_slots = samples_per_task if queue else len(slot_indices)
+        quota = build_quota(tasks, quota_slots, difficulty_quota, cfg.get("difficulty_quota_overrides"), shared=queue.quota_accepted if queue else None)
+        sample_kwargs["quota"] = quota
+
+    if queue is not None:
+        # 작업 큐 모드: 슬롯을 다른 워커들과 나눠 처리하고, 결과는 work_queue.py collect로 합침
+        run_id = queue.setup(run_id, tasks, samples_per_task, {"plan_seed": plan_seed, "example_prob": example_prob, "factor_prob": factor_prob})
+        final, raw, fixes, init_logs, diff_logs = run_queue_worker(
+            queue,
+            worker_id,
+            tasks,
+            samples_per_task,
+            lease_seconds=cfg.get("queue_lease_seconds", 300),
+            max_attempts=cfg.get("queue_max_attempts", 3),
+            budget=budget,
+            plan_seed=plan_seed,
             example_prob=example_prob,
             factor_prob=factor_prob,
-            max_init_loops=max_init_loops,
-            max_diff_loops=max_diff_loops,
-            max_student_loops=max_student_loops
+            run_id=run_id,
+            sample_timeout=sample_timeout,
+            **sample_kwargs
         )
-        final += f
-        raw += r
-        fixes += x
-        init_logs += i_logs
-        diff_logs += d_logs
+    elif budget is not None:
+        final, raw, fixes, init_logs, diff_logs, stop_reason = generate_with_budget(
+            tasks,
+            samples_per_task,
+            budget,
+            slot_indices=slot_indices,
+            plan_seed=plan_seed,
+            example_prob=example_prob,
+            factor_prob=factor_prob,
+            run_id=run_id,
+            sample_timeout=sample_timeout,
+            **sample_kwargs
+        )
+    else:
+        for task in tasks:
+            f, r, x, i_logs, d_logs = generate_agentic_examples(
+                task_id=task,
+                n=samples_per_task,
+                example_prob=example_prob,
+                factor_prob=factor_prob,
+                plan_seed=plan_seed,
+                slot_indices=slot_indices,
+                run_id=run_id,
+                sample_timeout=sample_timeout,
+                **sample_kwargs
+            )
+            final += f
+            raw += r
+            fixes += x
+            init_logs += i_logs
+            diff_logs += d_logs
 
     def dump(filename, items):
         with open(filename, "w", encoding="utf-8") as f:
@@ -842,6 +1453,10 @@ if __name__ == "__main__":
     dump(f"{output_prefix}_init_validation_logs.jsonl", init_logs)
     dump(f"{output_prefix}_difficulty_validation_logs.jsonl", diff_logs)
 
+    if budget is not None:
+        with open(f"{output_prefix}_budget.json", "w", encoding="utf-8") as f:
+            json.dump({**budget.summary(), "stop_reason": stop_reason}, f, ensure_ascii=False, indent=2)
+
     # 전체 프로세스 로그 저장
     from utils import get_logs
     all_process_logs = get_logs()
@@ -893,6 +1508,36 @@ if __name__ == "__main__":
     print(f"Initial attempts: {len(raw)}")
     print(f"Required fixes: {len(fixes)}")
     print(f"Success rate: {len(final)/(len(tasks) * samples_per_task)*100:.1f}%")
+    if budget is not None:
+        usage = budget.summary()
+        print(f"Tokens used: {budget.tokens} (in: {usage['input_tokens']}, out: {usage['output_tokens']}), estimated cost: ${usage['estimated_cost_usd']:.2f}, elapsed: {usage['elapsed_minutes']} min")
+        if stop_reason:
+            print(f"⚠️ Stopped early: {stop_reason} - output contains completed samples only")
+    if quota is not None:
+        print("Difficulty quota (accepted/target):")
+        for task_id, levels in quota.summary().items():
+            print(f"  {task_id}: " + ", ".join(f"{level} {count}" for level, count in levels.items()))
+
+    # 학생 오답과 파싱 실패를 구분해서 집계
+    student_evals = [log for log in all_process_logs if log['agent'] == 'system' and log['action'] == 'evaluation']
+    parse_failures = sum(1 for log in all_process_logs if log['agent'] == 'student' and log['action'] == 'parse_failure')
+    wrong_answers = sum(1 for log in student_evals if not log['output']['is_correct']) - parse_failures
+    print(f"Student answers: {len(student_evals)} (wrong: {wrong_answers}, parse failures: {parse_failures})")
+    sample_timeouts = sum(1 for log in all_process_logs if log['action'] == 'sample_timeout')
+    print(f"Call timeouts: {dict(timeout_counts) or 0}, other call errors: {dict(error_counts) or 0}, samples dropped after timeout: {sample_timeouts}")
+    if late_usage_counts:
+        print(f"Abandoned calls that finished after their sample ended (not charged to the budget): {dict(late_usage_counts)}")
+    if hedge_policy is not None:
+        hedge_stats = hedge_policy.summary()
+        print(f"Hedged requests: {hedge_stats['hedges']}/{hedge_stats['calls']} calls (hedge finished first: {hedge_stats['hedge_wins']})")
+    if verdict_cache is not None:
+        cache_stats = verdict_cache.summary()
+        print(f"Orchestrator verdict cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses (hit rate {cache_stats['hit_rate']:.1%}, {cache_stats['entries']} stored)")
+    routing_stats = router.summary()
+    if routing_stats["fallbacks"] or routing_stats["open_circuits"]:
+        print(f"Fallback calls: {routing_stats['fallbacks'] or 0}, open circuits: {routing_stats['open_circuits'] or 'none'}")
+    print("API key usage:")
+    print_key_usage(key_pools)
     
     # Task별 통계
     task_stats = {}
@@ -1,8 +1,55 @@
 import json
+from functools import lru_cache
+
+
+# 템플릿 컴파일용 자리표시자. 실제 값은 렌더링 시 str.format으로 한 번에 채움
+_SLOTS = {name: f"\x00{name}\x00" for name in ("topic", "style", "factor", "example")}
+
+# id(example) -> (example, 직렬화된 JSON). TASKS의 예시는 고정 객체이므로 한 번만 직렬화
+_example_cache = {}
+
+
+def _serialize_example(example):
+    cached = _example_cache.get(id(example))
+    if cached is None or cached[0] is not example:
+        cached = (example, json.dumps(example, ensure_ascii=False, indent=2))
+        _example_cache[id(example)] = cached
+    return cached[1]
+
+
+@lru_cache(maxsize=None)
+def _compile_teacher_template(task_id, difficulty_level, has_factor, has_example):
+    """(task, 난이도, factor/예시 사용 여부)별 teacher 프롬프트 템플릿을 한 번만 생성
+
+    자리표시자를 넣어 원래의 조립 로직을 한 번 실행한 뒤, 정적 중괄호를 이스케이프하고
+    자리표시자를 format 필드로 바꿉니다. 따라서 렌더링 결과는 기존 프롬프트와 바이트 단위로 같습니다.
+    """
+    prompt = _assemble_teacher_prompt(
+        task_id,
+        _SLOTS["topic"],
+        _SLOTS["style"],
+        _SLOTS["factor"] if has_factor else None,
+        difficulty_level,
+        _SLOTS["example"] if has_example else None,
+    )
+    template = prompt.replace("{", "{{").replace("}", "}}")
+    for name, slot in _SLOTS.items():
+        template = template.replace(slot, "{" + name + "}")
+    return template
 
 
 def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, example=None):
-    
+    template = _compile_teacher_template(task_id, difficulty_level, bool(factor), bool(example))
+    return template.format(
+        topic=topic,
+        style=style,
+        factor=factor,
+        example=_serialize_example(example) if example else "",
+    )
+
+
+def _assemble_teacher_prompt(task_id, topic, style, factor, difficulty_level, example=None):
+    """teacher 프롬프트 원본 조립 로직 (example은 이미 직렬화된 예시 JSON 문자열)"""
     prompt = f"You are a {style}-style exam question generator. Create a question for task {task_id} on the topic of {topic}.\n"
 
     # Difficulty-based instruction
@@ -27,7 +74,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += f" {difficulty_desc}"
         
         if example:
-            prompt += f"\n\nHere is an example format to follow:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\n\nHere is an example format to follow:\n```json\n{example}\n```"
         
         prompt += f"\n\nReturn the result strictly in JSON format:\n{{\n  \"context\": [\"...\"],\n  \"anomaly_index\": <integer>,\n  \"meta\": {{\n    \"source\": \"{style}\",\n    \"topic\": \"{topic}\",\n    \"anomaly_type\": \"{factor if factor else 'none'}\"\n  }}\n}}"
 
@@ -43,7 +90,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += "   - The disruption should be detectable but not immediately obvious\n\n"
         
         if example:
-            prompt += f"\nExample format:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\nExample format:\n```json\n{example}\n```"
         
         prompt += "\n\nReturn ONLY ONE JSON with:\n{\n  \"context\": [list of 5 sentences],\n  \"is_coherent\": boolean (true if in logical order, false if shuffled)\n}"
 
@@ -56,7 +103,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += f"4. {difficulty_desc}\n"
         
         if example:
-            prompt += f"\nExample format:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\nExample format:\n```json\n{example}\n```"
         
         prompt += "\n\nReturn JSON with:\n{\n  \"sentence\": \"sentence with ___\",\n  \"choices\": [5 options],\n  \"anomaly_index\": index of the anomalous choice\n}"
 
@@ -70,7 +117,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += f"5. {difficulty_desc}\n"
         
         if example:
-            prompt += f"\nExample format:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\nExample format:\n```json\n{example}\n```"
         
         prompt += "\n\nReturn JSON with:\n{\n  \"paragraph_1\": [sentences],\n  \"paragraph_2\": [sentences],\n  \"bridges\": [5 bridge options],\n  \"anomaly_index\": index of the weak bridge\n}"
 
@@ -99,7 +146,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += f"10. {difficulty_desc}\n"
         
         if example:
-            prompt += f"\nExample format:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\nExample format:\n```json\n{example}\n```"
         
         prompt += "\n\nReturn JSON with:\n{\n  \"context\": [5 sentences],\n  \"anomaly_index\": index of the ambiguous sentence\n}"
 
@@ -112,7 +159,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += f"4. {difficulty_desc}\n"
         
         if example:
-            prompt += f"\nExample format:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\nExample format:\n```json\n{example}\n```"
         
         prompt += "\n\nReturn JSON with:\n{\n  \"context\": [5 statements],\n  \"anomaly_index\": index of the contradictory statement\n}"
 
@@ -125,7 +172,7 @@ def build_teacher_prompt(task_id, topic, style, factor, difficulty_level, exampl
         prompt += f"4. {difficulty_desc}\n"
         
         if example:
-            prompt += f"\nExample format:\n```json\n{json.dumps(example, ensure_ascii=False, indent=2)}\n```"
+            prompt += f"\nExample format:\n```json\n{example}\n```"
         
         prompt += "\n\nReturn JSON with:\n{\n  \"context\": [5 sentences],\n  \"anomaly_index\": index of the tone-violating sentence\n}"
 
@@ -0,0 +1,150 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from deadlines import LLMTimeoutError
+from key_pool import NoAvailableKeyError
+
+
+class CircuitOpenError(RuntimeError):
+    """fallback 체인의 모든 모델이 circuit breaker로 차단되어 호출할 모델이 없음"""
+
+
+class CircuitBreaker:
+    """모델 하나의 연속 실패를 세어 일정 횟수를 넘으면 reset_seconds 동안 호출을 막는 차단기
+
+    차단 시간이 지나면 half-open 상태가 되어 한 번의 시험 호출만 허용하고,
+    성공하면 다시 닫히고 실패하면 다시 reset_seconds 동안 차단합니다.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self):
+        """시험 호출이 성공/실패 판정 없이 끝났을 때(예산 소진 등) 상태는 그대로 두고 다음 시험 호출을 허용"""
+        with self._lock:
+            self._trial_running = False
+
+
+class FallbackRouter:
+    """역할별 fallback 체인을 따라 모델을 호출하는 라우터
+
+    체인의 모델마다 tenacity로 attempts번까지 (지수 backoff + jitter) 시도하고, 모두 실패하거나
+    그 모델의 circuit breaker가 열려 있으면 체인의 다음 모델로 넘어갑니다. 기본값 attempts=1은
+    재시도 없이 바로 fallback합니다. timeout(LLMTimeoutError)은 같은 모델로 다시 기다리지 않고,
+    pool에 쓸 수 있는 key가 없을 때(NoAvailableKeyError)와 같이 바로 다음 모델로 넘어갑니다.
+    fatal 예외(예산 소진, 샘플 마감 등)는 재시도나 fallback 없이 그대로 전달합니다.
+    """
+
+    def __init__(self, attempts: int = 1, wait_base: float = 1.0, wait_max: float = 20.0, failure_threshold: int = 5, reset_seconds: float = 60.0, fatal: Tuple[Type[BaseException], ...] = ()):
+        self.attempts = max(1, attempts)
+        self.wait_base = wait_base
+        self.wait_max = wait_max
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.fatal = fatal
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.fallback_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+            return self.breakers[model]
+
+    def _should_retry(self, e: BaseException) -> bool:
+        return not isinstance(e, self.fatal) and not isinstance(e, (NoAvailableKeyError, CircuitOpenError, LLMTimeoutError))
+
+    def _attempt(self, attempt: Callable[[str], Any], model: str, breaker: CircuitBreaker) -> Any:
+        # 재시도 도중 차단기가 열리면 남은 재시도를 건너뛰고 다음 모델로
+        if breaker.state == "open":
+            raise CircuitOpenError(f"circuit open for {model}")
+        try:
+            result = attempt(model)
+        except BaseException as e:
+            if isinstance(e, self.fatal):
+                # fatal 예외는 모델의 실패가 아니지만, half-open 시험 호출 표시는 풀어야 이후 호출이 막히지 않음
+                breaker.release_trial()
+            else:
+                breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    def run(self, chain: List[str], attempt: Callable[[str], Any]) -> Tuple[Any, str]:
+        """chain 순서대로 attempt(model)을 실행하고 (결과, 실제 사용한 모델)을 반환
+
+        모든 모델이 실패하면 마지막 오류를, 모두 차단되어 있으면 CircuitOpenError를 발생시킵니다.
+        """
+        last_error: Optional[BaseException] = None
+        for position, model in enumerate(chain):
+            breaker = self.breaker(model)
+            if not breaker.allow():
+                continue
+            retrying = Retrying(
+                stop=stop_after_attempt(self.attempts),
+                wait=wait_exponential_jitter(initial=self.wait_base, max=self.wait_max),
+                retry=retry_if_exception(self._should_retry),
+                reraise=True,
+            )
+            try:
+                result = retrying(self._attempt, attempt, model, breaker)
+            except self.fatal:
+                raise
+            except Exception as e:
+                last_error = e
+                if position + 1 < len(chain):
+                    print(f"↪️ {model} failed ({type(e).__name__}: {str(e)[:120]}), falling back to {chain[position + 1]}")
+                continue
+            if position > 0:
+                with self._lock:
+                    self.fallback_counts[model] = self.fallback_counts.get(model, 0) + 1
+            return result, model
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError(f"all models in fallback chain are unavailable: {chain}")
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "fallbacks": dict(self.fallback_counts),
+            "open_circuits": [model for model, breaker in self.breakers.items() if breaker.state != "closed"],
+        }
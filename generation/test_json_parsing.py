@@ -0,0 +1,9 @@
+# Runs the extract_json failure-case corpus (extract_json_cases.jsonl) as tests
+import pytest
+
+from bench_json_parsing import check_case, load_cases
+
+
+@pytest.mark.parametrize("case", load_cases(), ids=lambda case: case["id"])
+def test_extract_json_case(case):
+    assert check_case(case), case["description"]
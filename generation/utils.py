@@ -1,47 +1,219 @@
 
 import json
-import re
 from openai import OpenAI
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import datetime
 import copy
+import threading
+from collections import Counter
 from groq import Groq
+from json_parsing import read_until_json
+from json_parsing import extract_json as parse_json_text
+from budget import BudgetExceeded, SampleBudgetExceeded
+from deadlines import LLMTimeoutError, SampleDeadlineExceeded, call_with_timeout, effective_timeout, is_timeout_error
+from key_pool import KeyEntry, build_key_pool
+from hedging import HedgePolicy
+from routing import FallbackRouter
 
 groq_api_key = "Your_API_KEY"
-groq_client = Groq(api_key=groq_api_key)
-
-client = OpenAI(api_key="Your_API_KEY")
+openai_api_key = "Your_API_KEY"
 claude_api_key = "Your_API_KEY"
 gemini_api_key = "Your_API_KEY"
+grok_api_key = "ah-jik-ahn-ham-grok-api-key-here"  # xAI API 키
+
+# -- Provider별 API key pool (configure_key_pools로 여러 key/endpoint 등록) --
+def _make_openai_client(entry: KeyEntry):
+    return OpenAI(api_key=entry.api_key, organization=entry.organization, base_url=entry.base_url)
+
+def _make_claude_client(entry: KeyEntry):
+    import anthropic
+    kwargs = {"base_url": entry.base_url} if entry.base_url else {}
+    return anthropic.Anthropic(api_key=entry.api_key, **kwargs)
+
+def _make_grok_client(entry: KeyEntry):
+    return OpenAI(api_key=entry.api_key, base_url=entry.base_url or "https://api.x.ai/v1")  # xAI API 엔드포인트
+
+def _make_gemini_client(entry: KeyEntry):
+    from google import genai
+    from google.genai import types
+    kwargs = {"http_options": types.HttpOptions(base_url=entry.base_url)} if entry.base_url else {}
+    return genai.Client(api_key=entry.api_key, **kwargs)
+
+def _make_groq_client(entry: KeyEntry):
+    kwargs = {"base_url": entry.base_url} if entry.base_url else {}
+    return Groq(api_key=entry.api_key, **kwargs)
+
+_CLIENT_FACTORIES = {
+    "openai": _make_openai_client,
+    "claude": _make_claude_client,
+    "gemini": _make_gemini_client,
+    "grok": _make_grok_client,
+    "groq": _make_groq_client,
+}
+
+key_pools = {}
+
+def configure_key_pools(pools_cfg: Optional[Dict[str, Any]] = None, cooldown_seconds: float = 30.0, max_wait_seconds: float = 120.0):
+    """provider별 key pool 구성. pools_cfg에 없는 provider는 모듈의 기본 key 하나를 사용
+
+    pools_cfg 예: {"openai": [{"api_key": "...", "organization": "...", "weight": 2, "rpm": 500}, "sk-..."]}
+    """
+    pools_cfg = pools_cfg or {}
+    unknown = set(pools_cfg) - set(_CLIENT_FACTORIES)
+    if unknown:
+        raise ValueError(f"Unknown key pool providers: {sorted(unknown)}")
+    defaults = {"openai": openai_api_key, "claude": claude_api_key, "gemini": gemini_api_key, "grok": grok_api_key, "groq": groq_api_key}
+    for provider, make_client in _CLIENT_FACTORIES.items():
+        specs = pools_cfg.get(provider) or [{"api_key": defaults[provider]}]
+        key_pools[provider] = build_key_pool(provider, specs, make_client, cooldown_seconds=cooldown_seconds, max_wait_seconds=max_wait_seconds)
+
+configure_key_pools()
+
+# -- LLM 호출 설정 (configure_llm으로 변경) --
+llm_settings = {
+    # JSON을 반환하는 호출(stop_at_json=True)을 스트리밍하고 첫 JSON 객체가 완성되면 즉시 종료
+    "stream_json": False,
+    # 역할(teacher/student/orchestrator)별 호출 제한 시간(초). None이면 제한 없음
+    "timeouts": {"teacher": None, "student": None, "orchestrator": None},
+    # 역할별 fallback 모델 체인. 요청한 모델이 재시도 후에도 실패하거나 차단되면 순서대로 사용
+    "fallbacks": {},
+}
+
+def configure_llm(**settings):
+    """llm_call 동작 설정을 갱신 (예: configure_llm(stream_json=True))"""
+    unknown = set(settings) - set(llm_settings)
+    if unknown:
+        raise ValueError(f"Unknown LLM settings: {sorted(unknown)}")
+    llm_settings.update(settings)
+
+# -- 역할별 timeout / 오류 집계 --
+timeout_counts = Counter()   # role -> 제한 시간 초과 횟수
+error_counts = Counter()     # role -> timeout 외 호출 오류 횟수
+late_usage_counts = Counter()  # model -> 샘플이 끝난 뒤에 끝나서 예산에 보고하지 않은 호출 수
+
+# -- 토큰 사용량 집계 / 실행 예산 --
+usage_totals = {}      # model -> {"input_tokens", "output_tokens", "calls"}
+active_budget = None   # budget.RunBudget (set_budget으로 등록)
+
+def set_budget(budget):
+    """llm_call마다 확인하고 사용량을 보고할 RunBudget을 등록 (None이면 해제)"""
+    global active_budget
+    active_budget = budget
+
+def _estimate_tokens(text: str) -> int:
+    """사용량 정보가 없을 때(스트리밍 등)의 대략적인 토큰 수"""
+    return max(1, len(text or "") // 4)
+
+def _usage_scope():
+    """호출을 시작할 때의 (예산, 샘플 번호). 사용량은 이 예산에, 이 샘플이 끝나기 전에만 보고"""
+    budget = active_budget
+    return budget, (budget.sample_serial if budget is not None else None)
+
+def _record_usage(model: str, prompt: str, text: str, input_tokens: Optional[int] = None, output_tokens: Optional[int] = None, key: Optional[KeyEntry] = None):
+    """provider 호출 한 번의 토큰 사용량을 집계하고 호출을 시작한 예산/샘플과 사용한 key에 보고
+
+    timeout으로 버려진 호출이 나중에 끝나면, 그 사이 다음 샘플이나 다른 예산이 등록되어
+    있을 수 있으므로 호출 시작 때의 scope(llm_call이 설정)를 보고 이미 끝난 샘플의
+    사용량은 예산에 보고하지 않습니다. 단, hedge 경쟁에서 져서 취소된 요청은 실제로 비용을
+    쓴 것이므로 샘플이 끝났어도 실행 전체 예산에는 보고합니다.
+    """
+    if input_tokens is None:
+        input_tokens = _estimate_tokens(prompt)
+    if output_tokens is None:
+        output_tokens = _estimate_tokens(text)
+    totals = usage_totals.setdefault(model, {"input_tokens": 0, "output_tokens": 0, "calls": 0})
+    totals["input_tokens"] += input_tokens
+    totals["output_tokens"] += output_tokens
+    totals["calls"] += 1
+    if key is not None:
+        key.record_tokens(input_tokens + output_tokens)
+    budget, serial = getattr(_call_info, "usage_scope", None) or _usage_scope()
+    cancel = getattr(_call_info, "cancel", None)
+    if budget is not None and budget.sample_serial == serial:
+        budget.record(model, input_tokens, output_tokens)
+    elif budget is not None and cancel is not None and cancel.is_set():
+        budget.record(model, input_tokens, output_tokens, sample=False)
+    elif budget is not None:
+        late_usage_counts[model] += 1
 
 # -- Call LLM
-def gpt_call(prompt: str, model: str = "gpt-4o") -> str:
-    """OpenAI GPT 모델 호출 함수"""
+def gpt_call(prompt: str, model: str = "gpt-4o", max_tokens: Optional[int] = None, json_mode: bool = False, stream: bool = False, timeout: Optional[float] = None, key: Optional[KeyEntry] = None, cancel: Optional[threading.Event] = None) -> str:
+    """OpenAI GPT 모델 호출 함수 (key: 사용할 pool key, None이면 pool에서 선택)"""
+    key = key or key_pools["openai"].acquire()
     try:
-        res = client.chat.completions.create(
+        kwargs = {}
+        if max_tokens:
+            kwargs["max_tokens"] = max_tokens
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        if timeout:
+            kwargs["timeout"] = timeout
+
+        if stream:
+            res = key.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                stream=True,
+                **kwargs
+            )
+            text = read_until_json((c.choices[0].delta.content for c in res if c.choices), close=res.close, cancel=cancel).strip()
+            _record_usage(model, prompt, text, key=key)
+            return text
+
+        res = key.client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+            temperature=0.7,
+            **kwargs
         )
-        return res.choices[0].message.content.strip()
+        text = res.choices[0].message.content.strip()
+        usage = getattr(res, "usage", None)
+        _record_usage(model, prompt, text, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), key=key)
+        return text
     except Exception as e:
         print(f"GPT 호출 오류: {e}")
         raise
 
 # Claude 모델용 함수
-def claude_call(prompt: str, model: str = "claude-3-5-sonnet-20241022") -> str:
-    """Anthropic Claude 모델 호출 함수"""
+def claude_call(prompt: str, model: str = "claude-3-5-sonnet-20241022", max_tokens: Optional[int] = None, json_mode: bool = False, stream: bool = False, timeout: Optional[float] = None, key: Optional[KeyEntry] = None, cancel: Optional[threading.Event] = None) -> str:
+    """Anthropic Claude 모델 호출 함수 (key: 사용할 pool key, None이면 pool에서 선택)"""
+    key = key or key_pools["claude"].acquire()
     try:
-        import anthropic
-        claude_client = anthropic.Anthropic(api_key=claude_api_key)
+        claude_client = key.client
+
+        messages = [{"role": "user", "content": prompt}]
+        # Claude는 JSON 응답 모드가 없으므로 "{"로 응답을 시작하도록 prefill
+        if json_mode:
+            messages.append({"role": "assistant", "content": "{"})
+        kwargs = {"timeout": timeout} if timeout else {}
+
+        if stream:
+            # with 블록을 빠져나가면 스트림 연결이 닫힘
+            with claude_client.messages.stream(
+                model=model,
+                max_tokens=max_tokens or 4096,
+                messages=messages,
+                temperature=0.7,
+                **kwargs
+            ) as response:
+                text = read_until_json(response.text_stream, prefix="{" if json_mode else "", cancel=cancel)
+            _record_usage(model, prompt, text, key=key)
+            return text
         
         response = claude_client.messages.create(
             model=model,
-            max_tokens=4096,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+            max_tokens=max_tokens or 4096,
+            messages=messages,
+            temperature=0.7,
+            **kwargs
         )
-        return response.content[0].text
+        text = response.content[0].text
+        usage = getattr(response, "usage", None)
+        _record_usage(model, prompt, text, getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None), key=key)
+        if json_mode:
+            return "{" + text
+        return text
     except ImportError:
         print("Error: anthropic 패키지가 설치되지 않았습니다.")
         raise
@@ -50,128 +222,243 @@ def claude_call(prompt: str, model: str = "claude-3-5-sonnet-20241022") -> str:
         raise
 
 # Gemini 모델용 함수
-def gemini_call(prompt: str, model: str = "gemini-2.0-flash") -> str:
-    """Google Gemini 모델 호출 함수"""
+def gemini_call(prompt: str, model: str = "gemini-2.0-flash", max_tokens: Optional[int] = None, json_mode: bool = False, stream: bool = False, timeout: Optional[float] = None, key: Optional[KeyEntry] = None, cancel: Optional[threading.Event] = None) -> str:
+    """Google Gemini 모델 호출 함수 (key: 사용할 pool key, None이면 pool에서 선택)"""
+    key = key or key_pools["gemini"].acquire()
     try:
-        import google.generativeai as genai
-        genai.configure(api_key=gemini_api_key)
-        
-        gemini_model = genai.GenerativeModel(model)
-        response = gemini_model.generate_content(prompt, generation_config={"temperature": 0.7})
-        return response.text
+        from google.genai import types
+
+        # key마다 client가 따로 있으므로 전역 설정(genai.configure)이나 잠금 없이 동시에 호출 가능
+        config = types.GenerateContentConfig(
+            temperature=0.7,
+            max_output_tokens=max_tokens,
+            response_mime_type="application/json" if json_mode else None,
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None,  # 밀리초
+        )
+        if stream:
+            response = key.client.models.generate_content_stream(model=model, contents=prompt, config=config)
+            text = read_until_json((chunk.text for chunk in response), close=getattr(response, "close", None), cancel=cancel)
+        else:
+            response = key.client.models.generate_content(model=model, contents=prompt, config=config)
+            text = response.text
+
+        if stream:
+            _record_usage(model, prompt, text, key=key)
+            return text
+        usage = getattr(response, "usage_metadata", None)
+        _record_usage(model, prompt, text, getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None), key=key)
+        return text
     except ImportError:
-        print("Error: google-generativeai 패키지가 설치되지 않았습니다.")
+        print("Error: google-genai 패키지가 설치되지 않았습니다.")
         raise
     except Exception as e:
         print(f"Gemini 호출 오류: {e}")
         raise
 
 # Grok 모델용 함수
-def grok_call(prompt: str, model: str = "grok-3") -> str:
-    """xAI Grok 모델 호출 함수"""
+def grok_call(prompt: str, model: str = "grok-3", max_tokens: Optional[int] = None, json_mode: bool = False, stream: bool = False, timeout: Optional[float] = None, key: Optional[KeyEntry] = None, cancel: Optional[threading.Event] = None) -> str:
+    """xAI Grok 모델 호출 함수 (key: 사용할 pool key, None이면 pool에서 선택)"""
+    key = key or key_pools["grok"].acquire()
     try:
-        grok_client = OpenAI(
-            api_key="ah-jik-ahn-ham-grok-api-key-here",  # xAI API 키
-            base_url="https://api.x.ai/v1"     # xAI API 엔드포인트
-        )
+        grok_client = key.client
+
+        kwargs = {}
+        if max_tokens:
+            kwargs["max_tokens"] = max_tokens
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        if timeout:
+            kwargs["timeout"] = timeout
         
+        if stream:
+            response = grok_client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                stream=True,
+                **kwargs
+            )
+            text = read_until_json((c.choices[0].delta.content for c in response if c.choices), close=response.close, cancel=cancel).strip()
+            _record_usage(model, prompt, text, key=key)
+            return text
+
         response = grok_client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+            temperature=0.7,
+            **kwargs
         )
-        return response.choices[0].message.content.strip()
+        text = response.choices[0].message.content.strip()
+        usage = getattr(response, "usage", None)
+        _record_usage(model, prompt, text, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), key=key)
+        return text
     except Exception as e:
         print(f"Grok 호출 오류: {e}")
         raise
 
 # LLaMa 호출
-def groq_call(prompt: str, model: str = "llama-3.3-7b-versatile") -> str:
-    """Groq API LLaMa 모델 호출 함수"""
+def groq_call(prompt: str, model: str = "llama-3.3-7b-versatile", max_tokens: Optional[int] = None, json_mode: bool = False, stream: bool = False, timeout: Optional[float] = None, key: Optional[KeyEntry] = None, cancel: Optional[threading.Event] = None) -> str:
+    """Groq API LLaMa 모델 호출 함수 (key: 사용할 pool key, None이면 pool에서 선택)"""
+    key = key or key_pools["groq"].acquire()
     try:
-        response = groq_client.chat.completions.create(
+        kwargs = {}
+        if max_tokens:
+            kwargs["max_tokens"] = max_tokens
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        if timeout:
+            kwargs["timeout"] = timeout
+
+        if stream:
+            response = key.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                stream=True,
+                **kwargs
+            )
+            text = read_until_json((c.choices[0].delta.content for c in response if c.choices), close=getattr(response, "close", None), cancel=cancel).strip()
+            _record_usage(model, prompt, text, key=key)
+            return text
+
+        response = key.client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+            temperature=0.7,
+            **kwargs
         )
-        return response.choices[0].message.content.strip()
+        text = response.choices[0].message.content.strip()
+        usage = getattr(response, "usage", None)
+        _record_usage(model, prompt, text, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), key=key)
+        return text
     except Exception as e:
         print(f"Groq 호출 오류: {e}")
         raise
 
-# -- 통합 LLM 호출 함수 --
-def llm_call(prompt: str, model: str = "gpt-4o") -> str:
-    """다양한 LLM 모델 호출을 위한 통합 함수"""
+# -- Hedged requests (configure_hedging으로 활성화) --
+hedge_policy = None   # hedging.HedgePolicy
+
+def configure_hedging(enabled: bool = False, **policy) -> Optional[HedgePolicy]:
+    """느린 호출에 중복 요청을 보내는 hedge 정책 설정 (enabled=False면 해제)"""
+    global hedge_policy
+    hedge_policy = HedgePolicy(**policy) if enabled else None
+    return hedge_policy
+
+
+def _resolve_provider(model: str):
+    """모델 이름으로 (provider, provider 호출 함수) 결정"""
     if model.startswith("claude"):
-        return claude_call(prompt, model)
+        return "claude", claude_call
     elif model.startswith("gemini"):
-        return gemini_call(prompt, model)
+        return "gemini", gemini_call
     elif model.startswith("grok"):
-        return grok_call(prompt, model)
+        return "grok", grok_call
     elif model.startswith("llama"):
-        return groq_call(prompt, model)
+        return "groq", groq_call
     else:  # GPT 모델들
-        return gpt_call(prompt, model)
+        return "openai", gpt_call
+
+
+# -- 재시도 / circuit breaker / fallback 라우팅 (configure_routing으로 변경) --
+# 예산 소진과 샘플 마감은 다른 모델로 넘겨도 해결되지 않으므로 그대로 전달
+_FATAL_ERRORS = (BudgetExceeded, SampleBudgetExceeded, SampleDeadlineExceeded)
+router = FallbackRouter(fatal=_FATAL_ERRORS)
+
+def configure_routing(**settings) -> FallbackRouter:
+    """재시도 횟수/backoff와 circuit breaker 설정으로 라우터를 새로 구성
+
+    예: configure_routing(attempts=3, wait_base=1, wait_max=20, failure_threshold=5, reset_seconds=60)
+    """
+    global router
+    router = FallbackRouter(fatal=_FATAL_ERRORS, **settings)
+    return router
+
+# 스레드별 마지막 llm_call 정보 (log_step 메타데이터용)
+_call_info = threading.local()
+
+def last_model_used(default: Optional[str] = None) -> Optional[str]:
+    """현재 스레드에서 마지막으로 성공한 llm_call이 실제로 사용한 모델 (fallback/hedge 반영)"""
+    return getattr(_call_info, "model_used", None) or default
+
+
+# -- 통합 LLM 호출 함수 --
+def llm_call(prompt: str, model: str = "gpt-4o", max_tokens: Optional[int] = None, json_mode: bool = False, stop_at_json: bool = False, role: Optional[str] = None) -> str:
+    """다양한 LLM 모델 호출을 위한 통합 함수
+
+    Args:
+        max_tokens: 출력 토큰 상한 (None이면 provider 기본값)
+        json_mode: provider가 지원하면 JSON 응답 모드(response_format 등)를 사용
+        stop_at_json: JSON 객체를 반환하는 호출임을 표시. llm_settings["stream_json"]이
+            켜져 있으면 스트리밍으로 받다가 첫 최상위 JSON 객체가 완성되는 즉시 종료
+        role: 호출 역할 (teacher/student/orchestrator). llm_settings["timeouts"]의 제한 시간과
+            deadlines.sample_deadline으로 설정된 샘플 마감 중 빠른 쪽이 적용되고,
+            hedge 정책이 이 역할에 적용되면 느린 요청에 중복 요청을 보냄.
+            실패하면 router 설정대로 재시도한 뒤 llm_settings["fallbacks"][role]의 모델로 넘어가며,
+            실제 사용한 모델은 last_model_used()로 확인
+
+    Raises:
+        budget.BudgetExceeded / budget.SampleBudgetExceeded: 등록된 예산이 소진된 경우 (호출 전에 확인)
+        deadlines.LLMTimeoutError: 제한 시간 초과 (샘플 마감이면 SampleDeadlineExceeded)
+    """
+    _call_info.model_used = None
+    stream = stop_at_json and llm_settings["stream_json"]
+    scope = _usage_scope()
+
+    def invoke(target_model: str, timeout: Optional[float], cancel: Optional[threading.Event] = None) -> str:
+        # timeout/hedge 스레드에서 실행되므로 사용량을 보고할 scope(와 hedge 취소 이벤트)를 그 스레드에 넘김
+        previous_scope = getattr(_call_info, "usage_scope", None)
+        _call_info.usage_scope = scope
+        _call_info.cancel = cancel
+        try:
+            provider, provider_call = _resolve_provider(target_model)
+            # key 인증/한도 오류면 pool의 다른 key로 재시도
+            return key_pools[provider].call(
+                lambda key: provider_call(prompt, target_model, max_tokens=max_tokens, json_mode=json_mode, stream=stream, timeout=timeout, key=key, cancel=cancel)
+            )
+        finally:
+            _call_info.usage_scope = previous_scope
+            _call_info.cancel = None
+
+    role_key = role or "default"
+
+    def attempt(target_model: str):
+        # 재시도/fallback마다 예산과 남은 샘플 시간을 다시 확인
+        if active_budget is not None:
+            active_budget.check()
+        try:
+            timeout = effective_timeout(llm_settings["timeouts"].get(role))
+            if hedge_policy is not None and hedge_policy.applies_to(role):
+                text, used, _ = call_with_timeout(hedge_policy.call, timeout, target_model, lambda hedge_model, cancel: invoke(hedge_model, timeout, cancel))
+                return text, used
+            return call_with_timeout(invoke, timeout, target_model, timeout), target_model
+        except LLMTimeoutError:
+            timeout_counts[role_key] += 1
+            raise
+        except Exception as e:
+            # SDK 자체 timeout 예외도 timeout으로 집계
+            if is_timeout_error(e):
+                timeout_counts[role_key] += 1
+                raise LLMTimeoutError(f"{target_model} request timed out: {e}") from e
+            error_counts[role_key] += 1
+            raise
+
+    chain = [model] + [m for m in llm_settings["fallbacks"].get(role, []) if m != model]
+    (text, used), _ = router.run(chain, attempt)
+    _call_info.model_used = used
+    return text
 
 
 def extract_json(text: str) -> Dict[str, Any]:
     """
     문자열에서 JSON 객체를 추출하고 정리합니다.
-    1. 코드 블록 내의 JSON을 찾습니다.
-    2. 중괄호로 시작하고 끝나는 완전한 JSON 객체를 찾습니다.
-    3. 제어 문자를 제거하고 JSON을 정리합니다.
+    json_parsing.extract_json의 단일 패스 스캐너로 코드 블록, 문자열/이스케이프,
+    제어 문자, trailing comma, 작은따옴표, 잘린 배열 등을 처리합니다.
     """
     try:
-        # 코드 블록 내의 JSON 찾기
-        match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text, re.DOTALL)
-        if match:
-            json_str = match.group(1).strip()
-            # 제어 문자 처리
-            json_str = re.sub(r'[\x00-\x1F\x7F]', ' ', json_str)
-            return json.loads(json_str)
-        
-        # 첫 번째 완전한 JSON 객체 찾기
-        start = text.find('{')
-        if start >= 0:
-            brace_count = 0
-            for i in range(start, len(text)):
-                if text[i] == '{':
-                    brace_count += 1
-                elif text[i] == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        # 완전한 JSON 객체를 찾음
-                        json_str = text[start:i+1]
-                        # 제어 문자 처리
-                        json_str = re.sub(r'[\x00-\x1F\x7F]', ' ', json_str)
-                        return json.loads(json_str)
-        
-        # 마지막 시도: 전체 텍스트를 JSON으로 파싱
-        # 제어 문자 처리
-        clean_text = re.sub(r'[\x00-\x1F\x7F]', ' ', text)
-        return json.loads(clean_text)
-
+        return parse_json_text(text)
     except (json.JSONDecodeError, TypeError) as e:
         print(f"🛑 JSON parsing error: {e}")
-        print(f"🧪 Raw text (first 500 chars):\n{text[:500]}")
-        
-        # 특별 케이스: JSON 파싱 실패 시 추가 시도
-        try:
-            # 문자열 불필요 문자 정리 시도
-            if isinstance(text, str):
-                # 제어 문자 모두 제거
-                clean_text = re.sub(r'[\x00-\x1F\x7F]', ' ', text)
-                # 따옴표 이스케이프 확인
-                clean_text = clean_text.replace('\\"', '"').replace('\\\'', '\'')
-                
-                # JSON 형식 찾기 시도
-                match = re.search(r'(\{.*\})', clean_text, re.DOTALL)
-                if match:
-                    potential_json = match.group(1)
-                    return json.loads(potential_json)
-        except:
-            pass
-        
+        print(f"🧪 Raw text (first 500 chars):\n{str(text)[:500]}")
         raise
 
 # -- Round-robin generator for topics/styles --
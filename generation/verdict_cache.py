@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def canonical_key(namespace: str, task_id: str, kind: str, problem_text: str, difficulty: Optional[str] = None, is_final_attempt: bool = False) -> str:
+    """검증 대상 문제의 정규화된 해시 키
+
+    problem_text는 검증 프롬프트에 들어가는 문제 부분(_format_problem 결과)으로, 공백을 정규화해서
+    줄바꿈/들여쓰기만 다른 문제는 같은 키가 됩니다. namespace에는 orchestrator 모델과 프롬프트 버전이 들어갑니다.
+    """
+    normalized = _WHITESPACE.sub(" ", problem_text).strip()
+    payload = json.dumps([namespace, task_id, kind, difficulty, is_final_attempt, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """orchestrator 검증 결과(approved, feedback 등) 캐시
+
+    path를 지정하면 JSONL 파일에 이어 쓰고 시작할 때 다시 읽어서, 재시작한 실행이나 다른 워커가
+    이미 판정한 문제를 다시 검증하지 않습니다. ttl_seconds보다 오래된 항목은 사용하지 않습니다.
+    모델/프롬프트 버전은 키에 포함되므로 바뀌면 이전 항목은 자연히 적중하지 않습니다.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 중단된 쓰기로 잘린 줄
+                if not self._expired(entry):
+                    self.entries[entry["key"]] = entry
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl_seconds is not None and time.time() - entry["created_at"] > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """저장된 판정. 없거나 만료되었으면 None"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["verdict"]
+
+    def put(self, key: str, verdict: Dict[str, Any], namespace: Optional[str] = None):
+        entry = {"key": key, "namespace": namespace, "created_at": time.time(), "verdict": verdict}
+        with self._lock:
+            self.entries[key] = entry
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def summary(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 큐 결과를 모아 쓸 출력 파일 (generator의 출력 파일명과 동일)
+OUTPUT_KINDS = ("final", "raw", "fixes", "init_validation_logs", "difficulty_validation_logs")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    task_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending | claimed | done | failed
+    worker_id TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (task_id, slot)
+);
+CREATE TABLE IF NOT EXISTS results (
+    task_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    worker_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (task_id, slot)
+);
+CREATE TABLE IF NOT EXISTS quota (
+    task_id TEXT NOT NULL,
+    level TEXT NOT NULL,
+    accepted INTEGER NOT NULL DEFAULT 0,      -- 완료된 작업의 final 샘플 수 (난이도별)
+    PRIMARY KEY (task_id, level)
+);
+"""
+
+
+class WorkQueue:
+    """여러 머신의 generator 워커가 (task, slot) 작업을 나눠 가지는 SQLite 작업 큐
+
+    공유 파일시스템에 DB 파일 하나를 두고 사용합니다. 워커는 claim()으로 lease를 잡고,
+    생성 중에는 heartbeat()로 lease를 연장하며, 끝나면 complete()로 결과를 기록합니다.
+    lease가 만료된 작업(워커가 죽은 경우)은 다음 claim()에서 다시 pending으로 돌아가고,
+    시도 횟수를 다 썼으면 failed가 됩니다.
+    NFS 등에서는 WAL 모드가 동작하지 않으므로 기본 rollback journal을 사용합니다.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 스레드(heartbeat)마다 별도 연결을 쓰도록 호출할 때마다 새로 연결
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, conn: sqlite3.Connection):
+        # 쓰기 잠금을 먼저 잡아서 여러 워커의 claim이 같은 작업을 가져가지 않도록 함
+        conn.execute("BEGIN IMMEDIATE")
+
+    def setup(self, run_id: str, tasks: List[str], n: int, plan: Dict[str, Any]) -> str:
+        """큐를 초기화하고 실행 id를 반환. 이미 초기화된 큐면 저장된 run_id를 그대로 사용
+
+        plan에는 생성 계획을 결정하는 설정(plan_seed 등)을 넣으며, 기존 큐와 다르면
+        워커들이 서로 다른 슬롯 내용을 만들게 되므로 ValueError를 발생시킵니다.
+        """
+        settings = {"tasks": list(tasks), "samples_per_task": n, **plan}
+        conn = self._connect()
+        try:
+            self._transaction(conn)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'run_id'").fetchone()
+            if row is not None:
+                stored = json.loads(conn.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()["value"])
+                conn.execute("COMMIT")
+                if stored != settings:
+                    raise ValueError(f"Queue {self.path} was created with different settings: {stored} != {settings}")
+                return row["value"]
+
+            conn.execute("INSERT INTO meta (key, value) VALUES ('run_id', ?)", (run_id,))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('settings', ?)", (json.dumps(settings, sort_keys=True),))
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (task_id, slot, updated_at) VALUES (?, ?, ?)",
+                [(task_id, slot, time.time()) for task_id in tasks for slot in range(n)]
+            )
+            conn.execute("COMMIT")
+            return run_id
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, worker_id: str, lease_seconds: float, max_attempts: Optional[int] = None) -> Optional[Tuple[str, int, int]]:
+        """pending 작업 하나를 lease와 함께 가져옴 (task_id, slot, attempts). 없으면 None
+
+        먼저 lease가 만료된 claimed 작업을 pending으로 되돌립니다. 워커가 계속 죽는 작업이
+        끝없이 재시도되지 않도록, max_attempts를 다 쓴 작업은 release()처럼 failed로 표시합니다.
+        여러 task가 골고루 진행되도록 시도 횟수가 적은 작업, 그 다음 slot 번호가 작은 작업부터 가져갑니다.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            self._transaction(conn)
+            conn.execute(
+                "UPDATE items SET "
+                "status = CASE WHEN ? IS NOT NULL AND attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = CASE WHEN ? IS NOT NULL AND attempts >= ? THEN 'lease expired' ELSE error END, "
+                "worker_id = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE status = 'claimed' AND lease_until < ?",
+                (max_attempts, max_attempts, max_attempts, max_attempts, now, now)
+            )
+            row = conn.execute(
+                "SELECT task_id, slot, attempts FROM items WHERE status = 'pending' "
+                "ORDER BY attempts, slot, task_id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE items SET status = 'claimed', worker_id = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE task_id = ? AND slot = ?",
+                (worker_id, now + lease_seconds, now, row["task_id"], row["slot"])
+            )
+            conn.execute("COMMIT")
+            return row["task_id"], row["slot"], row["attempts"] + 1
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, worker_id: str, task_id: str, slot: int, lease_seconds: float) -> bool:
+        """lease 연장. 이미 다른 워커에게 넘어간 작업이면 False"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE items SET lease_until = ?, updated_at = ? "
+                "WHERE task_id = ? AND slot = ? AND worker_id = ? AND status = 'claimed'",
+                (now + lease_seconds, now, task_id, slot, worker_id)
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, worker_id: str, task_id: str, slot: int, outputs: Dict[str, List[Dict]]) -> bool:
+        """작업 결과를 기록하고 done으로 표시. lease를 잃은 작업이면 기록하지 않고 False
+
+        final 샘플의 난이도별 개수도 같은 트랜잭션에서 quota 테이블에 더합니다 (quota_accepted 참고).
+        """
+        conn = self._connect()
+        try:
+            self._transaction(conn)
+            row = conn.execute(
+                "SELECT worker_id, status FROM items WHERE task_id = ? AND slot = ?",
+                (task_id, slot)
+            ).fetchone()
+            if row is None or row["worker_id"] != worker_id or row["status"] != "claimed":
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO results (task_id, slot, worker_id, payload) VALUES (?, ?, ?, ?)",
+                (task_id, slot, worker_id, json.dumps(outputs, ensure_ascii=False))
+            )
+            for sample in outputs.get("final", []):
+                conn.execute(
+                    "INSERT INTO quota (task_id, level, accepted) VALUES (?, ?, 1) "
+                    "ON CONFLICT (task_id, level) DO UPDATE SET accepted = accepted + 1",
+                    (task_id, sample["meta"]["difficulty_level"])
+                )
+            conn.execute(
+                "UPDATE items SET status = 'done', lease_until = NULL, updated_at = ? WHERE task_id = ? AND slot = ?",
+                (time.time(), task_id, slot)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, worker_id: str, task_id: str, slot: int, error: Optional[str] = None, max_attempts: Optional[int] = None):
+        """작업을 pending으로 되돌림. max_attempts를 다 쓴 작업은 failed로 표시"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE items SET "
+                "status = CASE WHEN ? IS NOT NULL AND attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker_id = NULL, lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE task_id = ? AND slot = ? AND worker_id = ? AND status = 'claimed'",
+                (max_attempts, max_attempts, error, time.time(), task_id, slot, worker_id)
+            )
+        finally:
+            conn.close()
+
+    def quota_accepted(self, task_id: str) -> Dict[str, int]:
+        """task의 난이도별 완료된 final 샘플 수 (모든 워커 합계)"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT level, accepted FROM quota WHERE task_id = ?", (task_id,)).fetchall()
+            return {row["level"]: row["accepted"] for row in rows}
+        finally:
+            conn.close()
+
+    def counts(self) -> Dict[str, int]:
+        """상태별 작업 수"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM items GROUP BY status").fetchall()
+            return {row["status"]: row["count"] for row in rows}
+        finally:
+            conn.close()
+
+    def collect(self) -> Dict[str, List[Dict]]:
+        """완료된 작업의 결과를 (task_id, slot) 순서로 합침"""
+        merged = {kind: [] for kind in OUTPUT_KINDS}
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT payload FROM results ORDER BY task_id, slot").fetchall()
+        finally:
+            conn.close()
+        for row in rows:
+            payload = json.loads(row["payload"])
+            for kind in OUTPUT_KINDS:
+                merged[kind].extend(payload.get(kind, []))
+        return merged
+
+
+class LeaseKeeper:
+    """작업을 처리하는 동안 백그라운드 스레드에서 주기적으로 heartbeat를 보내는 컨텍스트 매니저"""
+
+    def __init__(self, queue: WorkQueue, worker_id: str, task_id: str, slot: int, lease_seconds: float):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.task_id = task_id
+        self.slot = slot
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.worker_id, self.task_id, self.slot, self.lease_seconds):
+                    self.lost = True
+                    return
+            except sqlite3.Error as e:
+                # 일시적인 잠금/파일시스템 오류는 다음 주기에 재시도
+                print(f"⚠️ Heartbeat failed for {self.task_id}/{self.slot}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def write_outputs(output_prefix: str, outputs: Dict[str, List[Dict]]):
+    """collect() 결과를 generator와 같은 이름의 JSONL 파일로 저장"""
+    for kind in OUTPUT_KINDS:
+        with open(f"{output_prefix}_{kind}.jsonl", "w", encoding="utf-8") as f:
+            for x in outputs[kind]:
+                f.write(json.dumps(x, ensure_ascii=False) + "\n")
+
+
+# -- Collector / status CLI --
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a generation work queue or collect its results")
+    parser.add_argument("command", choices=["status", "collect"])
+    parser.add_argument("--queue", type=str, required=True, help="SQLite queue path")
+    parser.add_argument("--output-prefix", type=str, default="agentic", help="Output prefix for collect")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queue):
+        parser.error(f"queue not found: {args.queue}")
+    queue = WorkQueue(args.queue)
+    counts = queue.counts()
+    print(f"Queue {args.queue}: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())))
+
+    if args.command == "collect":
+        outputs = queue.collect()
+        write_outputs(args.output_prefix, outputs)
+        print(f"Collected {len(outputs['final'])} final samples into {args.output_prefix}_*.jsonl")
+        if counts.get("pending") or counts.get("claimed"):
+            print(f"⚠️ {counts.get('pending', 0) + counts.get('claimed', 0)} items are still pending or in progress")